@@ -0,0 +1,110 @@
+import os
+import random
+from typing import Dict, List
+
+import pandas as pd
+
+# Benchmark sizes: pages of the synthetic site, CSV rows, requests per concurrency level
+SIZES = {
+    "small": {"pages": 20, "rows": 10_000, "requests": 100},
+    "medium": {"pages": 100, "rows": 100_000, "requests": 500},
+    "large": {"pages": 500, "rows": 1_000_000, "requests": 2000},
+}
+
+_PRODUCTS = ["pump", "valve", "sensor", "bracket", "cable", "switch", "filter", "motor", "gasket", "relay"]
+_ATTRIBUTES = ["stainless", "compact", "industrial", "heavy duty", "low voltage", "waterproof", "modular", "spare"]
+_WORDS = ("installation maintenance warranty delivery voltage pressure temperature housing mounting "
+          "replacement certified compatible supplier catalogue torque flow rating tolerance").split()
+
+
+def _sentence(rng: random.Random, words: int = 14) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_site(pages: int, seed: int = 0) -> Dict[str, str]:
+    """
+    A synthetic site of `pages` HTML pages ({path: html}) reachable from "/".
+    Pages have nested headings, paragraphs, lists and a table, like product
+    documentation, and link to their neighbours and a few random pages.
+    """
+    rng = random.Random(seed)
+    paths = ["/"] + [f"/docs/page-{i}" for i in range(1, pages)]
+    site = {}
+    for i, path in enumerate(paths):
+        product = f"{rng.choice(_ATTRIBUTES)} {rng.choice(_PRODUCTS)}"
+        links = {paths[(i + 1) % pages], paths[(i * 7 + 3) % pages]} | {rng.choice(paths) for _ in range(3)}
+        sections = []
+        for s in range(rng.randint(2, 5)):
+            paragraphs = "".join(f"<p>{' '.join(_sentence(rng) for _ in range(rng.randint(2, 6)))}</p>"
+                                 for _ in range(rng.randint(1, 4)))
+            items = "".join(f"<li>{_sentence(rng, 6)}</li>" for _ in range(rng.randint(0, 5)))
+            section = f"<h2>{product.title()} section {s + 1}</h2>{paragraphs}"
+            if items:
+                section += f"<h3>Details</h3><ul>{items}</ul>"
+            sections.append(section)
+        rows = "".join(f"<tr><td>{rng.choice(_WORDS)}</td><td>{rng.randint(1, 999)}</td></tr>" for _ in range(5))
+        nav = "".join(f'<a href="{link}">{link}</a> ' for link in sorted(links))
+        site[path] = (f"<html><head><title>{product.title()}</title></head><body>"
+                      f"<nav>{nav}</nav><main><h1>{product.title()} {i}</h1>{''.join(sections)}"
+                      f"<table><tr><th>Property</th><th>Value</th></tr>{rows}</table></main>"
+                      f"<footer>Copyright</footer></body></html>")
+    return site
+
+
+def product_rows(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Product-code rows in the ingest CSV layout; about 1% are exact duplicates and 1% are incomplete."""
+    rng = random.Random(seed)
+    data = []
+    for i in range(rows):
+        product = rng.choice(_PRODUCTS)
+        description = f"{rng.choice(_ATTRIBUTES)} {product} {rng.randint(10, 999)} {rng.choice(_WORDS)}"
+        data.append((f"EXT-{i:07d}", description, f"INT-{_PRODUCTS.index(product)}{rng.randint(0, 99):02d}"))
+        if rng.random() < 0.01:
+            data.append(data[-1])
+        if rng.random() < 0.01:
+            data.append((f"EXT-{i:07d}-X", None, "INT-000"))
+    return pd.DataFrame(data[:rows], columns=["external code", "description", "internal code"])
+
+
+def write_product_csvs(directory: str, rows: int, files: int = 4, seed: int = 0) -> List[str]:
+    """Writes `rows` product rows split over `files` semicolon-separated CSVs, returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    frame = product_rows(rows, seed)
+    paths = []
+    per_file = -(-len(frame) // files)
+    for f in range(files):
+        path = os.path.join(directory, f"products-{f}.csv")
+        frame.iloc[f * per_file:(f + 1) * per_file].to_csv(path, sep=";", index=False)
+        paths.append(path)
+    return paths
+
+
+def questions(n: int, seed: int = 0) -> List[str]:
+    """Distinct questions about the synthetic site's products, so answers aren't all cache hits."""
+    rng = random.Random(seed)
+    asked = set()
+    while len(asked) < n:
+        asked.add(f"What is the {rng.choice(_WORDS)} of the {rng.choice(_ATTRIBUTES)} {rng.choice(_PRODUCTS)} "
+                  f"model {rng.randint(1, 10 ** 6)}?")
+    return sorted(asked)
+
+
+def product_queries(n: int, seed: int = 1) -> List[Dict[str, str]]:
+    """/query payloads resembling, but not copying, the ingested rows."""
+    rng = random.Random(seed)
+    return [{"external_code": f"X{rng.randint(0, 10 ** 6)}",
+             "description": f"{rng.choice(_ATTRIBUTES)} {rng.choice(_PRODUCTS)} {rng.randint(10, 999)}"}
+            for _ in range(n)]
+
+
+def labelled_queries(rows: int, n: int, seed: int = 2) -> List[Dict[str, str]]:
+    """
+    /query payloads for n of the rows product_rows(rows) ingests, under new
+    external codes so the exact match misses, each with the row's internal
+    code as "expected".
+    """
+    frame = product_rows(rows).dropna()
+    rng = random.Random(seed)
+    return [{"external_code": f"X{rng.randint(0, 10 ** 6)}", "description": frame["description"].iloc[i],
+             "expected": frame["internal code"].iloc[i]}
+            for i in rng.sample(range(len(frame)), min(n, len(frame)))]
@@ -0,0 +1,298 @@
+import re
+import json
+import time
+import zlib
+import base64
+import socket
+import struct
+import asyncio
+import hashlib
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class Latency:
+    """Simulated service time: base_ms per call plus per_item_ms per token, text or row."""
+    base_ms: float = 0.0
+    per_item_ms: float = 0.0
+
+    def seconds(self, items: int = 0) -> float:
+        return (self.base_ms + self.per_item_ms * items) / 1000
+
+    async def wait(self, items: int = 0):
+        if self.base_ms or self.per_item_ms:
+            await asyncio.sleep(self.seconds(items))
+
+
+def hash_embedding(text: str, dim: int) -> np.ndarray:
+    """
+    Deterministic bag-of-words embedding: each word adds a fixed random
+    direction, so texts sharing words are close. Unit length, float32.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        vector += _word_vector(word, dim)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return vector / norm
+
+
+@lru_cache(maxsize=100_000)
+def _word_vector(word: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+class HashEmbedder:
+    """Drop-in for util_.embed.Embedder (encode() and dim) that needs no model download."""
+    def __init__(self, dim: int = 384, latency: Latency = Latency()):
+        self.model_name = f"hash-{dim}"
+        self.dim = dim
+        self.latency = latency
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if self.latency.base_ms or self.latency.per_item_ms:
+            time.sleep(self.latency.seconds(len(texts)))
+        return np.stack([hash_embedding(t, self.dim) for t in texts]) if texts else np.zeros((0, self.dim), np.float32)
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+_VOCABULARY = ("the product ships with a two year warranty and supports standard mounting "
+               "customers can order spare parts online delivery takes three to five business days").split()
+
+
+def fake_answer(prompt: str, tokens: int) -> List[str]:
+    """A deterministic answer of `tokens` word tokens, with a sentence break every 12 words."""
+    seed = _digest(prompt)
+    words = []
+    for i in range(tokens):
+        word = _VOCABULARY[(seed + i * 7) % len(_VOCABULARY)]
+        end = i == tokens - 1 or i % 12 == 11
+        words.append(("" if i == 0 else " ") + word + ("." if end else ""))
+    return words
+
+
+def _chat_prompt(body: Dict[str, Any]) -> str:
+    parts = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+def fake_openai_app(chat: Latency, embeddings: Latency, audio: Latency, answer_tokens: int = 60,
+                    embedding_dim: int = 1536) -> FastAPI:
+    """
+    The subset of the OpenAI API the backend uses: chat completions (plain
+    and streamed, with usage and logprobs), embeddings (float or base64,
+    text or token-ID input), transcriptions and speech. chat latency is time
+    to first token plus a per-token delay.
+    """
+    app = FastAPI()
+    calls = {"chat": 0, "embeddings": 0, "embedded_texts": 0, "audio": 0}
+    app.state.calls = calls
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        calls["chat"] += 1
+        prompt = _chat_prompt(body)
+        tokens = fake_answer(prompt, min(answer_tokens, body.get("max_tokens") or answer_tokens))
+        model = body.get("model", "gpt-4")
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens),
+                 "total_tokens": len(prompt.split()) + len(tokens)}
+        created = int(time.time())
+        if not body.get("stream"):
+            await chat.wait(len(tokens))
+            choice = {"index": 0, "finish_reason": "stop",
+                      "message": {"role": "assistant", "content": "".join(tokens)}}
+            if body.get("logprobs"):
+                choice["logprobs"] = {"content": [{"token": t, "logprob": -0.05, "bytes": None, "top_logprobs": []}
+                                                  for t in tokens]}
+            return {"id": "chatcmpl-bench", "object": "chat.completion", "created": created, "model": model,
+                    "choices": [choice], "usage": usage}
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def stream():
+            await chat.wait()
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(chat.per_item_ms / 1000)
+                delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+                yield _chunk(created, model, [{"index": 0, "delta": delta, "finish_reason": None}])
+            yield _chunk(created, model, [{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield _chunk(created, model, [], usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def create_embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        # langchain sends token IDs; the same text always maps to the same IDs
+        texts = [text if isinstance(text, str) else " ".join(f"t{token}" for token in text) for text in inputs]
+        calls["embeddings"] += 1
+        calls["embedded_texts"] += len(texts)
+        await embeddings.wait(len(texts))
+        dim = body.get("dimensions") or embedding_dim
+        data = []
+        for i, text in enumerate(texts):
+            vector = hash_embedding(text, dim)
+            if body.get("encoding_format") == "base64":
+                encoded: Any = base64.b64encode(vector.astype("<f4").tobytes()).decode()
+            else:
+                encoded = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": encoded})
+        tokens = sum(len(t.split()) for t in texts)
+        return {"object": "list", "data": data, "model": body.get("model", ""),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions():
+        calls["audio"] += 1
+        await audio.wait()
+        return {"text": "What does the warranty cover?"}
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        body = await request.json()
+        calls["audio"] += 1
+        await audio.wait(len(body.get("input", "")))
+        # 24 kHz 16-bit mono silence, about 60 ms of audio per word
+        return Response(content=b"\x00\x00" * 1440 * len(body.get("input", "").split()), media_type="audio/pcm")
+
+    return app
+
+
+def _chunk(created: int, model: str, choices: list, usage: dict = None) -> str:
+    chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": created, "model": model,
+             "choices": choices}
+    if usage is not None:
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def tiny_png(seed: str, size: int = 8) -> bytes:
+    """A valid size x size RGB PNG whose color depends on seed."""
+    color = hashlib.sha256(seed.encode("utf-8")).digest()[:3]
+    raw = b"".join(b"\x00" + color * size for _ in range(size))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def fake_hf_app(latency: Latency) -> FastAPI:
+    """Hugging Face serverless inference for text-to-image: a small PNG per prompt after `latency`."""
+    app = FastAPI()
+    app.state.calls = {"images": 0}
+
+    @app.post("/models/{model:path}")
+    async def generate(model: str, request: Request):
+        body = await request.json()
+        app.state.calls["images"] += 1
+        await latency.wait()
+        return Response(content=tiny_png(f"{model}\n{body.get('inputs', '')}"), media_type="image/png")
+
+    return app
+
+
+def site_app(pages: Dict[str, str], latency: Latency) -> FastAPI:
+    """Serves a synthetic site from {path: html} with ETags, so re-crawls get 304s."""
+    app = FastAPI()
+    etags = {path: f'"{hashlib.sha256(html.encode("utf-8")).hexdigest()[:16]}"' for path, html in pages.items()}
+    app.state.calls = {"pages": 0}
+
+    @app.get("/{path:path}")
+    async def page(path: str, request: Request):
+        path = "/" + path
+        app.state.calls["pages"] += 1
+        await latency.wait()
+        if path not in pages:
+            return Response(status_code=404)
+        if request.headers.get("if-none-match") == etags[path]:
+            return Response(status_code=304, headers={"ETag": etags[path]})
+        return Response(content=pages[path], media_type="text/html", headers={"ETag": etags[path]})
+
+    return app
+
+
+class LocalServer:
+    """Runs an ASGI app with uvicorn on a free localhost port in a background thread."""
+    def __init__(self, app):
+        self.app = app
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self.port = self._socket.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(app, log_level="warning", lifespan="off", timeout_keep_alive=30)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+
+    def __enter__(self) -> "LocalServer":
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("Local benchmark server failed to start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+        self._socket.close()
+
+
+class LatencyProxy:
+    """
+    Wraps a client so every method call first sleeps `latency`, standing in
+    for a network round trip. Calls into the wrapped client are serialised
+    because Qdrant's in-process local mode isn't meant for concurrent use.
+    """
+    def __init__(self, client, latency: Latency):
+        self._client = client
+        self._latency = latency
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            if self._latency.base_ms:
+                time.sleep(self._latency.seconds())
+            with self._lock:
+                return attr(*args, **kwargs)
+        return call
+
+
+def fake_qdrant(latency: Latency):
+    """Qdrant's in-process local mode (same client API, no server) behind a simulated round trip."""
+    from qdrant_client import QdrantClient
+    return LatencyProxy(QdrantClient(location=":memory:"), latency)
@@ -0,0 +1,230 @@
+"""
+Offline benchmarks for the backend. OpenAI, Hugging Face, Qdrant and the
+crawled site are replaced by local stand-ins with configurable latency, so
+runs are reproducible and free. Results are written as JSON and can be
+compared against a baseline to catch regressions.
+
+    python -m bench.run run --sizes small --concurrency 1,8,32 --out bench.json
+    python -m bench.run compare baseline.json bench.json --threshold 0.1
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from bench.data import SIZES, make_site
+from bench.fakes import Latency, LocalServer, fake_hf_app, fake_openai_app, site_app
+
+SCENARIOS = ("crawl", "ask", "voice", "image", "ingest", "query", "vote")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(workdir: str, openai_url: str, hf_url: str, vector_backend: str):
+    """Points the app at the stand-ins. Must run before the app modules are imported."""
+    os.chdir(workdir)  # every data/ path the app writes lands in the scratch directory
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "OPENAI_API_BASE": f"{openai_url}/v1",
+        "HF_API_TOKEN": "bench",
+        "HF_API_BASE": hf_url,
+        "HF_MAX_RETRIES": "0",
+        "IMAGE_BACKEND": "serverless",
+        "VECTOR_BACKEND": vector_backend,
+        "RERANK_MODEL": "",
+        "PROFILING_ENABLED": "0",
+    })
+
+
+async def run_app_scenarios(args, site_url: str, results: List[Dict[str, Any]]):
+    """Scenarios that go through the FastAPI app in-process: crawl, /ask, voice and image generation."""
+    import httpx
+    from main import app
+    from bench import scenarios
+
+    wanted = set(args.scenarios)
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+        for size in args.sizes:
+            config = SIZES[size]
+            collection_id = f"bench-{size}"
+            # /ask and voice need a crawled collection
+            if wanted & {"crawl", "ask", "voice"}:
+                for result in await scenarios.crawl(client, site_url, collection_id, config["pages"]):
+                    report(results, {"scenario": "crawl", "size": size, **result})
+            for concurrency in args.concurrency:
+                if "ask" in wanted:
+                    result = await scenarios.ask(client, collection_id, config["requests"], concurrency)
+                    report(results, {"scenario": "ask", "size": size, "concurrency": concurrency, **result})
+                if "image" in wanted:
+                    # Image generation is slow and capped at a few concurrent calls, so it gets fewer requests
+                    prompts = max(10, config["requests"] // 10)
+                    for phase, result in (await scenarios.image(client, prompts, concurrency)).items():
+                        report(results, {"scenario": "image", "size": size, "concurrency": concurrency,
+                                         "phase": phase, **result})
+            if "voice" in wanted:
+                turns = max(10, config["requests"] // 10)
+                report(results, {"scenario": "voice", "size": size, **await scenarios.voice(collection_id, turns)})
+
+
+async def run_code_scenarios(args, openai_url: str, results: List[Dict[str, Any]]):
+    """CSV ingestion, the /query lookup path and the vote threshold measurements against the in-process Qdrant stand-in."""
+    from bench import scenarios
+
+    for size in args.sizes:
+        config = SIZES[size]
+        stats, qdrant, embedder, payloads = await asyncio.to_thread(
+            scenarios.ingest, os.getcwd(), config["rows"], Latency(args.qdrant_ms), Latency(0, args.embed_row_ms))
+        report(results, {"scenario": "ingest", "size": size, **stats})
+        if "query" in args.scenarios:
+            for concurrency in args.concurrency:
+                result = await scenarios.query(qdrant, embedder, payloads, openai_url, config["requests"], concurrency)
+                report(results, {"scenario": "query", "size": size, "concurrency": concurrency, **result})
+        if "vote" in args.scenarios:
+            for result in await asyncio.to_thread(scenarios.vote_thresholds, qdrant, embedder, payloads,
+                                                  config["rows"], config["requests"]):
+                report(results, {"scenario": "vote", "size": size, "phase": f"threshold-{result['threshold']}",
+                                 **result})
+        payloads.close()
+
+
+async def run_scenarios(args, site_url: str, openai_url: str, results: List[Dict[str, Any]]):
+    wanted = set(args.scenarios)
+    if wanted & {"crawl", "ask", "voice", "image"}:
+        await run_app_scenarios(args, site_url, results)
+    if wanted & {"ingest", "query", "vote"}:
+        await run_code_scenarios(args, openai_url, results)
+
+
+def report(results: List[Dict[str, Any]], result: Dict[str, Any]):
+    results.append(result)
+    print(json.dumps(result), flush=True)
+
+
+def run(args) -> Dict[str, Any]:
+    out = os.path.abspath(args.out)
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, backend_dir)
+    latency = {
+        "llm_ttft_ms": args.llm_ttft_ms, "llm_token_ms": args.llm_token_ms, "embed_ms": args.embed_ms,
+        "embed_row_ms": args.embed_row_ms, "hf_ms": args.hf_ms, "qdrant_ms": args.qdrant_ms, "site_ms": args.site_ms,
+    }
+    meta = {
+        "commit": git_commit(), "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+        "platform": platform.platform(), "cpus": os.cpu_count(), "sizes": args.sizes, "concurrency": args.concurrency,
+        "scenarios": args.scenarios, "vector_backend": args.vector_backend, "latency": latency,
+        "answer_tokens": args.answer_tokens,
+    }
+    results: List[Dict[str, Any]] = []
+    largest = max(SIZES[size]["pages"] for size in args.sizes)
+    openai = fake_openai_app(Latency(args.llm_ttft_ms, args.llm_token_ms), Latency(args.embed_ms),
+                             Latency(args.llm_ttft_ms), answer_tokens=args.answer_tokens)
+    hf = fake_hf_app(Latency(args.hf_ms))
+    site = site_app(make_site(largest), Latency(args.site_ms))
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir, \
+            LocalServer(openai) as openai_server, LocalServer(hf) as hf_server, LocalServer(site) as site_server:
+        cwd = os.getcwd()
+        configure_environment(workdir, openai_server.url, hf_server.url, args.vector_backend)
+        try:
+            asyncio.run(run_scenarios(args, site_server.url, openai_server.url, results))
+        finally:
+            os.chdir(cwd)
+        meta["fake_calls"] = {"openai": openai.state.calls, "hf": hf.state.calls, "site": site.state.calls}
+    document = {"meta": meta, "results": results}
+    with open(out, "w") as f:
+        json.dump(document, f, indent=2)
+    print(f"Wrote {len(results)} results to {out}")
+    return document
+
+
+def _key(result: Dict[str, Any]) -> tuple:
+    return result["scenario"], result["size"], result.get("concurrency"), result.get("phase")
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Compares matching results: *_ms metrics regress when they grow and
+    *_per_sec metrics when they shrink by more than threshold (a fraction).
+    Prints every change and returns the regressions.
+    """
+    before = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = before.get(_key(result))
+        if old is None:
+            continue
+        label = "/".join(str(part) for part in _key(result) if part is not None)
+        for metric, value in result.items():
+            lower_is_better = metric.endswith("_ms")
+            if not (lower_is_better or metric.endswith("_per_sec")) or not old.get(metric):
+                continue
+            change = (value - old[metric]) / old[metric]
+            worse = change > threshold if lower_is_better else change < -threshold
+            line = f"{label} {metric}: {old[metric]} -> {value} ({change:+.1%})"
+            print(("REGRESSION " if worse else "") + line)
+            if worse:
+                regressions.append(line)
+    return regressions
+
+
+def _csv(kind):
+    return lambda value: [kind(v) for v in value.split(",") if v]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline backend benchmarks against local stand-in services.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmark scenarios and write JSON results.")
+    run_parser.add_argument("--scenarios", type=_csv(str), default=list(SCENARIOS),
+                            help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    run_parser.add_argument("--sizes", type=_csv(str), default=["small"], help=f"comma-separated {','.join(SIZES)}")
+    run_parser.add_argument("--concurrency", type=_csv(int), default=[1, 8, 32])
+    run_parser.add_argument("--out", default="bench-results.json")
+    run_parser.add_argument("--vector-backend", default="faiss", choices=["faiss", "chroma"])
+    run_parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    run_parser.add_argument("--answer-tokens", type=int, default=60, help="tokens per fake LLM answer")
+    run_parser.add_argument("--llm-ttft-ms", type=float, default=300, help="fake LLM time to first token")
+    run_parser.add_argument("--llm-token-ms", type=float, default=20, help="fake LLM delay per streamed token")
+    run_parser.add_argument("--embed-ms", type=float, default=50, help="fake OpenAI embeddings call latency")
+    run_parser.add_argument("--embed-row-ms", type=float, default=0.0, help="stub local embedder time per text")
+    run_parser.add_argument("--hf-ms", type=float, default=2000, help="fake Hugging Face image latency")
+    run_parser.add_argument("--qdrant-ms", type=float, default=2, help="simulated Qdrant round trip")
+    run_parser.add_argument("--site-ms", type=float, default=20, help="synthetic site response time")
+
+    compare_parser = commands.add_parser("compare", help="Compare results against a baseline.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        unknown = set(args.scenarios) - set(SCENARIOS) or set(args.sizes) - set(SIZES)
+        if unknown:
+            parser.error(f"Unknown scenarios or sizes: {', '.join(sorted(unknown))}")
+        run(args)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
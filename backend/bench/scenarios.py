@@ -0,0 +1,242 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+
+import httpx
+import numpy as np
+
+from bench.data import labelled_queries, product_queries, questions, write_product_csvs
+from bench.fakes import HashEmbedder, Latency, fake_qdrant
+
+TERMINAL = ("succeeded", "failed", "cancelled")
+VOTE_THRESHOLDS = (0.2, 0.25, 0.3, 0.35, 0.4, 0.5, 0.6, 0.8)
+
+
+def summarize(latencies: List[float], wall: float, errors: int = 0, **extra) -> Dict[str, Any]:
+    """Latency percentiles in ms and throughput over the wall-clock time of a run."""
+    ms = np.asarray(latencies, dtype=np.float64) * 1000
+    stats = {"requests": len(latencies) + errors, "errors": errors,
+             "requests_per_sec": round(len(latencies) / wall, 2) if wall else 0.0}
+    if len(ms):
+        stats.update({"mean_ms": round(float(ms.mean()), 2),
+                      "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                      "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                      "p99_ms": round(float(np.percentile(ms, 99)), 2)})
+    stats.update(extra)
+    return stats
+
+
+async def run_concurrent(call: Callable[[Any], Awaitable[Any]], items: Iterable[Any], concurrency: int):
+    """
+    Runs call(item) for every item with at most `concurrency` in flight.
+    Returns (latencies of successful calls, their results, error counts by
+    exception type, wall-clock seconds).
+    """
+    pending = iter(items)
+    latencies, results, errors = [], [], {}
+
+    async def worker():
+        for item in pending:
+            start = time.perf_counter()
+            try:
+                result = await call(item)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            results.append(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, results, errors, time.perf_counter() - start
+
+
+class Overloaded429(Exception):
+    """The endpoint answered 429 Too Many Requests."""
+
+
+async def wait_for_job(client: httpx.AsyncClient, job_id: str, poll: float = 0.1) -> Dict[str, Any]:
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in TERMINAL:
+            return job
+        await asyncio.sleep(poll)
+
+
+async def crawl(client: httpx.AsyncClient, site_url: str, collection_id: str, pages: int) -> List[Dict[str, Any]]:
+    """A cold crawl of the synthetic site through /crawl, then a re-crawl where every page is a 304."""
+    results = []
+    for phase in ("cold", "recrawl"):
+        start = time.perf_counter()
+        response = await client.post("/crawl", json={"url": f"{site_url}/", "collection_id": collection_id,
+                                                      "max_pages": pages, "max_depth": pages})
+        job = await wait_for_job(client, response.json()["job_id"])
+        seconds = time.perf_counter() - start
+        if job["status"] != "succeeded":
+            raise RuntimeError(f"Crawl job {job['status']}: {job.get('error')}")
+        result = job["result"]
+        results.append({"phase": phase, "pages": result["pages"], "chunks_added": result["chunks_added"],
+                        "seconds": round(seconds, 3), "pages_per_sec": round(result["pages"] / seconds, 2)})
+    return results
+
+
+async def ask(client: httpx.AsyncClient, collection_id: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Distinct questions against /ask, each in its own session so none is condensed."""
+    async def call(item):
+        i, question = item
+        response = await client.get("/ask", params={"question": question, "collection_id": collection_id,
+                                                   "session_id": f"bench-{concurrency}-{i}"})
+        if response.status_code == 429:
+            raise Overloaded429()
+        response.raise_for_status()
+        return response.json()["cached"]
+
+    latencies, cached, errors, wall = await run_concurrent(call, enumerate(questions(requests, seed=concurrency)),
+                                                           concurrency)
+    return summarize(latencies, wall, sum(errors.values()), rejected=errors.get("Overloaded429", 0),
+                     cache_hit_rate=round(sum(cached) / len(cached), 3) if cached else 0.0)
+
+
+async def image(client: httpx.AsyncClient, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Distinct prompts against the serverless image endpoint (misses), then the same prompts again (hits)."""
+    prompts = [f"a product photo of item {concurrency}-{i}" for i in range(requests)]
+
+    async def call(prompt):
+        response = await client.get("/serverless-image-generation/", params={"prompt": prompt})
+        if response.status_code == 429:
+            raise Overloaded429()
+        response.raise_for_status()
+
+    results = {}
+    for phase in ("miss", "hit"):
+        latencies, _, errors, wall = await run_concurrent(call, prompts, concurrency)
+        results[phase] = summarize(latencies, wall, sum(errors.values()), rejected=errors.get("Overloaded429", 0))
+    return results
+
+
+async def voice(collection_id: str, turns: int, timeout: float = 60) -> Dict[str, Any]:
+    """
+    Voice turns through the same RAG step /voice-chat uses, driven by final
+    transcriptions: time to the first sentence handed to TTS and to the full
+    answer. STT and TTS audio time isn't included.
+    """
+    from pipecat.frames.frames import EndFrame, TranscriptionFrame
+    from pipecat.pipeline.pipeline import Pipeline
+    from pipecat.pipeline.runner import PipelineRunner
+    from pipecat.pipeline.task import PipelineTask
+    from routers.agent_route import voice_rag
+
+    messages: asyncio.Queue = asyncio.Queue()
+
+    async def send_json(message: dict):
+        await messages.put((time.perf_counter(), message))
+
+    task = PipelineTask(Pipeline([voice_rag(collection_id, "bench-voice", send_json)]))
+    run = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+    first_sentence, full = [], []
+    errors = 0
+    start_all = time.perf_counter()
+    try:
+        for question in questions(turns, seed=7):
+            start = time.perf_counter()
+            await task.queue_frame(TranscriptionFrame(text=question, user_id="bench", timestamp=""))
+            first = None
+            try:
+                while True:
+                    at, message = await asyncio.wait_for(messages.get(), timeout)
+                    if message.get("type") == "response_delta" and first is None:
+                        first = at - start
+                    elif message.get("type") == "response":
+                        break
+            except asyncio.TimeoutError:
+                errors += 1
+                continue
+            first_sentence.append(first if first is not None else at - start)
+            full.append(at - start)
+    finally:
+        await task.queue_frame(EndFrame())
+        await asyncio.wait_for(asyncio.gather(run, return_exceptions=True), timeout)
+    wall = time.perf_counter() - start_all
+    result = summarize(full, wall, errors)
+    first_stats = summarize(first_sentence, wall)
+    result.update({f"first_sentence_{key}": first_stats[key]
+                   for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms") if key in first_stats})
+    return result
+
+
+def ingest(workdir: str, rows: int, qdrant_latency: Latency, embed_latency: Latency):
+    """
+    CSV ingestion through QdrantIngestor into an in-process Qdrant and a
+    payload store. Returns (pipeline stats, the client, embedder and payload
+    store, for the /query scenario).
+    """
+    from qdrant_client.http.models import Distance, VectorParams
+    from util.payload_store import PayloadStore
+    from util.preprocess import DataPreprocessor
+    from util_.injest import QdrantIngestor
+
+    folder = os.path.join(workdir, f"csv-{rows}")
+    write_product_csvs(folder, rows)
+    client = fake_qdrant(qdrant_latency)
+    embedder = HashEmbedder(latency=embed_latency)
+    client.create_collection("bench", vectors_config=VectorParams(size=embedder.dim, distance=Distance.COSINE))
+    payloads = PayloadStore(os.path.join(folder, "payloads"))
+    ingestor = QdrantIngestor(client, "bench", embedder, DataPreprocessor(),
+                              checkpoint_path=os.path.join(folder, "checkpoint.json"), payload_store=payloads)
+    stats = ingestor.ingest_csv_folder(folder)
+    return stats, client, embedder, payloads
+
+
+async def query(client, embedder, payloads, openai_url: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    """The /query handler's work (clean, exact match or micro-batched search, vote or LLM) for distinct lookups."""
+    from openai import AsyncOpenAI
+    from util.code_resolver import CodeResolver
+    from util.code_search import CodeSearcher
+    from util.preprocess import DataPreprocessor
+
+    preprocessor = DataPreprocessor()
+    searcher = CodeSearcher(client, "bench", embedder, limit=5, payloads=payloads)
+    resolver = CodeResolver(AsyncOpenAI(base_url=f"{openai_url}/v1", api_key="bench"))
+
+    async def call(item):
+        external_code = preprocessor.clean_text(item["external_code"])
+        if searcher.exact(external_code) is not None:
+            return "exact"
+        text = external_code + " " + preprocessor.clean_text(item["description"])
+        hits = await searcher.search(text)
+        return (await resolver.resolve(item["external_code"], item["description"], hits))["source"]
+
+    latencies, sources, errors, wall = await run_concurrent(call, product_queries(requests, seed=concurrency),
+                                                            concurrency)
+    return summarize(latencies, wall, sum(errors.values()),
+                     llm_rate=round(sources.count("llm") / len(sources), 3) if sources else 0.0,
+                     exact_rate=round(sources.count("exact") / len(sources), 3) if sources else 0.0)
+
+
+def vote_thresholds(client, embedder, payloads, rows: int, lookups: int,
+                    thresholds=VOTE_THRESHOLDS) -> List[Dict[str, Any]]:
+    """
+    The neighbour vote on labelled lookups, per threshold: the share of
+    lookups it answers without the LLM (skip_rate) and the share of those
+    answers that are wrong (vote_error_rate). This is what a
+    VOTE_SCORE_THRESHOLD is chosen from.
+    """
+    from util.code_resolver import vote
+    from util.code_search import CodeSearcher
+    from util.preprocess import DataPreprocessor
+
+    preprocessor = DataPreprocessor()
+    searcher = CodeSearcher(client, "bench", embedder, limit=5, payloads=payloads)
+    items = labelled_queries(rows, lookups)
+    hits = searcher.search_texts([preprocessor.clean_text(item["external_code"]) + " "
+                                  + preprocessor.clean_text(item["description"]) for item in items])
+    votes = [vote(h) for h in hits]
+    scores = np.array([score for _, score in votes])
+    correct = np.array([code == item["expected"] for (code, _), item in zip(votes, items)])
+    results = []
+    for threshold in thresholds:
+        skipped = scores >= threshold
+        results.append({"threshold": threshold, "lookups": len(items), "skip_rate": round(float(skipped.mean()), 3),
+                        "vote_error_rate": round(float(1 - correct[skipped].mean()), 3) if skipped.any() else 0.0})
+    return results
@@ -1,45 +1,210 @@
-#from diffusers import StableDiffusionPipeline, FluxPipeline
-# import torch
-import requests
-from PIL import Image
 import io
 import os
-import json
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
 
+import httpx
 
+from util.metrics import span
+from util.microbatch import MicroBatcher
 
-def generate_image_serverless(prompt: str, TOKEN: str):
+# "serverless" calls the Hugging Face API, "local" runs a diffusers pipeline in-process
+# and falls back to the API if it can't be loaded or fails
+IMAGE_BACKEND = os.getenv("IMAGE_BACKEND", "serverless")
+LOCAL_IMAGE_MODEL = os.getenv("LOCAL_IMAGE_MODEL", "stabilityai/sd-turbo")
+LOCAL_IMAGE_STEPS = int(os.getenv("LOCAL_IMAGE_STEPS", "4"))
+LOCAL_IMAGE_SIZE = int(os.getenv("LOCAL_IMAGE_SIZE", "512"))
+LOCAL_IMAGE_GUIDANCE = float(os.getenv("LOCAL_IMAGE_GUIDANCE", "0.0"))  # turbo/schnell models are trained without CFG
+LOCAL_IMAGE_DTYPE = os.getenv("LOCAL_IMAGE_DTYPE", "float32")  # bfloat16 halves memory on CPUs that support it
+LOCAL_IMAGE_THREADS = int(os.getenv("LOCAL_IMAGE_THREADS", "0"))  # 0 keeps torch's default
+LOCAL_IMAGE_MAX_BATCH = int(os.getenv("LOCAL_IMAGE_MAX_BATCH", "4"))
+LOCAL_IMAGE_MAX_WAIT_MS = float(os.getenv("LOCAL_IMAGE_MAX_WAIT_MS", "100"))
+
+HF_API_BASE = os.getenv("HF_API_BASE", "https://api-inference.huggingface.co")
+HF_IMAGE_MODEL = os.getenv("HF_IMAGE_MODEL", "black-forest-labs/FLUX.1-dev")
+HF_TIMEOUT = float(os.getenv("HF_TIMEOUT", "120"))
+HF_MAX_RETRIES = int(os.getenv("HF_MAX_RETRIES", "3"))
+# Longest single wait between retries, and the overall time after which a request stops retrying
+HF_MAX_BACKOFF = float(os.getenv("HF_MAX_BACKOFF", "60"))
+HF_RETRY_DEADLINE = float(os.getenv("HF_RETRY_DEADLINE", "180"))
+
+# Statuses worth retrying: rate limited, model still loading, transient upstream errors
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# One pooled client per process for all Hugging Face calls
+_hf_client: Optional[httpx.AsyncClient] = None
+
+
+def get_hf_client() -> httpx.AsyncClient:
+    global _hf_client
+    if _hf_client is None or _hf_client.is_closed:
+        _hf_client = httpx.AsyncClient(
+            base_url=HF_API_BASE,
+            timeout=httpx.Timeout(HF_TIMEOUT, connect=10),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _hf_client
+
+
+async def close_hf_client():
+    global _hf_client
+    if _hf_client is not None:
+        await _hf_client.aclose()
+        _hf_client = None
+
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+    """Media type from the file signature, None if data isn't a PNG, JPEG or WebP image."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+async def generate_image_serverless(prompt: str, TOKEN: str, model: str = HF_IMAGE_MODEL) -> Tuple[bytes, str]:
     """
     Generate an image using the Flux model via Hugging Face model API.
+    Returns the image bytes exactly as the API sent them, with their media type.
     """
-    API_URL = "https://api-inference.huggingface.co/models/black-forest-labs/FLUX.1-dev"
-    headers = {"Authorization": f"Bearer {TOKEN}"}
     if not TOKEN:
         raise ValueError("HF_API_TOKEN environment variable is not set")
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + HF_RETRY_DEADLINE
+
+    for attempt in range(HF_MAX_RETRIES + 1):
+        try:
+            with span("hf_request"):
+                response = await get_hf_client().post(f"/models/{model}", headers=headers, json={"inputs": prompt})
+        except httpx.TransportError as e:
+            wait = min(2 ** attempt, HF_MAX_BACKOFF)
+            if attempt == HF_MAX_RETRIES or loop.time() + wait > deadline:
+                raise RuntimeError(f"API request failed: {str(e)}")
+            await asyncio.sleep(wait)
+            continue
+        if response.status_code in _RETRY_STATUSES and attempt < HF_MAX_RETRIES:
+            # A loading model reports how long it needs
+            wait = 2 ** attempt
+            if response.status_code == 503 and "application/json" in response.headers.get("content-type", ""):
+                wait = float(response.json().get("estimated_time", wait))
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.isdigit():
+                wait = float(retry_after)
+            # Waiting past the deadline can't succeed in time; report the upstream error instead
+            if loop.time() + wait > deadline:
+                break
+            await asyncio.sleep(min(wait, HF_MAX_BACKOFF))
+            continue
+        break
+
+    if response.is_error:
+        raise RuntimeError(f"API request failed: {response.status_code} {response.text[:200]}")
+
+    # Check if response is JSON (error message) instead of bytes
+    if 'application/json' in response.headers.get('content-type', ''):
+        raise RuntimeError(f"Image processing failed: API returned error: {response.json()}")
+
+    # The signature check replaces a full decode; the bytes are passed through as-is
+    image_bytes = response.content
+    media_type = sniff_image_type(image_bytes)
+    if media_type is None:
+        raise RuntimeError("Image processing failed: No valid image data received from API")
+    return image_bytes, media_type
+
+
+# Approximate RGB projection of Stable Diffusion's 4-channel latents, for cheap previews
+_LATENT_RGB = [
+    [0.298, 0.207, 0.208],
+    [0.187, 0.286, 0.173],
+    [-0.158, 0.189, 0.264],
+    [-0.184, -0.271, -0.473],
+]
+
+# on_step(step, steps, preview PNG bytes or None), called from the inference thread
+StepCallback = Callable[[int, int, Optional[bytes]], None]
+
+
+@dataclass
+class _ImageRequest:
+    prompt: str
+    on_step: Optional[StepCallback] = None
+
+
+def _png(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class LocalImageEngine:
+    """
+    In-process text-to-image on CPU with diffusers. The pipeline is loaded
+    once; prompts submitted concurrently are coalesced by a MicroBatcher and
+    denoised together in one batched run. Steps, resolution and dtype are
+    fixed per engine so every request in a batch is compatible.
+    """
+    def __init__(self, model: str = LOCAL_IMAGE_MODEL, steps: int = LOCAL_IMAGE_STEPS, size: int = LOCAL_IMAGE_SIZE,
+                 guidance: float = LOCAL_IMAGE_GUIDANCE, dtype: str = LOCAL_IMAGE_DTYPE, threads: int = LOCAL_IMAGE_THREADS,
+                 max_batch: int = LOCAL_IMAGE_MAX_BATCH, max_wait_ms: float = LOCAL_IMAGE_MAX_WAIT_MS):
+        self.model = model
+        self.steps = steps
+        self.size = size
+        self.guidance = guidance
+        self.dtype = dtype
+        self.threads = threads
+        self.pipeline = None
+        self.batcher = MicroBatcher(self._generate_batch, max_batch, max_wait_ms)
+
+    @property
+    def ready(self) -> bool:
+        return self.pipeline is not None
+
+    def load(self):
+        import torch
+        from diffusers import AutoPipelineForText2Image
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        pipeline = AutoPipelineForText2Image.from_pretrained(self.model, torch_dtype=getattr(torch, self.dtype))
+        pipeline.to("cpu")
+        pipeline.set_progress_bar_config(disable=True)
+        self.pipeline = pipeline
+
+    async def generate(self, prompt: str, on_step: Optional[StepCallback] = None) -> Tuple[bytes, str]:
+        return await self.batcher.submit(_ImageRequest(prompt, on_step)), "image/png"
+
+    def _generate_batch(self, requests: List[_ImageRequest]) -> List[bytes]:
+        import torch
+
+        def step_end(pipeline, step, timestep, callback_kwargs):
+            if any(r.on_step is not None for r in requests):
+                previews = self._previews(callback_kwargs.get("latents"))
+                for i, r in enumerate(requests):
+                    if r.on_step is not None:
+                        r.on_step(step + 1, self.steps, previews[i] if previews else None)
+            return callback_kwargs
+
+        with torch.inference_mode(), span("diffusion"):
+            images = self.pipeline(
+                prompt=[r.prompt for r in requests],
+                num_inference_steps=self.steps,
+                guidance_scale=self.guidance,
+                height=self.size,
+                width=self.size,
+                callback_on_step_end=step_end,
+            ).images
+        return [_png(image) for image in images]
 
-    try:
-        response = requests.post(API_URL, headers=headers, json={"inputs": prompt})
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        # Check if response is JSON (error message) instead of bytes
-        content_type = response.headers.get('content-type', '')
-        if 'application/json' in content_type:
-            error_data = response.json()
-            raise ValueError(f"API returned error: {error_data}")
-
-        # Ensure we have image data
-        image_bytes = response.content
-        if not image_bytes:
-            raise ValueError("No image data received from API")
-
-        # Try to open the image data
-        image = Image.open(io.BytesIO(image_bytes))
-        image.verify()  # Verify it's a valid image
-        image = Image.open(io.BytesIO(image_bytes))  # Reopen after verify
-        return image
-
-    except requests.exceptions.RequestException as e:
-        raise RuntimeError(f"API request failed: {str(e)}")
-    except (ValueError, IOError) as e:
-        raise RuntimeError(f"Image processing failed: {str(e)}")
-    
\ No newline at end of file
+    @staticmethod
+    def _previews(latents) -> Optional[List[bytes]]:
+        """Low-resolution previews straight from the latents, skipping the VAE. Only for 4-channel (SD) latents."""
+        if latents is None or latents.ndim != 4 or latents.shape[1] != 4:
+            return None
+        import torch
+        from PIL import Image
+        rgb = torch.einsum("bchw,cr->bhwr", latents.float(), torch.tensor(_LATENT_RGB))
+        rgb = ((rgb + 1) / 2).clamp(0, 1).mul(255).byte().numpy()
+        return [_png(Image.fromarray(image)) for image in rgb]
@@ -1,6 +1,11 @@
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, WebSocket, Response
-from routers import agent_route,  image_gen_route
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from routers import agent_route,  image_gen_route, job_route
+from util.executors import Overloaded
+from util import metrics
+from util.warmup import warmup
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -13,7 +18,15 @@ load_dotenv()
 
 
 
-app = FastAPI(lifespan=agent_route.lifespan)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with agent_route.lifespan(app), image_gen_route.lifespan(app):
+        # The routers registered their warm-up steps; run them without holding up startup
+        warmup.start()
+        yield
+        await warmup.stop()
+
+app = FastAPI(lifespan=lifespan)
 origins = [
     "http://localhost",
     "http://localhost:3000",
@@ -32,8 +45,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    # Backpressure: tell clients when to retry instead of queueing them unboundedly
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+app.middleware("http")(metrics.instrument)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # Prometheus scrape endpoint: per-stage latency histograms, token and embedding counters
+    return metrics.metrics_response()
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    # Liveness: the process is up and serving
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    # Readiness: 503 until the warm-up has preloaded models and connections
+    status = 200 if warmup.ready.is_set() else 503
+    return JSONResponse(status_code=status, content={"ready": status == 200, "steps": warmup.status})
+
 app.include_router(image_gen_route.router)
 app.include_router(agent_route.router, tags=["Agent"])
+app.include_router(job_route.create_router(agent_route.jobs), tags=["Jobs"])
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,43 +1,91 @@
 import os
 import asyncio
-import requests
 import json
-from fastapi import FastAPI, APIRouter, HTTPException, WebSocket, Response
+from fastapi import FastAPI, APIRouter, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
-from io import BytesIO
 
 
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
-from bs4 import BeautifulSoup
-from typing import List, Dict, Any
-
-from pipecat.frames.frames import TextFrame, EndFrame, TTSSpeakFrame, TranscriptionFrame, TTSAudioRawFrame
-from pipecat.frames.frames import InputAudioRawFrame, AudioRawFrame
-from pipecat.pipeline.pipeline import Pipeline
-from pipecat.pipeline.task import PipelineTask
-from pipecat.pipeline.runner import PipelineRunner
-from pipecat.services.openai import OpenAILLMService, OpenAISTTService, OpenAITTSService
-
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.chains import RetrievalQA
-from langchain_openai import ChatOpenAI
+from typing import TYPE_CHECKING, Any, Optional
+
+from starlette.websockets import WebSocketState
+
+from util.crawler import Crawler, CrawledPage, close_http_client
+from util.manifest import chunk_id, content_hash
+from util.chunking import chunk_blocks
+from util.vectorstore import DEFAULT_COLLECTION, valid_collection_name
+from util.registry import Collection, CollectionRegistry
+from util.sessions import SessionStore
+from util import executors
+from util.executors import Overloaded, limiter, run_blocking
+from util.jobs import JobContext, JobQueue, JobStore
+from util.metrics import span
+from util.tokens import get_encoding
+from util.warmup import warmup
+
+# pipecat, LangChain and the OpenAI clients are imported on first use (or by the
+# warm-up), keeping them off the startup path
+if TYPE_CHECKING:
+    from util.voice import VoiceRAGProcessor
 
 router = APIRouter()
-qa_chain = None 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global qa_chain
+    executors.install()
+    warmup.add("imports", import_heavy_modules)
+    # Reopen the default on-disk collection up front, others are opened on first use
+    warmup.add("default_collection", open_default_collection)
+    warmup.add("tokenizer", get_encoding)
+    if os.getenv("RERANK_MODEL"):
+        warmup.add("reranker", load_reranker)
+    warmup.add("openai_connection", warm_openai)
+    await jobs.start()
+    sweeper = asyncio.create_task(sessions.run_sweeper())
     yield
+    sweeper.cancel()
+    await jobs.stop()
+    await close_http_client()
+    from util.llm_clients import close_openai_clients
+    await close_openai_clients()
+    registry.close()
+    executors.shutdown()
+
+
+def import_heavy_modules():
+    """The imports the first /ask or /voice-chat would otherwise pay for."""
+    import langchain.chains  # noqa: F401
+    import pipecat.services.openai  # noqa: F401
+    import util.hybrid_retriever  # noqa: F401
+    import util.llm_clients  # noqa: F401
+    import util.voice  # noqa: F401
+
+
+async def open_default_collection():
+    async with registry.use(DEFAULT_COLLECTION, create=False):
+        pass
+
 
+def load_reranker():
+    from util.hybrid_retriever import get_reranker
+    get_reranker()
+
+
+async def warm_openai():
+    from util.llm_clients import warm_openai_connection
+    await warm_openai_connection()
+
+
+def check_collection_id(collection_id: str):
+    if not valid_collection_name(collection_id):
+        raise HTTPException(status_code=400, detail="collection_id must be 3-63 characters of letters, digits, '.', '_' or '-'.")
 
-# Store conversation history in memory
-conversation_history: List[Dict[str, str]] = []
 
 class URLRequest(BaseModel):
     url: str
+    collection_id: str = DEFAULT_COLLECTION
+    max_depth: Optional[int] = None  # link hops to follow from url, defaults to CRAWL_MAX_DEPTH
+    max_pages: Optional[int] = None  # page budget for the whole crawl, defaults to CRAWL_MAX_PAGES
 
 class VoiceRequest(BaseModel):
     audio_data: bytes
@@ -46,44 +94,151 @@ class ImageRequest(BaseModel):
     prompt: str
 
 @router.get("/ask")
-async def ask_question(question: str):
-    global qa_chain, conversation_history
-    if qa_chain is None:
-        raise HTTPException(status_code=500, detail="Please ensure the vector store is populated.")
-    
-    # Set up the LLM service using OpenAI
-    llm = OpenAILLMService(
-        name="LLM",
-        api_key=os.getenv("OPENAI_API_KEY"),
-        model="gpt-4"
-    )
-    
-    # Define pipeline that processes text using the LLM
-    pipeline = Pipeline([llm])
-    task = PipelineTask(pipeline)
-    runner = PipelineRunner()
-
-    # Process the question
-    answer = qa_chain.invoke({"query": question})
-    await task.queue_frames([
-        TextFrame(answer),
-        EndFrame()
-    ])
-
-    # Run the pipeline task
-    await runner.run(task)
-    
+async def ask_question(question: str, session_id: str, collection_id: str = DEFAULT_COLLECTION):
+    """Answers question from collection_id, with follow-ups resolved against the client's session_id."""
+    check_collection_id(collection_id)
+    async with limiter("ask").slot(), registry.use(collection_id, create=False) as collection:
+        if collection is None or collection.chunks == 0:
+            raise HTTPException(status_code=500, detail="Please ensure the vector store is populated.")
+        generation = collection.answer_cache.generation
+        # Follow-ups like "how much is it?" are rewritten with the session's memory before retrieval
+        standalone = await sessions.condense(session_id, question)
+        vector, cached = await lookup_answer(collection, standalone)
+        if cached is None:
+            # The chain already ran the LLM, no second pipeline pass over the answer
+            answer = await collection.qa_chain.ainvoke({"query": standalone})
+            answer_text = answer['result']
+            collection.answer_cache.store(standalone, vector, {"answer": answer_text}, generation)
+        else:
+            answer_text = cached["answer"]
+
     # Store in conversation history
-    conversation_history.append({"role": "user", "content": question})
-    conversation_history.append({"role": "assistant", "content": answer['result']})
+    sessions.remember(session_id, question, answer_text)
+
+    return {"question": question, "answer": answer_text, "cached": cached is not None}
+
+@router.get("/ask/stream")
+async def ask_question_stream(question: str, session_id: str, collection_id: str = DEFAULT_COLLECTION):
+    """
+    Server-Sent Events variant of /ask: one `sources` event with the retrieved
+    chunks' metadata, then a `token` event per generated token and a final
+    `done` event carrying the full answer. session_id works as for /ask.
+    """
+    check_collection_id(collection_id)
+    # Held until the stream ends, not just until the response starts
+    slot = limiter("ask")
+    await slot.acquire()
+    try:
+        collection = await asyncio.to_thread(registry.acquire, collection_id, False)
+    except BaseException:
+        slot.release()
+        raise
+    if collection is None or collection.chunks == 0:
+        registry.release(collection)
+        slot.release()
+        raise HTTPException(status_code=500, detail="Please ensure the vector store is populated.")
+
+    async def events():
+        try:
+            generation = collection.answer_cache.generation
+            standalone = await sessions.condense(session_id, question)
+            vector, cached = await lookup_answer(collection, standalone)
+            if cached is not None:
+                answer_text = cached["answer"]
+                yield sse("sources", cached.get("sources", []))
+                yield sse("token", {"text": answer_text})
+            else:
+                docs = await collection.qa_chain.retriever.ainvoke(standalone)
+                sources = [doc.metadata for doc in docs]
+                yield sse("sources", sources)
+                answer = []
+                async for token in stream_answer(collection.qa_chain, standalone, docs):
+                    answer.append(token)
+                    yield sse("token", {"text": token})
+                answer_text = "".join(answer)
+                collection.answer_cache.store(standalone, vector, {"answer": answer_text, "sources": sources}, generation)
+            yield sse("done", {"question": question, "answer": answer_text, "cached": cached is not None})
+            sessions.remember(session_id, question, answer_text)
+        finally:
+            registry.release(collection)
+            slot.release()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+async def lookup_answer(collection: Collection, question: str):
+    """Embeds the question and returns it with a semantically matching cached answer, if any."""
+    vector = await collection.vectorstore.embeddings.aembed_query(question)
+    with span("answer_cache"):
+        return vector, collection.answer_cache.lookup(vector)
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_answer(qa_chain, question: str, docs):
+    """Streams the answer tokens of qa_chain's "stuff" step for already retrieved docs."""
+    stuff = qa_chain.combine_documents_chain
+    context = "\n\n".join(doc.page_content for doc in docs)
+    prompt = stuff.llm_chain.prompt.format_prompt(**{stuff.document_variable_name: context, "question": question})
+    async for chunk in stuff.llm_chain.llm.astream(prompt):
+        if chunk.content:
+            yield chunk.content
+
+NO_CONTEXT_REPLY = "Please provide a URL to crawl first so I can answer questions about specific content."
+
+def voice_rag(collection_id: str, session_id: Optional[str], send_json) -> "VoiceRAGProcessor":
+    """The RAG step of a voice pipeline, answering from collection_id with session_id's memory."""
+    from util.voice import VoiceRAGProcessor
+
+    # Retrieve for the question rewritten against the session's history
+    async def retrieve(question: str):
+        async with registry.use(collection_id, create=False) as collection:
+            if collection is None or collection.chunks == 0:
+                return None
+            return await collection.qa_chain.retriever.ainvoke(await sessions.condense(session_id, question))
 
-    return {"question": question, "answer": answer['result']}
+    async def generate(question: str, docs):
+        async with registry.use(collection_id, create=False) as collection:
+            generation = collection.answer_cache.generation
+            standalone = await sessions.condense(session_id, question)
+            vector, cached = await lookup_answer(collection, standalone)
+            if cached is not None:
+                yield cached["answer"]
+                return
+            answer = []
+            async for token in stream_answer(collection.qa_chain, standalone, docs):
+                answer.append(token)
+                yield token
+            collection.answer_cache.store(standalone, vector, {"answer": "".join(answer)}, generation)
+
+    def on_turn(question: str, answer: str):
+        sessions.remember(session_id, question, answer)
+
+    return VoiceRAGProcessor(retrieve, generate, send_json, on_turn, NO_CONTEXT_REPLY)
 
 @router.websocket("/voice-chat")
-async def voice_chat(websocket: WebSocket):
+async def voice_chat(websocket: WebSocket, session_id: str, collection_id: str = DEFAULT_COLLECTION,
+                     sample_rate: int = 16000):
+    """
+    Streaming voice conversation over one long-lived pipeline per connection.
+    The client streams 16-bit mono PCM at sample_rate as binary messages; turns
+    are detected with VAD, or ended explicitly with {"status": "end_of_turn"}.
+    The server sends transcription/response_delta/response JSON messages and
+    TTS audio as binary messages, sentence by sentence. Turns are remembered
+    under the client's session_id, as for /ask.
+    """
+    if not valid_collection_name(collection_id):
+        await websocket.close(code=1008)
+        return
     await websocket.accept()
-    
-    # Initialize services
+    from pipecat.frames.frames import InputAudioRawFrame, UserStoppedSpeakingFrame
+    from pipecat.pipeline.pipeline import Pipeline
+    from pipecat.pipeline.task import PipelineParams, PipelineTask
+    from pipecat.pipeline.runner import PipelineRunner
+    from pipecat.services.openai import OpenAISTTService, OpenAITTSService
+    from util.voice import VADProcessor, VoiceMetricsSink, WebSocketAudioSink
+
+    # Initialize services once for the whole connection
     stt_service = OpenAISTTService(
         name="Speech-to-Text",
         api_key=os.getenv("OPENAI_API_KEY")
@@ -94,143 +249,160 @@ async def voice_chat(websocket: WebSocket):
         api_key=os.getenv("OPENAI_API_KEY"),
         voice="alloy"  # Can be customized or made selectable
     )
-    
-    llm_service = OpenAILLMService(
-        name="LLM",
-        api_key=os.getenv("OPENAI_API_KEY"),
-        model="gpt-4",
-        system_prompt="""You are a helpful assistant that can answer questions about web documents. 
-        Be concise and informative in your responses."""
-    )
-    
-    # Create the pipeline for voice conversation
-    pipeline = Pipeline([stt_service, llm_service, tts_service])
-    
+
+    async def send_json(message: dict):
+        await websocket.send_text(json.dumps(message))
+
+    rag = voice_rag(collection_id, session_id, send_json)
+    pipeline = Pipeline([VADProcessor(sample_rate), stt_service, rag, tts_service,
+                         WebSocketAudioSink(websocket.send_bytes), VoiceMetricsSink()])
+    # Services report TTFB and processing time as MetricsFrames, recorded by VoiceMetricsSink;
+    # the STT service labels the audio it uploads with audio_in_sample_rate
+    task = PipelineTask(pipeline, params=PipelineParams(enable_metrics=True, audio_in_sample_rate=sample_rate))
+    runner = PipelineRunner(handle_sigint=False)
+    slot = limiter("voice")
     try:
+        await slot.acquire()
+    except Overloaded:
+        # 1013: try again later
+        await websocket.close(code=1013)
+        return
+    pipeline_run = asyncio.create_task(runner.run(task))
+
+    try:
+        # Tell the client we're ready for audio
+        await send_json({"status": "ready"})
         while True:
-            # Create a new task for each conversation turn
-            task = PipelineTask(pipeline)
-            runner = PipelineRunner()
-            
-            # Tell the client we're ready for audio
-            await websocket.send_text(json.dumps({"status": "ready"}))
-            
-            # Receive audio data from client
-            audio_data = await websocket.receive_bytes()
-            
-            # Convert received data to audio format Pipecat can understand
-            # For WebM audio format used by browser's MediaRecorder
-            
-            # Queue the audio frame
-            await task.queue_frames([
-                # InputAudioRawFrame for STT processing
-                InputAudioRawFrame(
-                    audio=audio_data,
-                    sample_rate=48000,  # Common sample rate
-                    num_channels=1      # Mono audio
-                )
-            ])
-            
-            # End the input after sending audio
-            await task.queue_frames([EndFrame()])
-            
-            # Process frames and handle the outputs
-            async for frame in runner.stream(task):
-                if isinstance(frame, TranscriptionFrame):
-                    # Speech recognition result
-                    transcription = frame.message.text
-                    await websocket.send_text(json.dumps({
-                        "type": "transcription",
-                        "text": transcription
-                    }))
-                    
-                    # Process with RAG if we have a vector store
-                    if qa_chain is not None:
-                        # Get context-enhanced answer
-                        answer = qa_chain.invoke({"query": transcription})
-                        answer_text = answer['result']
-                        
-                        # Use the answer in the conversation
-                        await task.queue_frames([
-                            TextFrame(answer_text),
-                            TTSSpeakFrame(text=answer_text)
-                        ])
-                        
-                        # Store in conversation history
-                        conversation_history.append({"role": "user", "content": transcription})
-                        conversation_history.append({"role": "assistant", "content": answer_text})
-                    else:
-                        # No RAG context available
-                        response_text = "Please provide a URL to crawl first so I can answer questions about specific content."
-                        await task.queue_frames([
-                            TextFrame(response_text),
-                            TTSSpeakFrame(text=response_text)
-                        ])
-                
-                elif isinstance(frame, TextFrame):
-                    # LLM response text
-                    await websocket.send_text(json.dumps({
-                        "type": "response",
-                        "text": frame.text
-                    }))
-                    
-                elif isinstance(frame, TTSAudioRawFrame):  # TTS audio output
-                    # Send audio back to client
-                    await websocket.send_bytes(frame.audio)  # Access the audio property
-                    
-            # Wait for client to indicate they're done listening
-            confirmation = await websocket.receive_text()
-            if json.loads(confirmation).get("status") == "complete":
-                continue
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                await task.queue_frame(InputAudioRawFrame(
+                    audio=message["bytes"],
+                    sample_rate=sample_rate,
+                    num_channels=1
+                ))
+            elif message.get("text") and json.loads(message["text"]).get("status") == "end_of_turn":
+                await task.queue_frame(UserStoppedSpeakingFrame())
                 
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        await websocket.close()
+        await task.cancel()
+        await asyncio.gather(pipeline_run, return_exceptions=True)
+        slot.release()
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
 
-@router.post("/crawl")
+@router.post("/crawl", status_code=202)
 async def crawl_and_store(url_request: URLRequest):
-    global qa_chain 
+    """
+    Queues a crawl job and returns its ID right away. Progress is available
+    from /jobs/{job_id} and /jobs/{job_id}/events.
+    """
+    check_collection_id(url_request.collection_id)
+    job_id = jobs.submit("crawl", url_request.model_dump())
+    return {"message": f"Crawling {url_request.url} in the background (job {job_id}).",
+            "job_id": job_id, "status": "queued", "collection_id": url_request.collection_id}
+
+async def crawl_job(ctx: JobContext) -> dict:
+    url_request = URLRequest(**ctx.params)
     url = url_request.url
-    content = await crawl_url(url)
-    if not content:
-        raise HTTPException(status_code=400, detail="Failed to crawl the URL or no content found.")
-    
-    # Create and store the QA chain
-    qa_chain = create_retrieval_chain(content) 
-    
-    return {"message": f"Content from {url} has been processed and stored."}
+    stats = {"pages": 0, "unchanged": 0, "chunks_added": 0, "chunks_deleted": 0}
+    async with registry.use(url_request.collection_id) as collection:
+        # Sync each page as soon as it arrives instead of waiting for the whole site.
+        # Embedding and index writes block, so they run in the blocking pool.
+        async for page in crawl_url(url, collection, url_request.max_depth, url_request.max_pages):
+            added, deleted = await run_blocking(sync_page, collection, page)
+            stats["pages"] += 1
+            stats["unchanged"] += int(page.not_modified or (added == 0 and deleted == 0))
+            stats["chunks_added"] += added
+            stats["chunks_deleted"] += deleted
+            ctx.progress(**stats, pages_per_sec=round(stats["pages"] / ctx.elapsed, 2))
+        await asyncio.to_thread(collection.refresh_size)
+        if stats["chunks_added"] or stats["chunks_deleted"]:
+            collection.answer_cache.invalidate()
+    if stats["pages"] == 0:
+        raise ValueError("Failed to crawl the URL or no content found.")
+
+    return {"message": f"Content from {url} has been processed and stored.",
+            "collection_id": url_request.collection_id, **stats}
+
+async def crawl_url(url, collection: Collection, max_depth: Optional[int] = None, max_pages: Optional[int] = None):
+    """Crawls url and its same-site links, yielding each page as it is fetched."""
+    kwargs = {}
+    if max_depth is not None:
+        kwargs["max_depth"] = max_depth
+    if max_pages is not None:
+        kwargs["max_pages"] = max_pages
+    async for page in Crawler(manifest=collection.manifest, **kwargs).crawl(url):
+        if page.not_modified:
+            print(f"Not modified: {page.url}")
+        elif not page.gone:
+            print(f"Crawled {len(page.text)} characters from {page.url}")
+        yield page
+
+
+def sync_page(collection: Collection, page: CrawledPage) -> tuple:
+    """
+    Brings the vector store in line with a freshly crawled page, embedding only
+    chunks that are new and deleting chunks that disappeared.
+    Returns (chunks added, chunks deleted).
+    """
+    vectorstore, manifest, keywords = collection.vectorstore, collection.manifest, collection.keywords
+    if page.gone:
+        stale = manifest.remove_page(page.url)
+        if stale:
+            vectorstore.delete(ids=list(stale))
+            keywords.delete(list(stale))
+        return 0, len(stale)
+
+    page_hash = content_hash(page.text) if not page.not_modified else None
+    if page.not_modified or page_hash == manifest.page_hash(page.url):
+        manifest.touch_page(page.url, page.etag, page.last_modified)
+        return 0, 0
+
+    # Keyed by ID so repeated chunks within a page are embedded once
+    with span("split"):
+        chunks = {chunk_id(page.url, chunk.text): chunk for chunk in chunk_blocks(page.blocks, page.url)}
+    indexed = manifest.chunk_ids(page.url)
+    new_ids = [i for i in chunks if i not in indexed]
+    stale = indexed - chunks.keys()
+    if new_ids:
+        texts, metadatas = [chunks[i].text for i in new_ids], [chunks[i].metadata for i in new_ids]
+        # Includes embedding the new chunks, also recorded on its own as "embed"
+        with span("index_write"):
+            vectorstore.add_texts(texts, metadatas=metadatas, ids=new_ids)
+            keywords.add(new_ids, texts, metadatas)
+    if stale:
+        vectorstore.delete(ids=list(stale))
+        keywords.delete(list(stale))
+    manifest.update_page(page.url, page.etag, page.last_modified, page_hash, page.links, chunks.keys())
+    return len(new_ids), len(stale)
+
+
+def create_retrieval_chain(vectorstore, keywords):
+    """Returns a QA chain that answers from the given vectorstore and its keyword index."""
+    from langchain.chains import RetrievalQA
+    from util.hybrid_retriever import HybridRetriever
+    from util.llm_clients import chat_model
 
-async def crawl_url(url):
-    """Fetches the page content and extracts text from paragraphs."""
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error if the request failed
-    except requests.RequestException as e:
-        print(f"Error fetching the URL: {e}")
-        return ""
-    soup = BeautifulSoup(response.text, "html.parser")
-    paragraphs = soup.find_all('p')
-    text_content = "\n".join(p.get_text() for p in paragraphs)
-    print(f"Crawled {len(text_content)} characters from {url}")
-    return text_content
-
-
-def create_retrieval_chain(document_text):
-    """Splits the text, builds embeddings, creates a Chroma vectorstore and returns a QA chain."""
-    splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=50)
-    docs = splitter.split_text(document_text)
-    
     # OpenAIEmbeddings will look for OPENAI_API_KEY in your environment variables.
     api_key = os.environ.get("OPENAI_API_KEY")  
-    embeddings = OpenAIEmbeddings()
     
-    # Create a Chroma vectorstore
-    vectorstore = Chroma.from_texts(docs, embeddings)
+    # Use ChatOpenAI instead of OpenAI for GPT-4, one instance on the shared connection pool for every collection
+    # stream_usage reports token counts for streamed answers too
+    llm = chat_model("gpt-4", api_key=api_key, stream_usage=True)
     
-    # Use ChatOpenAI instead of OpenAI for GPT-4
-    llm = ChatOpenAI(model_name="gpt-4", api_key=api_key)
-    
-    # Create a QA chain using the vectorstore as a retriever.
-    qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=vectorstore.as_retriever())
+    # Create a QA chain over hybrid (vector + BM25) retrieval.
+    retriever = HybridRetriever(vectorstore=vectorstore, keywords=keywords)
+    qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever)
     return qa_chain
+
+
+registry = CollectionRegistry(create_retrieval_chain)
+sessions = SessionStore()
+jobs = JobQueue(JobStore())
+jobs.register("crawl", crawl_job, workers=int(os.getenv("CRAWL_JOB_WORKERS", "2")))
@@ -1,54 +1,172 @@
-from fastapi import APIRouter,HTTPException
-from pydantic import BaseModel
-from io import BytesIO
+from fastapi import APIRouter, FastAPI, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
-from config.model import generate_image_serverless
-from PIL.Image import UnidentifiedImageError
+from pydantic import BaseModel
+from config.model import (HF_IMAGE_MODEL, IMAGE_BACKEND, LocalImageEngine, StepCallback, close_hf_client,
+                          generate_image_serverless)
+from util.executors import Overloaded, limiter, run_blocking
+from util.image_cache import CachedImage, ImageCache, cache_key
+from util.metrics import metrics, span
+from util.warmup import warmup
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+import asyncio
+import base64
+import json
 import os
 
 
 router = APIRouter()
 
+image_cache = ImageCache()
+local_engine = LocalImageEngine() if IMAGE_BACKEND == "local" else None
+# Generations in progress by cache key, so identical concurrent prompts share one
+_inflight: Dict[str, asyncio.Future] = {}
+# The local model load, started by the warm-up or the first request, whichever comes first
+_engine_load: Optional[asyncio.Future] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if local_engine is not None:
+        warmup.add("local_image_model", load_local_engine)
+    yield
+    await close_hf_client()
+
+
+async def _load_engine():
+    try:
+        await run_blocking(local_engine.load)
+        print(f"Loaded local image model {local_engine.model}")
+    except Exception as e:
+        print(f"Local image model unavailable, using the serverless API: {e}")
+
+
+async def load_local_engine() -> bool:
+    """Loads the local image model once; True if it's usable."""
+    global _engine_load
+    if local_engine is None:
+        return False
+    if _engine_load is None:
+        _engine_load = asyncio.ensure_future(_load_engine())
+    # A cancelled request mustn't cancel the load other requests are waiting on
+    await asyncio.shield(_engine_load)
+    return local_engine.ready
+
 
 # Define Pydantic model to handle prompt input
 class ImageRequest(BaseModel):
     prompt: str
 
+async def generate(prompt: str, token: str, on_step: Optional[StepCallback] = None):
+    """Generates with the local engine when it's loaded, otherwise (or if it fails) with the serverless API."""
+    # One image slot per generation, whichever backend serves it; a fallback keeps the slot it holds
+    async with limiter("image").slot():
+        if await load_local_engine():
+            try:
+                with span("image_generation", backend="local"):
+                    return (*await local_engine.generate(prompt, on_step), local_engine.model)
+            except Exception as e:
+                if not token:
+                    raise
+                print(f"Local image generation failed, falling back to the serverless API: {e}")
+        with span("image_generation", backend="serverless"):
+            return (*await generate_image_serverless(prompt, token), HF_IMAGE_MODEL)
+
+def active_model() -> str:
+    return local_engine.model if local_engine is not None and local_engine.ready else HF_IMAGE_MODEL
+
+async def cached_generation(prompt: str, token: str, on_step: Optional[StepCallback] = None) -> CachedImage:
+    key = cache_key(prompt, active_model())
+    image = await run_blocking(image_cache.get, key)
+    metrics.inc("image_cache_total", result="hit" if image is not None else "miss")
+    if image is not None:
+        return image
+    task = _inflight.get(key)
+    if task is None:
+        # Owned by _inflight rather than by this request, so a client that disconnects only stops
+        # waiting: the generation still finishes for everyone else on the key, and lands in the cache
+        task = _inflight[key] = asyncio.ensure_future(_generate_and_cache(prompt, token, on_step))
+        task.add_done_callback(lambda done: _generation_done(key, done))
+    return await asyncio.shield(task)
+
+async def _generate_and_cache(prompt: str, token: str, on_step: Optional[StepCallback]) -> CachedImage:
+    data, media_type, model = await generate(prompt, token, on_step)
+    return await run_blocking(image_cache.put, cache_key(prompt, model), data, media_type)
+
+def _generation_done(key: str, task: asyncio.Future):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Waiters get the exception; mark it retrieved in case every one of them has gone
+    if not task.cancelled():
+        task.exception()
+
+@router.get("/serverless-image-generation/")
 @router.post("/serverless-image-generation/")#, tags=["Image Generation"])
-async def serverless_image_generation(prompt: str):
+async def serverless_image_generation(prompt: str, request: Request):
    # prompt = request.prompt
    # Initiate the huggingface API token
     TOKEN =os.environ.get("HF_API_TOKEN")
 
     try:
-        image = generate_image_serverless(prompt, TOKEN)
-        
-        # Convert the image to bytes for streaming response
-        buffer = BytesIO()
-        try:
-            image.save(buffer, format="PNG")
-        except UnidentifiedImageError:
-            raise HTTPException(status_code=500, detail="Failed to encode the generated image")
-        except AttributeError:
-            raise HTTPException(status_code=500, detail="Invalid image object returned from generation")
-            
-        buffer.seek(0)
-        
-        headers = {
-            'Content-Disposition': 'inline; filename="generated_image.png"',
-            'Cache-Control': 'no-cache, no-store, must-revalidate',
-            'Pragma': 'no-cache',
-            'Expires': '0'
-        }
-        
-        return StreamingResponse(
-            buffer, 
-            media_type="image/png",
-           headers=headers
-        )
+        image = await cached_generation(prompt, TOKEN)
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail=f"Image generation failed: {str(e)}"
         )
-    
+
+    # The same prompt and model always map to the same cached bytes, so clients may reuse them
+    etag = f'"{image.etag}"'
+    headers = {
+        'Content-Disposition': f'inline; filename="generated_image.{image.extension}"',
+        'Cache-Control': 'public, max-age=86400',
+        'ETag': etag,
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    # The API's bytes are sent as they are, no decode and re-encode
+    return Response(content=image.data, media_type=image.media_type, headers=headers)
+
+@router.get("/serverless-image-generation/stream")
+async def serverless_image_generation_stream(prompt: str):
+    """
+    Server-Sent Events variant: a `progress` event per denoising step (with a
+    base64 PNG preview when the local engine provides one), then an `image`
+    event with the base64 image, or an `error` event. Cached and serverless
+    results arrive as a single `image` event.
+    """
+    TOKEN = os.environ.get("HF_API_TOKEN")
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_step(step: int, steps: int, preview: Optional[bytes]):
+        # Called from the inference thread
+        data: Dict[str, Any] = {"step": step, "steps": steps}
+        if preview is not None:
+            data["preview"] = base64.b64encode(preview).decode()
+        loop.call_soon_threadsafe(events.put_nowait, ("progress", data))
+
+    async def run():
+        try:
+            image = await cached_generation(prompt, TOKEN, on_step)
+            await events.put(("image", {"media_type": image.media_type, "etag": image.etag,
+                                        "data": base64.b64encode(image.data).decode()}))
+        except Exception as e:
+            await events.put(("error", {"detail": f"Image generation failed: {str(e)}"}))
+
+    async def stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await events.get()
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event != "progress":
+                    return
+        finally:
+            # Cancelling doesn't stop a batch already denoising, only drops this request's result
+            task.cancel()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
@@ -0,0 +1,48 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+
+from util.jobs import JobQueue
+
+
+def create_router(jobs: JobQueue) -> APIRouter:
+    """Status, listing, cancellation and live progress endpoints for a job queue."""
+    router = APIRouter()
+
+    @router.get("/jobs")
+    async def list_jobs(status: Optional[str] = None, limit: int = 50):
+        return {"jobs": jobs.store.list(status, min(limit, 500))}
+
+    @router.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        job = jobs.store.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job.")
+        return job
+
+    @router.post("/jobs/{job_id}/cancel")
+    async def cancel_job(job_id: str):
+        status = jobs.cancel(job_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Unknown job.")
+        return {"job_id": job_id, "status": status}
+
+    @router.websocket("/jobs/{job_id}/events")
+    async def job_events(websocket: WebSocket, job_id: str):
+        """Sends the job as JSON whenever its status or progress changes, then closes once it has finished."""
+        await websocket.accept()
+        try:
+            found = False
+            async for job in jobs.watch(job_id):
+                found = True
+                await websocket.send_json(job)
+            if not found:
+                await websocket.send_json({"job_id": job_id, "error": "Unknown job."})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if websocket.client_state == WebSocketState.CONNECTED:
+                await websocket.close()
+
+    return router
@@ -1,27 +1,42 @@
+import asyncio
+from typing import List
+
 from fastapi import FastAPI
 from pydantic import BaseModel
 
+from util.code_search import CodeSearcher
+from util.code_resolver import vote
+
 app = FastAPI()
 # Assume preprocessor, embedder, qdrant_client, collection_name are already defined (from above)
+searcher = CodeSearcher(qdrant_client, collection_name, embedder, limit=5)
 
 class QueryRequest(BaseModel):
     external_code: str
     description: str
 
+class BatchQueryRequest(BaseModel):
+    items: List[QueryRequest]
+
 @app.post("/query/")
 async def query_internal_code(request: QueryRequest):
     text = f"{request.external_code} {request.description}"
     clean = preprocessor.clean_text(text)
-    query_vec = embedder.encode([clean])[0]  # get first (and only) embedding
 
-    # Search Qdrant for nearest neighbors
-    results = qdrant_client.search(
-        collection_name=collection_name,
-        query_vector=query_vec.tolist(),
-        limit=5
-    )
+    # Concurrent requests are embedded in one forward pass and searched together
+    results = await searcher.search(clean)
 
+    return prediction(results)
+
+def prediction(results) -> dict:
     # Collect predicted internal codes from top hits
     internal_codes = [hit.payload["internal_code"] for hit in results]
-    # (Optionally pick a majority or the first one as final prediction)
-    return {"predicted_internal_codes": internal_codes}
\ No newline at end of file
+    # Similarity-weighted majority as the final prediction
+    internal_code, score = vote(results)
+    return {"predicted_internal_codes": internal_codes, "internal_code": internal_code, "vote_score": score}
+
+@app.post("/query/batch")
+async def query_internal_codes_batch(request: BatchQueryRequest):
+    texts = [preprocessor.clean_text(f"{item.external_code} {item.description}") for item in request.items]
+    results = await asyncio.to_thread(searcher.search_texts, texts)
+    return {"results": [prediction(hits) for hits in results]}
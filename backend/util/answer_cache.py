@@ -0,0 +1,65 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))
+
+
+class AnswerCache:
+    """
+    Semantic cache of answers for one collection. A question whose embedding
+    has cosine similarity >= threshold with a cached question gets that
+    question's answer back. Every change to the collection bumps the
+    generation, dropping all entries and any answer still being computed
+    against the old content.
+    """
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # question -> (unit vector, answer)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, vector: Sequence[float]) -> Optional[Dict[str, Any]]:
+        query = self._unit(vector)
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+            questions = list(self._entries)
+            matrix = np.stack([self._entries[q][0] for q in questions])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(questions[best])
+            return self._entries[questions[best]][1]
+
+    def store(self, question: str, vector: Sequence[float], answer: Dict[str, Any], generation: int):
+        """Caches answer unless the collection changed since generation was read."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[question] = (self._unit(vector), answer)
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
@@ -0,0 +1,105 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from util.tokens import count_tokens, split_tokens
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class Block:
+    """One piece of page content, tagged with the headings it sits under."""
+    kind: str  # paragraph, list, code or table
+    text: str
+    headings: Tuple[str, ...] = ()
+
+
+@dataclass
+class Chunk:
+    text: str
+    metadata: Dict[str, str] = field(default_factory=dict)
+
+
+def page_text(blocks: List[Block]) -> str:
+    """Flat text of a page, one line per block with its section title. Used for change detection and logging."""
+    lines = []
+    section = None
+    for block in blocks:
+        if block.headings != section:
+            section = block.headings
+            if section:
+                lines.append("#" * len(section) + " " + section[-1])
+        lines.append(block.text)
+    return "\n".join(lines)
+
+
+def _split_block(block: Block, max_tokens: int) -> List[str]:
+    """Splits an oversized block on lines (code, tables) or sentences (prose), cutting by tokens as a last resort."""
+    units = block.text.split("\n") if block.kind in ("code", "table") else _SENTENCE_END.split(block.text)
+    joiner = "\n" if block.kind in ("code", "table") else " "
+    pieces, current, used = [], [], 0
+    for unit in units:
+        tokens = count_tokens(unit)
+        if current and used + tokens > max_tokens:
+            pieces.append(joiner.join(current))
+            current, used = [], 0
+        if tokens > max_tokens:
+            pieces.extend(split_tokens(unit, max_tokens))
+            continue
+        current.append(unit)
+        used += tokens
+    if current:
+        pieces.append(joiner.join(current))
+    return pieces
+
+
+def chunk_blocks(blocks: List[Block], source: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[Chunk]:
+    """
+    Packs a page's blocks into chunks of at most max_tokens tokens. Chunks
+    never cross a section boundary and only split a block when the block
+    alone is too large. Each chunk starts with its heading path so that both
+    the embedding and BM25 see the section it came from, cut to half of
+    max_tokens for deeply nested or long headings. The full path is also
+    kept as metadata.
+    """
+    chunks: List[Chunk] = []
+    current: List[str] = []
+    used = 0
+    section: Tuple[str, ...] = ()
+    prefix = ""
+    budget = max_tokens
+
+    def flush():
+        nonlocal current, used
+        if current:
+            body = "\n".join(current)
+            chunks.append(Chunk(f"{prefix}\n\n{body}" if prefix else body,
+                                {"source": source, "headings": " > ".join(section)}))
+        current, used = [], 0
+
+    for block in blocks:
+        if block.headings != section:
+            flush()
+            section = block.headings
+            prefix = " > ".join(section)
+            if count_tokens(prefix) > max_tokens // 2:
+                prefix = split_tokens(prefix, max_tokens // 2)[0] if max_tokens > 1 else ""
+            # The blank line after the prefix costs two tokens; always leave room for some body
+            budget = max(max_tokens - (count_tokens(prefix) + 2 if prefix else 0), 1)
+        tokens = count_tokens(block.text)
+        if tokens > budget:
+            flush()
+            for piece in _split_block(block, budget):
+                current, used = [piece], 0
+                flush()
+            continue
+        if current and used + tokens > budget:
+            flush()
+        current.append(block.text)
+        used += tokens + 1  # the newline joining blocks
+    flush()
+    return chunks
@@ -0,0 +1,99 @@
+import os
+import math
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from util.metrics import count_llm_tokens, span
+
+# Vote scores at or above this answer without the LLM. The score isn't a probability: the "vote"
+# benchmark scenario measures how often a threshold skips the LLM and how often those answers are
+# wrong. 0.3 is the lowest with no wrong answers on its labelled lookups; re-measure on real data
+VOTE_SCORE_THRESHOLD = float(os.getenv("VOTE_SCORE_THRESHOLD", "0.3"))
+VOTE_WEIGHT_POWER = float(os.getenv("VOTE_WEIGHT_POWER", "4"))
+LLM_MODEL = os.getenv("CODE_RESOLVER_LLM_MODEL", "gpt-4o-mini")
+LLM_MAX_CONCURRENCY = int(os.getenv("CODE_RESOLVER_LLM_CONCURRENCY", "8"))
+
+
+def vote(hits, power: float = VOTE_WEIGHT_POWER) -> Tuple[Any, float]:
+    """
+    Similarity-weighted vote over the neighbours' internal codes. Each hit
+    weighs score**power, so near-duplicates dominate distant neighbours.
+    Returns the winner and its score: its vote share scaled by its best
+    similarity, so five agreeing but remote neighbours don't score high.
+    The score ranks lookups by how clear-cut they are; it is a heuristic,
+    not a calibrated probability of being right.
+    """
+    weights: Dict[Any, float] = defaultdict(float)
+    best: Dict[Any, float] = defaultdict(float)
+    for hit in hits:
+        code = hit.payload.get("internal_code")
+        score = max(hit.score, 0.0)
+        weights[code] += score ** power
+        best[code] = max(best[code], score)
+    total = sum(weights.values())
+    if not total:
+        return None, 0.0
+    code = max(weights, key=weights.get)
+    return code, (weights[code] / total) * best[code]
+
+
+class CodeResolver:
+    """
+    Tiered internal-code prediction: a nearest-neighbour vote answers
+    unambiguous lookups immediately, and only the rest are escalated to the
+    LLM through an async client with a concurrency cap.
+    """
+    def __init__(self, llm_client=None, model: str = LLM_MODEL, threshold: float = VOTE_SCORE_THRESHOLD,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.llm_client = llm_client
+        self.model = model
+        self.threshold = threshold
+        self._llm_slots = asyncio.Semaphore(max_concurrency)
+
+    async def resolve(self, external_code: str, description: str, hits) -> Dict[str, Any]:
+        if not hits:
+            return {"internal_code": None, "score": 0.0, "source": "none"}
+        code, score = vote(hits)
+        if score >= self.threshold or self.llm_client is None:
+            return {"internal_code": code, "score": score, "source": "vote"}
+        async with self._llm_slots:
+            code, llm_confidence = await self._ask_llm(external_code, description, hits)
+        return {"internal_code": code, "confidence": llm_confidence, "source": "llm"}
+
+    async def resolve_many(self, items: List[Tuple[str, str]], hits: List[list]) -> List[Dict[str, Any]]:
+        return await asyncio.gather(*(self.resolve(ext, desc, h) for (ext, desc), h in zip(items, hits)))
+
+    async def _ask_llm(self, external_code: str, description: str, hits) -> Tuple[str, Optional[float]]:
+        # Build context from top results
+        context = "\n".join(
+            f"External: {hit.payload.get('external_code','')}, Description: {hit.payload.get('description','')}, "
+            f"Internal: {hit.payload.get('internal_code','')}"
+            for hit in hits
+        )
+
+        # Prepare LLM prompt (classification of internal code)
+        prompt = (
+            f"Context of similar entries:\n{context}\n\n"
+            f"Given the external code '{external_code}' and description '{description}', "
+            "predict the *internal code*. Answer with the code only."
+        )
+
+        # Call OpenAI (using chat completion with logprobs for confidence)
+        with span("llm", model=self.model):
+            response = await self.llm_client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.0,
+                max_tokens=10,
+                logprobs=True,
+            )
+        if response.usage is not None:
+            count_llm_tokens(self.model, response.usage.prompt_tokens, response.usage.completion_tokens)
+        choice = response.choices[0]
+        code_prediction = choice.message.content.strip()
+
+        # Compute confidence from the first token's logprob (as exp(logprob))
+        tokens = choice.logprobs.content if choice.logprobs else None
+        confidence = math.exp(tokens[0].logprob) if tokens else None
+        return code_prediction, confidence
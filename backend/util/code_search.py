@@ -0,0 +1,85 @@
+import os
+from typing import List, Optional, Sequence, Tuple
+
+from qdrant_client.http.models import FieldCondition, Filter, MatchAny, SearchRequest
+
+from util.metrics import span
+from util.microbatch import MicroBatcher
+
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "512"))
+
+# Restricts a search to points with one of these internal codes, None for no restriction
+CodeFilter = Optional[Tuple[str, ...]]
+
+
+def code_filter(internal_codes: CodeFilter) -> Optional[Filter]:
+    if not internal_codes:
+        return None
+    return Filter(must=[FieldCondition(key="internal_code", match=MatchAny(any=list(internal_codes)))])
+
+
+class CodeSearcher:
+    """
+    Nearest-neighbour lookup of product codes in Qdrant. Texts are always
+    embedded in batches and searched with one search_batch call; single
+    lookups from concurrent requests are coalesced by a MicroBatcher.
+    With a payload store, searches return point IDs only and payloads are
+    read from the store's memory maps.
+    """
+    def __init__(self, client, collection_name: str, embedder, limit: int = 5,
+                 batch_size: int = QUERY_BATCH_SIZE, payloads=None):
+        self.client = client
+        self.collection = collection_name
+        self.embedder = embedder
+        self.limit = limit
+        self.batch_size = batch_size
+        self.payloads = payloads
+        self.batcher = MicroBatcher(self._search_items)
+
+    def search_texts(self, texts: List[str], filters: Optional[Sequence[CodeFilter]] = None) -> List[list]:
+        """Returns the top hits for every (already cleaned) text, in order, each optionally filtered."""
+        filters = filters or [None] * len(texts)
+        hits = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors = self.embedder.encode(texts[start:start + self.batch_size])
+            with span("vector_search"):
+                hits.extend(self.client.search_batch(
+                    collection_name=self.collection,
+                    requests=[SearchRequest(vector=vec.tolist(), limit=self.limit, filter=code_filter(codes),
+                                            with_payload=self.payloads is None)
+                              for vec, codes in zip(vectors, filters[start:start + self.batch_size])],
+                ))
+        if self.payloads is not None:
+            self._attach_payloads([hit for row in hits for hit in row])
+        return hits
+
+    def _search_items(self, items: List[Tuple[str, CodeFilter]]) -> List[list]:
+        return self.search_texts([text for text, _ in items], [codes for _, codes in items])
+
+    def _attach_payloads(self, hits: list):
+        if not hits:
+            return
+        with span("payload_lookup"):
+            for hit, payload in zip(hits, self.payloads.get([str(hit.id) for hit in hits])):
+                hit.payload = payload
+        # Points ingested before the payload store existed still carry their payload in Qdrant
+        missing = [hit for hit in hits if hit.payload is None]
+        if missing:
+            stored = {str(p.id): p.payload for p in self.client.retrieve(
+                collection_name=self.collection, ids=list({str(hit.id) for hit in missing}), with_payload=True)}
+            for hit in missing:
+                hit.payload = stored.get(str(hit.id)) or {}
+
+    def exact(self, external_code: str) -> Optional[str]:
+        """
+        The internal code of rows with exactly this (cleaned) external code,
+        from the payload store's index. None without a store, without a
+        match, or when matching rows disagree.
+        """
+        if self.payloads is None or not external_code:
+            return None
+        codes = self.payloads.distinct("external_code", external_code, "internal_code")
+        return codes.pop() if len(codes) == 1 else None
+
+    async def search(self, text: str, internal_codes: Optional[Sequence[str]] = None) -> list:
+        return await self.batcher.submit((text, tuple(internal_codes) if internal_codes else None))
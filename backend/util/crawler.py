@@ -0,0 +1,211 @@
+import os
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import urljoin, urldefrag, urlparse
+
+import httpx
+from selectolax.lexbor import LexborHTMLParser
+
+from util.manifest import CrawlManifest
+from util.chunking import Block, page_text
+from util.executors import run_cpu
+from util.metrics import span
+
+# Crawl defaults, overridable per request
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "1"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "4"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "10"))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "agentic-crawler/1.0")
+
+# One pooled client per process, shared by every crawl
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared pooled async HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(CRAWL_TIMEOUT),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            headers={"User-Agent": CRAWL_USER_AGENT},
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+@dataclass
+class CrawledPage:
+    url: str
+    text: str
+    depth: int
+    links: List[str] = field(default_factory=list)
+    blocks: List[Block] = field(default_factory=list)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False  # server answered 304, text is empty
+    gone: bool = False  # server answered 404/410, indexed chunks are stale
+
+
+_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_PROSE = {"p", "blockquote", "dt", "dd", "figcaption"}
+# Page chrome and non-content elements
+_SKIP = {"script", "style", "noscript", "template", "svg", "nav", "footer", "aside", "form", "head"}
+
+
+def _table_text(table) -> str:
+    rows = []
+    for tr in table.css("tr"):
+        cells = [cell.text(deep=True, separator=" ", strip=True) for cell in tr.css("th, td")]
+        if any(cells):
+            rows.append(" | ".join(cells))
+    return "\n".join(rows)
+
+
+def extract_page(html: str, base_url: str) -> Tuple[List[Block], List[str]]:
+    """
+    Extracts content blocks (paragraphs, list items, code, tables) under their
+    heading path, in document order, plus absolute, fragment-free links.
+    Uses the lexbor parser, which is much faster than BeautifulSoup's html.parser.
+    """
+    tree = LexborHTMLParser(html)
+    blocks: List[Block] = []
+    headings: List[Tuple[int, str]] = []
+    # Explicit stack in document order, deep DOMs would exhaust the recursion limit
+    stack = [tree.body] if tree.body is not None else []
+    while stack:
+        node = stack.pop()
+        tag = node.tag
+        if tag in _SKIP:
+            continue
+        if tag in _HEADINGS:
+            title = node.text(deep=True, separator=" ", strip=True)
+            if title:
+                level = _HEADINGS[tag]
+                headings = [h for h in headings if h[0] < level] + [(level, title)]
+            continue
+        if tag in _PROSE or tag in ("li", "pre", "table"):
+            if tag == "pre":
+                kind, text = "code", node.text(deep=True).strip("\n")
+            elif tag == "table":
+                kind, text = "table", _table_text(node)
+            else:
+                kind, text = ("list" if tag == "li" else "paragraph"), " ".join(node.text(deep=True).split())
+                if tag == "li" and text:
+                    text = f"- {text}"
+            if text.strip():
+                blocks.append(Block(kind, text, tuple(title for _, title in headings)))
+            continue
+        stack.extend(reversed(list(node.iter(include_text=False))))
+
+    links = []
+    for a in tree.css("a[href]"):
+        link, _ = urldefrag(urljoin(base_url, a.attributes.get("href") or ""))
+        if link.startswith(("http://", "https://")):
+            links.append(link)
+    return blocks, links
+
+
+class Crawler:
+    """
+    Breadth-first, same-site crawler on a pooled async HTTP client.
+    Pages are yielded as soon as they are fetched so callers can chunk them
+    while the rest of the site is still downloading.
+    With a manifest, requests are conditional and unchanged pages come back
+    as not_modified with their previously recorded links.
+    """
+    def __init__(self, max_depth: int = CRAWL_MAX_DEPTH, max_pages: int = CRAWL_MAX_PAGES,
+                 per_host_concurrency: int = CRAWL_PER_HOST_CONCURRENCY, timeout: float = CRAWL_TIMEOUT,
+                 client: Optional[httpx.AsyncClient] = None, manifest: Optional[CrawlManifest] = None):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.per_host_concurrency = per_host_concurrency
+        self.timeout = timeout
+        self.client = client or get_http_client()
+        self.manifest = manifest
+        self._host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host_concurrency))
+
+    async def fetch(self, url: str) -> Optional[httpx.Response]:
+        host = urlparse(url).netloc
+        headers = self.manifest.validators(url) if self.manifest else {}
+        async with self._host_limits[host]:
+            try:
+                with span("crawl_fetch"):
+                    response = await self.client.get(url, headers=headers, timeout=self.timeout)
+                if response.status_code in (304, 404, 410):
+                    return response
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                print(f"Error fetching the URL {url}: {e}")
+                return None
+        if "html" not in response.headers.get("content-type", "text/html"):
+            return None
+        return response
+
+    async def crawl(self, start_url: str) -> AsyncIterator[CrawledPage]:
+        start_url, _ = urldefrag(start_url)
+        site = urlparse(start_url).netloc
+        seen = {start_url}
+        frontier: asyncio.Queue = asyncio.Queue()
+        results: asyncio.Queue = asyncio.Queue()
+        frontier.put_nowait((start_url, 0))
+
+        async def worker():
+            while True:
+                url, depth = await frontier.get()
+                try:
+                    response = await self.fetch(url)
+                    if response is None:
+                        continue
+                    validators = dict(etag=response.headers.get("etag"),
+                                      last_modified=response.headers.get("last-modified"))
+                    if response.status_code in (404, 410):
+                        await results.put(CrawledPage(url=url, text="", depth=depth, gone=True))
+                        continue
+                    if response.status_code == 304:
+                        links = self.manifest.links(url) if self.manifest else []
+                        await results.put(CrawledPage(url=url, text="", depth=depth, links=links,
+                                                      not_modified=True, **validators))
+                    else:
+                        # Parsing is CPU-bound, keep it off the event loop and out of this process's GIL
+                        with span("html_parse"):
+                            blocks, links = await run_cpu(extract_page, response.text, str(response.url))
+                        await results.put(CrawledPage(url=url, text=page_text(blocks), depth=depth, links=links,
+                                                      blocks=blocks, **validators))
+                    if depth >= self.max_depth:
+                        continue
+                    for link in links:
+                        if len(seen) >= self.max_pages:
+                            break
+                        if link in seen or urlparse(link).netloc != site:
+                            continue
+                        seen.add(link)
+                        frontier.put_nowait((link, depth + 1))
+                except Exception as e:
+                    print(f"Error crawling {url}: {e}")
+                finally:
+                    frontier.task_done()
+
+        async def close_when_drained():
+            await frontier.join()
+            await results.put(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.per_host_concurrency)]
+        closer = asyncio.create_task(close_when_drained())
+        try:
+            while (page := await results.get()) is not None:
+                yield page
+        finally:
+            closer.cancel()
+            for w in workers:
+                w.cancel()
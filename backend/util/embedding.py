@@ -1,8 +1,17 @@
-from sentence_transformers import SentenceTransformer
+import numpy as np
+
+from util.embedding_backend import EMBEDDING_BACKEND, encode_bucketed, load_model
+from util.embedding_cache import EmbeddingCache, get_embedding_cache
 
 class Embedder:
-    def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2", cache: EmbeddingCache = None,
+                 backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.model = load_model(model_name, backend)  # "torch" or int8 "onnx", same vectors API
         self.dim = self.model.get_sentence_embedding_dimension()  # 384 for this model
+        self.cache = cache or get_embedding_cache()
+        self.cache_namespace = f"{self.model_name}@{backend}"  # quantized vectors differ slightly
     def encode(self, texts: list[str]) -> list[list[float]]:
-        return self.model.encode(texts, convert_to_numpy=True)
\ No newline at end of file
+        # Only texts the cache hasn't seen go through the model
+        vectors = self.cache.embed(self.cache_namespace, texts, lambda todo: encode_bucketed(self.model, todo))
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
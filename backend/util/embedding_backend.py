@@ -0,0 +1,127 @@
+import os
+import argparse
+from typing import List, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+# "torch" runs the reference float32 model, "onnx" an int8-quantized ONNX export of it
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 keeps the runtime default
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+EMBEDDING_TOKEN_BUDGET = int(os.getenv("EMBEDDING_TOKEN_BUDGET", "16384"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "256"))
+
+
+def load_model(model_name: str, backend: str = EMBEDDING_BACKEND, threads: int = EMBEDDING_THREADS) -> SentenceTransformer:
+    """Loads model_name on CPU with the selected inference backend and intra-op thread count."""
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name, device="cpu")
+    if backend == "onnx":
+        import onnxruntime as ort
+        session_options = ort.SessionOptions()
+        if threads:
+            session_options.intra_op_num_threads = threads
+        return SentenceTransformer(
+            model_name,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={
+                "file_name": EMBEDDING_ONNX_FILE,
+                "provider": "CPUExecutionProvider",
+                "session_options": session_options,
+            },
+        )
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def export_quantized(model_name: str, output_dir: str, config: str = "avx512_vnni"):
+    """
+    Exports model_name to ONNX and writes a dynamically int8-quantized copy
+    under output_dir/onnx, for models whose hub repo doesn't ship one.
+    Point the model name at output_dir and EMBEDDING_ONNX_FILE at the result.
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+    model.save(output_dir)
+    export_dynamic_quantized_onnx_model(model, config, output_dir)
+
+
+def encode_bucketed(model: SentenceTransformer, texts: List[str], token_budget: int = EMBEDDING_TOKEN_BUDGET,
+                    max_batch: int = EMBEDDING_MAX_BATCH) -> np.ndarray:
+    """
+    Encodes texts in length buckets: texts are sorted by length and batched so
+    that batch size x longest text stays within token_budget. Short texts go
+    in large batches, long ones in small batches, and little compute is spent
+    on padding. Results are returned in input order.
+    """
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    # ~4 characters per token is close enough for bucketing and avoids a tokenizer pass
+    lengths = [max(1, len(t) // 4) for t in texts]
+    order = sorted(range(len(texts)), key=lengths.__getitem__)
+    out = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+    batch: List[int] = []
+    for i in order:
+        # Sorted ascending, so the newest text is the longest in the batch
+        if batch and ((len(batch) + 1) * lengths[i] > token_budget or len(batch) >= max_batch):
+            out[batch] = model.encode([texts[j] for j in batch], batch_size=len(batch), convert_to_numpy=True,
+                                      show_progress_bar=False)
+            batch = []
+        batch.append(i)
+    out[batch] = model.encode([texts[j] for j in batch], batch_size=len(batch), convert_to_numpy=True,
+                              show_progress_bar=False)
+    return out
+
+
+def agreement(model_name: str, texts: List[str], backend: str = "onnx", threads: int = EMBEDDING_THREADS) -> dict:
+    """Cosine agreement of a backend's embeddings with the reference PyTorch model on texts."""
+    reference = encode_bucketed(load_model(model_name, "torch", threads), texts)
+    candidate = encode_bucketed(load_model(model_name, backend, threads), texts)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate /= np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = np.sum(reference * candidate, axis=1)
+    return {
+        "texts": len(texts),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "p01_cosine": float(np.percentile(cosine, 1)),
+    }
+
+
+SAMPLE_TEXTS = [
+    "schraube m8 x 40 verzinkt din 933",
+    "sechskantmutter m8 edelstahl a2",
+    "kugellager 6204 2rs c3",
+    "hydraulic hose 1/2 inch 2 wire braided",
+    "led panel 60x60 40w neutralweiss",
+    "kabelbinder schwarz 200 x 4 8 mm uv bestaendig",
+    "stainless steel washer m10 din 125",
+    "druckluftkupplung nw 7 2 mit 1 4 zoll aussengewinde",
+]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Check a CPU embedding backend against the reference model.")
+    parser.add_argument("--model", default="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    parser.add_argument("--backend", default="onnx")
+    parser.add_argument("--texts", help="file with one sample text per line (defaults to built-in samples)")
+    parser.add_argument("--threads", type=int, default=EMBEDDING_THREADS)
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="fail if any text agrees less than this")
+    args = parser.parse_args(argv)
+
+    texts = SAMPLE_TEXTS
+    if args.texts:
+        with open(args.texts) as f:
+            texts = [line.strip() for line in f if line.strip()]
+    report = agreement(args.model, texts, args.backend, args.threads)
+    print(report)
+    if report["min_cosine"] < args.min_cosine:
+        raise SystemExit(f"{args.backend} backend disagrees with the reference model (min cosine {report['min_cosine']:.4f})")
+
+
+if __name__ == "__main__":
+    main()
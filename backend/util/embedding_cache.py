@@ -0,0 +1,171 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from util.preprocess import DataPreprocessor
+from util.metrics import metrics, span
+from util.tokens import count_tokens
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite")
+EMBEDDING_CACHE_LRU_SIZE = int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", "10000"))
+
+_preprocessor = DataPreprocessor()
+
+
+def cache_key(text: str) -> str:
+    """
+    Hash of the text as normalized by DataPreprocessor.clean_text, so case,
+    punctuation and whitespace variants share one embedding. Text whose
+    letters don't survive cleaning (non-Latin scripts, accents) is hashed
+    as-is instead, otherwise unrelated strings would collapse to one key.
+    """
+    clean = _preprocessor.clean_text(text)
+    translated = text.translate(_preprocessor.umlaut_map)
+    if not clean or sum(c.isalnum() for c in translated) != sum(c.isalnum() for c in clean):
+        clean = text
+    return hashlib.sha256(clean.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache keyed by (model, cache_key(text)): an in-process
+    LRU in front of a SQLite table of float32 vectors.
+    """
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, lru_size: int = EMBEDDING_CACHE_LRU_SIZE):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lru_size = lru_size
+        self.hits = 0
+        self.misses = 0
+        self._lru: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                vec BLOB NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+        """)
+        self._conn.commit()
+
+    def _remember(self, model: str, key: str, vec: np.ndarray):
+        self._lru[(model, key)] = vec
+        self._lru.move_to_end((model, key))
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, model: str, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vec = self._lru.get((model, key))
+                if vec is not None:
+                    self._lru.move_to_end((model, key))
+                    found[key] = vec
+                else:
+                    missing.append(key)
+            unique_missing = list(dict.fromkeys(missing))
+            for start in range(0, len(unique_missing), 500):
+                batch = unique_missing[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                    (model, *batch),
+                ).fetchall()
+                for key, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vec
+                    self._remember(model, key, vec)
+            result = [found.get(key) for key in keys]
+            hits = sum(v is not None for v in result)
+            self.hits += hits
+            self.misses += len(result) - hits
+        return result
+
+    def put_many(self, model: str, keys: Sequence[str], vectors: Sequence[Sequence[float]]):
+        rows = []
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                vec = np.asarray(vector, dtype=np.float32)
+                self._remember(model, key, vec)
+                rows.append((model, key, vec.tobytes()))
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+
+    def embed(self, model: str, texts: Sequence[str],
+              embed_fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> List[np.ndarray]:
+        """Returns one vector per text, calling embed_fn only for distinct cache misses."""
+        keys = [cache_key(t) for t in texts]
+        vectors = self.get_many(model, keys)
+        todo: Dict[str, str] = {}
+        for key, text, vec in zip(keys, texts, vectors):
+            if vec is None:
+                todo.setdefault(key, text)
+        metrics.inc("embeddings_total", len(texts) - len(todo), model=model, result="cached")
+        if todo:
+            metrics.inc("embeddings_total", len(todo), model=model, result="computed")
+            with span("embed", model=model):
+                computed = embed_fn(list(todo.values()))
+            self.put_many(model, list(todo), computed)
+            fresh = dict(zip(todo, (np.asarray(v, dtype=np.float32) for v in computed)))
+            vectors = [vec if vec is not None else fresh[key] for key, vec in zip(keys, vectors)]
+        return vectors
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "lru_entries": len(self._lru),
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide cache shared by the RAG chain and both Embedder classes."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain Embeddings wrapper that serves repeated texts from an EmbeddingCache."""
+    def __init__(self, embeddings: Embeddings, model: str, cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache or get_embedding_cache()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.embed(self.model, texts, self._billed(self.embeddings.embed_documents))
+        return [v.tolist() for v in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        embed = self._billed(lambda t: [self.embeddings.embed_query(t[0])])
+        return self.cache.embed(self.model, [text], embed)[0].tolist()
+
+    def _billed(self, embed_fn):
+        # Only cache misses reach the API, so only they are counted
+        def embed(texts: List[str]):
+            metrics.inc("embedding_tokens_total", sum(count_tokens(t) for t in texts), model=self.model)
+            return embed_fn(texts)
+        return embed
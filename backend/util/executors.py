@@ -0,0 +1,128 @@
+import os
+import asyncio
+import functools
+import contextvars
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Threads for blocking I/O and GIL-releasing work (HTTP clients, SQLite, Chroma, numpy)
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "32"))
+# Processes for pure-Python CPU work such as HTML parsing and chunking
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+# Per-endpoint (max concurrent, max waiting, Retry-After seconds), overridable
+# with <NAME>_MAX_CONCURRENCY, <NAME>_MAX_QUEUE and <NAME>_RETRY_AFTER
+ENDPOINT_DEFAULTS = {
+    "ask": (16, 32, 1),
+    "voice": (8, 0, 5),
+    "image": (2, 4, 10),
+}
+
+_blocking_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_limiters: Dict[str, "EndpointLimiter"] = {}
+
+
+def blocking_pool() -> ThreadPoolExecutor:
+    global _blocking_pool
+    if _blocking_pool is None:
+        _blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+    return _blocking_pool
+
+
+def cpu_pool() -> ProcessPoolExecutor:
+    global _cpu_pool
+    if _cpu_pool is None:
+        # Forking a process that already runs threads and an event loop is unsafe
+        _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _cpu_pool
+
+
+def install(loop: Optional[asyncio.AbstractEventLoop] = None):
+    """
+    Makes the sized blocking pool the loop's default executor, so
+    asyncio.to_thread and LangChain's sync-in-async fallbacks share it
+    instead of the small implicit default.
+    """
+    (loop or asyncio.get_running_loop()).set_default_executor(blocking_pool())
+
+
+def shutdown():
+    global _blocking_pool, _cpu_pool
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
+    if _blocking_pool is not None:
+        _blocking_pool.shutdown(wait=False, cancel_futures=True)
+        _blocking_pool = None
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking call in the blocking thread pool, in the caller's context (so its spans are traced)."""
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(blocking_pool(), call)
+
+
+async def run_cpu(fn: Callable[..., T], *args) -> T:
+    """Runs a CPU-bound, picklable module-level function in the process pool."""
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool(), fn, *args)
+
+
+class Overloaded(Exception):
+    """An endpoint is at its concurrency limit and its wait queue is full."""
+    def __init__(self, endpoint: str, retry_after: int):
+        super().__init__(f"Too many concurrent {endpoint} requests, retry in {retry_after}s.")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class EndpointLimiter:
+    """
+    Caps how many requests of one endpoint run at once. Up to max_waiting more
+    wait for a slot; beyond that requests are rejected with Overloaded, which
+    the app turns into 429 with Retry-After, instead of queueing unboundedly.
+    """
+    def __init__(self, name: str, max_concurrent: int, max_waiting: int, retry_after: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.retry_after = retry_after
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._waiting = 0
+
+    async def acquire(self):
+        if self._slots.locked() and self._waiting >= self.max_waiting:
+            raise Overloaded(self.name, self.retry_after)
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+    def release(self):
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def limiter(name: str) -> EndpointLimiter:
+    if name not in _limiters:
+        concurrent, waiting, retry_after = ENDPOINT_DEFAULTS[name]
+        prefix = name.upper()
+        _limiters[name] = EndpointLimiter(
+            name,
+            int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(concurrent))),
+            int(os.getenv(f"{prefix}_MAX_QUEUE", str(waiting))),
+            int(os.getenv(f"{prefix}_RETRY_AFTER", str(retry_after))),
+        )
+    return _limiters[name]
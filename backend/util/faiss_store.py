@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")  # flat, ivfpq or hnsw
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "1024"))
+FAISS_IVF_MIN_TRAIN = int(os.getenv("FAISS_IVF_MIN_TRAIN", "20000"))  # smaller stores stay flat
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+FAISS_REBUILD_DELTA = int(os.getenv("FAISS_REBUILD_DELTA", "5000"))
+FAISS_REBUILD_TOMBSTONE_RATIO = float(os.getenv("FAISS_REBUILD_TOMBSTONE_RATIO", "0.1"))
+FAISS_SYNC_INTERVAL = float(os.getenv("FAISS_SYNC_INTERVAL", "1.0"))
+_ADD_CHUNK = 50000
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _pq_m(dim: int, wanted: int) -> int:
+    """Largest sub-quantizer count <= wanted that divides dim."""
+    return next(m for m in range(min(wanted, dim), 0, -1) if dim % m == 0)
+
+
+class FaissStore(VectorStore):
+    """
+    LangChain vector store on a local FAISS index, cosine similarity.
+
+    SQLite holds the documents and their vectors and is the source of truth.
+    Search runs over two indexes: the main index, built in the background as
+    Flat, IVF-PQ or HNSW, written to disk and opened memory-mapped so every
+    uvicorn worker shares one copy through the page cache; and a small
+    in-memory flat delta holding rows added since that build. Deletes are
+    tombstones until the next rebuild compacts them away. Rebuilds are
+    serialized across processes with a file lock and published by switching
+    the `current` pointer in SQLite, which other workers pick up on their
+    next sync.
+    """
+    def __init__(self, directory: str, embedding: Embeddings, index_type: str = FAISS_INDEX_TYPE):
+        if index_type not in ("flat", "ivfpq", "hnsw"):
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.embedding = embedding
+        self.index_type = index_type
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(directory, "docs.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                rowid INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT,
+                vec BLOB NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS docs_live_id ON docs(doc_id) WHERE deleted = 0;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+        self._main: Optional[faiss.Index] = None
+        self._main_name: Optional[str] = None
+        self._main_upto = 0
+        self._delta: Optional[faiss.Index] = None
+        self._delta_upto = 0
+        self._deleted: set = set()
+        self._deletes_seen = None
+        self._last_sync = 0.0
+        self._rebuilding = threading.Lock()
+        self._sync(force=True)
+
+    # -- LangChain interface -------------------------------------------------
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [os.urandom(16).hex() for _ in texts]
+        vectors = _normalize(np.asarray(self.embedding.embed_documents(texts), dtype=np.float32))
+        with self._lock, self._conn:
+            # Re-adding an ID replaces the document
+            self._tombstone(ids)
+            self._conn.executemany(
+                "INSERT INTO docs (doc_id, text, metadata, vec) VALUES (?, ?, ?, ?)",
+                [(i, t, json.dumps(m), v.tobytes()) for i, t, m, v in zip(ids, texts, metadatas, vectors)],
+            )
+        self._after_write()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock, self._conn:
+            self._tombstone(ids)
+        self._after_write()
+        return True
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        self._sync()
+        query = _normalize(np.asarray([embedding], dtype=np.float32))
+        with self._lock:
+            fetch = min(k + len(self._deleted), 10 * k + 100)
+            scored = {}
+            for index in (self._main, self._delta):
+                if index is None or index.ntotal == 0:
+                    continue
+                scores, rowids = index.search(query, min(fetch, index.ntotal))
+                for score, rowid in zip(scores[0], rowids[0]):
+                    if rowid >= 0 and rowid not in self._deleted:
+                        scored[int(rowid)] = max(float(score), scored.get(int(rowid), -1.0))
+            top = sorted(scored.items(), key=lambda item: item[1], reverse=True)[:k]
+            if not top:
+                return []
+            rows = dict((r[0], r[1:]) for r in self._conn.execute(
+                f"SELECT rowid, text, metadata FROM docs WHERE rowid IN ({','.join('?' * len(top))})",
+                [rowid for rowid, _ in top],
+            ))
+        return [(Document(page_content=rows[r][0], metadata=json.loads(rows[r][1] or "{}")), score)
+                for r, score in top if r in rows]
+
+    def _select_relevance_score_fn(self):
+        # Inner product of unit vectors is already cosine similarity
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, directory: str = "data/faiss", **kwargs: Any) -> "FaissStore":
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM docs WHERE deleted = 0").fetchone()[0]
+
+    def get(self, include: Optional[List[str]] = None) -> dict:
+        """All live documents, shaped like Chroma's get()."""
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, text, metadata FROM docs WHERE deleted = 0").fetchall()
+        return {
+            "ids": [r[0] for r in rows],
+            "documents": [r[1] for r in rows],
+            "metadatas": [json.loads(r[2] or "{}") for r in rows],
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._main = self._delta = None
+
+    # -- index maintenance ---------------------------------------------------
+
+    def _tombstone(self, ids: List[str]):
+        # Called with the lock held, inside a transaction
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            self._conn.execute(
+                f"UPDATE docs SET deleted = 1 WHERE deleted = 0 AND doc_id IN ({','.join('?' * len(batch))})", batch
+            )
+        self._conn.execute(
+            "INSERT INTO meta VALUES ('deletes', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _sync(self, force: bool = False):
+        """Picks up a newly published main index, rows added by any process and new tombstones."""
+        now = time.monotonic()
+        if not force and now - self._last_sync < FAISS_SYNC_INTERVAL:
+            return
+        with self._lock:
+            self._last_sync = now
+            current = self._meta("current")
+            if current != self._main_name:
+                self._load_main(current)
+            new_rows = self._conn.execute(
+                "SELECT rowid, vec FROM docs WHERE rowid > ? AND deleted = 0 ORDER BY rowid", (self._delta_upto,)
+            ).fetchall()
+            if new_rows:
+                ids = np.array([r[0] for r in new_rows], dtype=np.int64)
+                vectors = np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in new_rows])
+                if self._delta is None:
+                    self._delta = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+                self._delta.add_with_ids(vectors, ids)
+            max_rowid = self._conn.execute("SELECT max(rowid) FROM docs").fetchone()[0] or 0
+            self._delta_upto = max(self._delta_upto, max_rowid)
+            deletes = self._meta("deletes")
+            if deletes != self._deletes_seen:
+                self._deleted = {r[0] for r in self._conn.execute("SELECT rowid FROM docs WHERE deleted = 1")}
+                self._deletes_seen = deletes
+
+    def _load_main(self, name: Optional[str]):
+        # Called with the lock held; rows past the build's high-water mark go to a fresh delta
+        self._main, self._main_name, self._main_upto = None, name, 0
+        if name:
+            path = os.path.join(self.directory, name)
+            try:
+                self._main = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                # Index types without mmap support are read into memory
+                self._main = faiss.read_index(path)
+            self._tune(self._main)
+            self._main_upto = int(name.split("-")[1].split(".")[0])
+        self._delta, self._delta_upto = None, self._main_upto
+
+    def _tune(self, index: faiss.Index):
+        inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+        if isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = FAISS_NPROBE
+        elif isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+
+    def _after_write(self):
+        self._sync(force=True)
+        with self._lock:
+            delta = self._delta.ntotal if self._delta is not None else 0
+            main = self._main.ntotal if self._main is not None else 0
+            # Only tombstones since the published build: older ones were purged by it
+            stale = len(self._deleted) > FAISS_REBUILD_TOMBSTONE_RATIO * max(main, 1)
+        if delta >= FAISS_REBUILD_DELTA or (main and stale):
+            self.rebuild_async()
+
+    def rebuild_async(self) -> bool:
+        """Starts a background rebuild unless one is already running in this process."""
+        if self._rebuilding.locked():
+            return False
+        threading.Thread(target=self.rebuild, daemon=True).start()
+        return True
+
+    def rebuild(self):
+        """Builds a new main index from all live rows, trains it if needed and publishes it."""
+        if not self._rebuilding.acquire(blocking=False):
+            return
+        try:
+            with open(os.path.join(self.directory, "rebuild.lock"), "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return  # another worker is rebuilding
+                # A separate connection so reads on the shared one aren't blocked for the whole build
+                conn = sqlite3.connect(os.path.join(self.directory, "docs.sqlite"))
+                try:
+                    self._build_and_publish(conn)
+                finally:
+                    conn.close()
+        except Exception as e:
+            print(f"FAISS rebuild failed in {self.directory}: {e}")
+        finally:
+            self._rebuilding.release()
+        self._sync(force=True)
+
+    def _build_and_publish(self, conn: sqlite3.Connection):
+        # One read snapshot for the whole build, so `dead` is exactly what the new index leaves out
+        conn.execute("BEGIN")
+        upto = conn.execute("SELECT max(rowid) FROM docs").fetchone()[0] or 0
+        dead = [r[0] for r in conn.execute("SELECT rowid FROM docs WHERE deleted = 1 AND rowid <= ?", (upto,))]
+        live = conn.execute("SELECT count(*) FROM docs WHERE deleted = 0 AND rowid <= ?", (upto,)).fetchone()[0]
+        if live == 0:
+            conn.commit()
+            with conn:
+                conn.execute("DELETE FROM meta WHERE key = 'current'")
+            self._purge(conn, dead, keep=None)
+            return
+        sample = conn.execute(
+            "SELECT vec FROM docs WHERE deleted = 0 AND rowid <= ? ORDER BY random() LIMIT ?",
+            (upto, max(FAISS_IVF_MIN_TRAIN, 40 * FAISS_IVF_NLIST)),
+        ).fetchall()
+        train = np.vstack([np.frombuffer(r[0], dtype=np.float32) for r in sample])
+        index = self._new_index(train.shape[1], live)
+        if not index.is_trained:
+            index.train(train)
+        cursor = conn.execute("SELECT rowid, vec FROM docs WHERE deleted = 0 AND rowid <= ? ORDER BY rowid", (upto,))
+        while rows := cursor.fetchmany(_ADD_CHUNK):
+            index.add_with_ids(np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in rows]),
+                               np.array([r[0] for r in rows], dtype=np.int64))
+        conn.commit()
+
+        name = f"index-{upto}.faiss"
+        tmp = os.path.join(self.directory, f"{name}.tmp")
+        faiss.write_index(index, tmp)
+        os.replace(tmp, os.path.join(self.directory, name))
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('current', ?)", (name,))
+        self._purge(conn, dead, keep=name)
+        print(f"Rebuilt {self.index_type} FAISS index in {self.directory}: {live} vectors")
+
+    def _purge(self, conn: sqlite3.Connection, dead: List[int], keep: Optional[str]):
+        """
+        Drops rows the published build already leaves out, and older builds.
+        Rows tombstoned during the build stay: the new index still holds
+        them, so they count towards the next rebuild.
+        """
+        with conn:
+            for start in range(0, len(dead), 500):
+                batch = dead[start:start + 500]
+                conn.execute(f"DELETE FROM docs WHERE deleted = 1 AND rowid IN ({','.join('?' * len(batch))})", batch)
+            # Other workers reload their tombstone sets when the counter moves
+            conn.execute(
+                "INSERT INTO meta VALUES ('deletes', '1') "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+        # Open mmaps keep replaced files alive, so older builds can be unlinked right away
+        for old in os.listdir(self.directory):
+            if old.startswith("index-") and old != keep:
+                os.remove(os.path.join(self.directory, old))
+
+    def _new_index(self, dim: int, n: int) -> faiss.Index:
+        if self.index_type == "hnsw":
+            inner = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        elif self.index_type == "ivfpq" and n >= FAISS_IVF_MIN_TRAIN:
+            nlist = min(FAISS_IVF_NLIST, n // 39)
+            quantizer = faiss.IndexFlatIP(dim)
+            inner = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim, FAISS_PQ_M), 8, faiss.METRIC_INNER_PRODUCT)
+            inner.own_fields = True
+            quantizer.this.disown()
+        else:
+            inner = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIDMap2(inner)
+        index.own_fields = True
+        inner.this.disown()
+        return index
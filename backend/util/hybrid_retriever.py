@@ -0,0 +1,95 @@
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from util.keyword_index import KeywordIndex
+from util.metrics import span
+from util.tokens import count_tokens
+
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))  # candidates taken from each ranking
+HYBRID_TOP_K = int(os.getenv("HYBRID_TOP_K", "4"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_KEYWORD_WEIGHT = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0"))
+# Empty disables reranking, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2 enables it (needs sentence-transformers)
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "2000"))
+
+_rerankers: Dict[str, Any] = {}
+_reranker_lock = threading.Lock()
+
+
+def get_reranker(model_name: str = RERANK_MODEL):
+    """Loads each cross-encoder once per process, None if reranking is disabled."""
+    if not model_name:
+        return None
+    with _reranker_lock:
+        if model_name not in _rerankers:
+            from sentence_transformers import CrossEncoder
+            _rerankers[model_name] = CrossEncoder(model_name, device="cpu")
+        return _rerankers[model_name]
+
+
+def _key(doc: Document) -> Tuple[Any, str]:
+    # Chunk IDs derive from (source, text), so this identifies a chunk in both rankings
+    return doc.metadata.get("source"), doc.page_content
+
+
+def fuse(rankings: List[List[Document]], weights: List[float], k: int = HYBRID_RRF_K) -> List[Document]:
+    """Weighted reciprocal rank fusion: a chunk scores sum(weight / (k + rank)) over the rankings it appears in."""
+    scores: Dict[Tuple[Any, str], float] = {}
+    docs: Dict[Tuple[Any, str], Document] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc in enumerate(ranking):
+            key = _key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank + 1)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def within_budget(docs: List[Document], token_budget: int) -> List[Document]:
+    """Keeps docs in order while they fit in token_budget. The first one is always kept."""
+    kept, used = [], 0
+    for doc in docs:
+        tokens = count_tokens(doc.page_content)
+        if kept and used + tokens > token_budget:
+            break
+        kept.append(doc)
+        used += tokens
+    return kept
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves from the vector store and the BM25 keyword index, fuses both
+    rankings with RRF, optionally reranks the fused candidates with a local
+    cross-encoder, and returns at most top_k chunks within token_budget.
+    Good precision at small k keeps the "stuff" prompt short.
+    """
+    vectorstore: Any
+    keywords: KeywordIndex
+    fetch_k: int = HYBRID_FETCH_K
+    top_k: int = HYBRID_TOP_K
+    keyword_weight: float = HYBRID_KEYWORD_WEIGHT
+    rerank_model: str = RERANK_MODEL
+    token_budget: int = RETRIEVAL_TOKEN_BUDGET
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        # The query embedding is timed separately as "embed"
+        with span("vector_search"):
+            semantic = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        with span("keyword_search"):
+            lexical = [doc for doc, _ in self.keywords.search(query, self.fetch_k)]
+        candidates = fuse([semantic, lexical], [1.0, self.keyword_weight])
+        reranker = get_reranker(self.rerank_model)
+        if reranker is not None and len(candidates) > 1:
+            with span("rerank"):
+                scores = reranker.predict([(query, doc.page_content) for doc in candidates], show_progress_bar=False)
+            candidates = [doc for _, doc in sorted(zip(scores, candidates), key=lambda pair: pair[0], reverse=True)]
+        return within_budget(candidates[:self.top_k], self.token_budget)
@@ -0,0 +1,109 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "data/image_cache")
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "1024"))
+
+_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+
+
+def cache_key(prompt: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedImage:
+    data: bytes
+    media_type: str
+    etag: str  # hash of the image bytes
+
+    @property
+    def extension(self) -> str:
+        return _EXTENSIONS.get(self.media_type, "bin")
+
+
+class ImageCache:
+    """
+    On-disk cache of generated images keyed by (prompt, model). Files are
+    stored under their key with an SQLite index of size and last access.
+    Least recently used images are evicted once the total exceeds max_mb.
+    """
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_mb: int = IMAGE_CACHE_MAX_MB):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                key TEXT PRIMARY KEY,
+                file TEXT NOT NULL,
+                media_type TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS images_lru ON images(last_access);
+        """)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedImage]:
+        with self._lock:
+            row = self._conn.execute("SELECT file, media_type, etag FROM images WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                with self._conn:
+                    self._conn.execute("UPDATE images SET last_access = ? WHERE key = ?", (time.time(), key))
+        if row is None:
+            self.misses += 1
+            return None
+        try:
+            with open(os.path.join(self.directory, row[0]), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            # Evicted by another process between the lookup and the read
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedImage(data, row[1], row[2])
+
+    def put(self, key: str, data: bytes, media_type: str) -> CachedImage:
+        image = CachedImage(data, media_type, hashlib.sha256(data).hexdigest()[:32])
+        file = f"{key}.{image.extension}"
+        path = os.path.join(self.directory, file)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)",
+                (key, file, media_type, image.etag, len(data), time.time()),
+            )
+            self._evict()
+        return image
+
+    def _evict(self):
+        # Called with the lock held, inside a transaction
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, file, size in self._conn.execute("SELECT key, file, size FROM images ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM images WHERE key = ?", (key,))
+            try:
+                os.remove(os.path.join(self.directory, file))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from qdrant_client.http.models import Batch
+
+INGEST_CHUNKSIZE = int(os.getenv("INGEST_CHUNKSIZE", "100000"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+INGEST_UPSERT_WORKERS = int(os.getenv("INGEST_UPSERT_WORKERS", "4"))
+INGEST_UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", "1000"))
+INGEST_UPSERT_MODE = os.getenv("INGEST_UPSERT_MODE", "skip_existing")  # or "overwrite"
+
+# Turns a raw CSV chunk into (point ids, texts to embed, payloads), dropping unusable rows
+PrepareFn = Callable[[pd.DataFrame], Tuple[List[str], List[str], List[Dict[str, Any]]]]
+
+# Fixed namespace so the same row maps to the same point ID on every machine and run
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3a52-8e7b-4d0e-9a43-2b9d5c7e1f08")
+
+
+def content_ids(external: pd.Series, description: pd.Series, internal: pd.Series) -> List[str]:
+    """Stable point IDs derived from a row's external code, description and internal code."""
+    keys = (external.astype(str).str.strip() + "\x1f" + description.astype(str).str.strip()
+            + "\x1f" + internal.astype(str).str.strip())
+    return [str(uuid.uuid5(POINT_ID_NAMESPACE, key)) for key in keys.tolist()]
+
+
+@dataclass
+class IngestBatch:
+    file_path: str
+    chunk_index: int
+    ids: List[str]
+    texts: List[str]
+    payloads: List[Dict[str, Any]]
+    vectors: Optional[np.ndarray] = None
+
+
+class IngestCheckpoint:
+    """
+    Remembers which CSV chunks were fully upserted, per file version (path,
+    size and mtime), so a failed run resumes where it stopped. Chunks finish
+    out of order with several upsert workers, so completed indices are
+    tracked as a set rather than a high-water mark.
+    """
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._done: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._done = {k: set(v) for k, v in json.load(f).items()}
+
+    @staticmethod
+    def file_key(file_path: str) -> str:
+        stat = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def done(self, file_path: str, chunk_index: int) -> bool:
+        with self._lock:
+            return chunk_index in self._done.get(self.file_key(file_path), ())
+
+    def mark(self, file_path: str, chunk_index: int):
+        with self._lock:
+            self._done.setdefault(self.file_key(file_path), set()).add(chunk_index)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = f"{self.path}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump({k: sorted(v) for k, v in self._done.items()}, f)
+                os.replace(tmp, self.path)
+
+
+class _Aborted(Exception):
+    pass
+
+
+class IngestPipeline:
+    """
+    Streams CSV files into Qdrant through four stages connected by bounded
+    queues: read -> clean -> embed -> upsert. Reading and cleaning overlap
+    with embedding, and several workers upsert column-batched payloads, so
+    the embedder never waits on Python row loops or network round trips.
+    Points have content-derived IDs: duplicate rows within a chunk are
+    embedded once, and in skip_existing mode rows already in the collection
+    are not embedded at all. With a payload_store, full payloads go there
+    and points only keep point_fields.
+    """
+    def __init__(self, client, collection_name: str, embedder, prepare: PrepareFn,
+                 chunksize: int = INGEST_CHUNKSIZE, queue_size: int = INGEST_QUEUE_SIZE,
+                 upsert_workers: int = INGEST_UPSERT_WORKERS, upsert_batch_size: int = INGEST_UPSERT_BATCH_SIZE,
+                 checkpoint_path: Optional[str] = None, sep: str = ";", upsert_mode: str = INGEST_UPSERT_MODE,
+                 payload_store=None, point_fields: Sequence[str] = ()):
+        if upsert_mode not in ("skip_existing", "overwrite"):
+            raise ValueError(f"Unknown upsert mode: {upsert_mode}")
+        self.client = client
+        self.collection = collection_name
+        self.embedder = embedder
+        self.prepare = prepare
+        self.chunksize = chunksize
+        self.queue_size = queue_size
+        self.upsert_workers = upsert_workers
+        self.upsert_batch_size = upsert_batch_size
+        self.checkpoint = IngestCheckpoint(checkpoint_path)
+        self.sep = sep
+        self.upsert_mode = upsert_mode
+        self.payload_store = payload_store
+        self.point_fields = tuple(point_fields)
+        self._stats: Dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def run(self, file_paths: Iterable[str], cancel: Optional[threading.Event] = None) -> Dict[str, float]:
+        """
+        Ingests file_paths and returns the run's stats. Setting cancel stops
+        reading new chunks; chunks already in flight are still upserted and
+        checkpointed, so a later run resumes where this one stopped.
+        """
+        self._failed = threading.Event()
+        self._cancel = cancel or threading.Event()
+        self._error: Optional[BaseException] = None
+        with self._stats_lock:
+            self._stats = {"rows_read": 0, "rows_embedded": 0, "points_upserted": 0, "chunks_skipped": 0,
+                           "rows_duplicate": 0, "rows_existing": 0}
+        clean_q: queue.Queue = queue.Queue(self.queue_size)
+        embed_q: queue.Queue = queue.Queue(self.queue_size)
+        upsert_q: queue.Queue = queue.Queue(self.queue_size)
+
+        self._started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._stage, args=(self._read, list(file_paths), clean_q, 1), daemon=True),
+            threading.Thread(target=self._stage, args=(self._clean, clean_q, embed_q, 1), daemon=True),
+            threading.Thread(target=self._stage, args=(self._embed, embed_q, upsert_q, self.upsert_workers), daemon=True),
+        ]
+        threads += [threading.Thread(target=self._stage, args=(self._upsert, upsert_q, None, 0), daemon=True)
+                    for _ in range(self.upsert_workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self._error is not None:
+            raise self._error
+        if self.payload_store is not None:
+            # One segment per chunk was written; merged once they're worth rewriting the base for
+            self.payload_store.maybe_compact()
+
+        return dict(self.progress(), cancelled=self._cancel.is_set())
+
+    def progress(self) -> Dict[str, float]:
+        """Stats of the current (or last) run so far, safe to call from another thread."""
+        elapsed = time.perf_counter() - self._started
+        with self._stats_lock:
+            stats = dict(self._stats, seconds=elapsed)
+        stats["rows_per_sec"] = stats.get("points_upserted", 0) / elapsed if elapsed else 0.0
+        return stats
+
+    def _count(self, key: str, n: int):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self._failed.is_set():
+                    raise _Aborted()
+
+    def _get(self, q: queue.Queue):
+        while True:
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                if self._failed.is_set():
+                    raise _Aborted()
+
+    def _stage(self, work: Callable, source, sink: Optional[queue.Queue], downstream: int):
+        """Runs one stage, then passes one end-of-stream marker per downstream consumer."""
+        try:
+            work(source, sink)
+            for _ in range(downstream):
+                self._put(sink, None)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            self._failed.set()
+
+    def _read(self, file_paths: List[str], sink: queue.Queue):
+        for file_path in file_paths:
+            for chunk_index, chunk in enumerate(pd.read_csv(file_path, sep=self.sep, chunksize=self.chunksize)):
+                if self._cancel.is_set():
+                    return
+                if self.checkpoint.done(file_path, chunk_index):
+                    self._count("chunks_skipped", 1)
+                    continue
+                self._count("rows_read", len(chunk))
+                self._put(sink, (file_path, chunk_index, chunk))
+
+    def _clean(self, source: queue.Queue, sink: queue.Queue):
+        while (item := self._get(source)) is not None:
+            file_path, chunk_index, chunk = item
+            batch = self._dedupe(IngestBatch(file_path, chunk_index, *self.prepare(chunk)))
+            if batch.ids:
+                self._put(sink, batch)
+            else:
+                self.checkpoint.mark(file_path, chunk_index)
+
+    def _dedupe(self, batch: IngestBatch) -> IngestBatch:
+        """Drops repeated rows and, in skip_existing mode, rows whose point is already stored."""
+        seen, keep = set(), []
+        for i, point_id in enumerate(batch.ids):
+            if point_id not in seen:
+                seen.add(point_id)
+                keep.append(i)
+        self._count("rows_duplicate", len(batch.ids) - len(keep))
+        if self.upsert_mode == "skip_existing" and keep:
+            existing = set()
+            for start in range(0, len(keep), self.upsert_batch_size):
+                points = self.client.retrieve(
+                    collection_name=self.collection,
+                    ids=[batch.ids[i] for i in keep[start:start + self.upsert_batch_size]],
+                    with_payload=False,
+                    with_vectors=False,
+                )
+                existing.update(str(p.id) for p in points)
+            if self.payload_store is not None and existing:
+                # A point without its stored payload (e.g. from an interrupted run) is ingested again
+                candidates = sorted(existing)
+                existing = {i for i, stored in zip(candidates, self.payload_store.contains(candidates)) if stored}
+            before = len(keep)
+            keep = [i for i in keep if batch.ids[i] not in existing]
+            self._count("rows_existing", before - len(keep))
+        return IngestBatch(batch.file_path, batch.chunk_index,
+                           [batch.ids[i] for i in keep], [batch.texts[i] for i in keep], [batch.payloads[i] for i in keep])
+
+    def _embed(self, source: queue.Queue, sink: queue.Queue):
+        while (batch := self._get(source)) is not None:
+            batch.vectors = np.asarray(self.embedder.encode(batch.texts), dtype=np.float32)
+            self._count("rows_embedded", len(batch.texts))
+            self._put(sink, batch)
+
+    def _upsert(self, source: queue.Queue, _sink):
+        while (batch := self._get(source)) is not None:
+            ids = batch.ids
+            payloads = batch.payloads
+            if self.payload_store is not None:
+                # Stored before the points exist: a crash in between only re-embeds the chunk on the next run,
+                # while the reverse order would let skip_existing drop rows whose payloads were never stored
+                self.payload_store.append(ids, batch.payloads)
+                payloads = [{field: p[field] for field in self.point_fields} for p in payloads]
+            for start in range(0, len(ids), self.upsert_batch_size):
+                end = start + self.upsert_batch_size
+                self.client.upsert(
+                    collection_name=self.collection,
+                    points=Batch(ids=ids[start:end], vectors=batch.vectors[start:end].tolist(),
+                                 payloads=payloads[start:end]),
+                    wait=True,
+                )
+                self._count("points_upserted", len(ids[start:end]))
+            self.checkpoint.mark(batch.file_path, batch.chunk_index)
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite")
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))  # seconds between progress writes
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "5"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))  # running jobs without a heartbeat are requeued
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+TERMINAL = ("succeeded", "failed", "cancelled")
+
+
+class JobStore:
+    """
+    Durable job records in SQLite: kind, parameters, status, progress
+    counters and result. Several processes can share one file; claiming a
+    job is a single atomic UPDATE.
+    """
+    def __init__(self, path: str = JOBS_DB_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_queued ON jobs(kind, created_at) WHERE status = 'queued';
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["progress"] = json.loads(job["progress"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job.pop("heartbeat_at")
+        return job
+
+    def create(self, kind: str, params: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params), time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query, args = "SELECT * FROM jobs", []
+        if status:
+            query, args = query + " WHERE status = ?", [status]
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created_at DESC LIMIT ?", args + [limit]).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, kind: str) -> Optional[Dict[str, Any]]:
+        """Marks the oldest queued job of kind as running and returns it."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND kind = ? ORDER BY created_at LIMIT 1) "
+                "RETURNING *",
+                (now, now, kind),
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def heartbeat(self, job_id: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+        """Records liveness (and progress); returns whether cancellation was requested."""
+        with self._lock, self._conn:
+            if progress is None:
+                self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+            else:
+                self._conn.execute("UPDATE jobs SET heartbeat_at = ?, progress = ? WHERE id = ?",
+                                   (time.time(), json.dumps(progress), job_id))
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id: str, status: str, progress: Dict[str, Any], result: Any = None, error: str = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(progress), json.dumps(result) if result is not None else None, error,
+                 time.time(), job_id),
+            )
+
+    def request_cancel(self, job_id: str) -> Optional[str]:
+        """Cancels a queued job outright and flags a running one. Returns the job's status, None if unknown."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def requeue(self, job_id: Optional[str] = None, stale_after: Optional[float] = None) -> int:
+        """Puts a running job back in the queue, or every running job whose heartbeat is older than stale_after."""
+        with self._lock, self._conn:
+            if job_id is not None:
+                cursor = self._conn.execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'running'",
+                                            (job_id,))
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat_at < ?",
+                    (time.time() - stale_after,),
+                )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """What a running job's handler sees: its parameters, a progress reporter and a cancellation flag."""
+    def __init__(self, store: JobStore, job_id: str, params: Dict[str, Any]):
+        self.store = store
+        self.job_id = job_id
+        self.params = params
+        self.counters: Dict[str, Any] = {}
+        # Set to stop, on cancellation or shutdown, for handlers that run blocking code in threads
+        self.cancel_event = threading.Event()
+        # Set only when the job itself was cancelled, so a shutdown requeues it instead
+        self.cancel_requested = threading.Event()
+        self._started = time.perf_counter()
+        self._last_write = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def progress(self, **counters):
+        """Updates progress counters. Writes are throttled to one per JOB_PROGRESS_INTERVAL."""
+        self.counters.update(counters, seconds=round(self.elapsed, 3))
+        now = time.monotonic()
+        if now - self._last_write >= JOB_PROGRESS_INTERVAL:
+            self._last_write = now
+            if self.store.heartbeat(self.job_id, self.counters):
+                self.request_cancel()
+
+    def request_cancel(self):
+        self.cancel_requested.set()
+        self.cancel_event.set()
+
+
+Handler = Callable[[JobContext], Awaitable[Any]]
+
+
+class JobQueue:
+    """
+    Runs jobs from a JobStore in the background with bounded parallelism per
+    job kind. Handlers are async functions of a JobContext that return a
+    JSON-serializable result. Cancellation works across processes: a
+    heartbeat picks up the store's cancel flag and cancels the handler.
+    Jobs interrupted by a shutdown or a crashed process go back to the queue,
+    so handlers should be resumable (crawls and ingests are incremental).
+    """
+    def __init__(self, store: JobStore):
+        self.store = store
+        self._handlers: Dict[str, Handler] = {}
+        self._workers: Dict[str, int] = {}
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, tuple] = {}
+
+    def register(self, kind: str, handler: Handler, workers: int = 1):
+        self._handlers[kind] = handler
+        self._workers[kind] = workers
+
+    async def start(self):
+        requeued = self.store.requeue(stale_after=JOB_STALE_AFTER)
+        if requeued:
+            print(f"Requeued {requeued} interrupted jobs")
+        for kind, workers in self._workers.items():
+            self._wake[kind] = asyncio.Event()
+            self._tasks += [asyncio.create_task(self._worker(kind)) for _ in range(workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def submit(self, kind: str, params: Dict[str, Any]) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.store.create(kind, params)
+        if kind in self._wake:
+            self._wake[kind].set()
+        return job_id
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        status = self.store.request_cancel(job_id)
+        if job_id in self._running:
+            ctx, task = self._running[job_id]
+            ctx.request_cancel()
+            task.cancel()
+        return status
+
+    async def watch(self, job_id: str, interval: float = JOB_PROGRESS_INTERVAL) -> AsyncIterator[Dict[str, Any]]:
+        """Yields the job each time it changes, ending with its terminal state."""
+        last = None
+        while True:
+            job = self.store.get(job_id)
+            if job is None:
+                return
+            if job != last:
+                last = job
+                yield job
+            if job["status"] in TERMINAL:
+                return
+            await asyncio.sleep(interval)
+
+    async def _worker(self, kind: str):
+        wake = self._wake[kind]
+        while True:
+            job = self.store.claim(kind)
+            if job is None:
+                # Other processes may enqueue too, so poll as well as waiting for local submits
+                wake.clear()
+                try:
+                    await asyncio.wait_for(wake.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        ctx = JobContext(self.store, job_id, job["params"])
+        ctx.counters.update(job["progress"])
+        task = asyncio.create_task(self._handlers[job["kind"]](ctx))
+        self._running[job_id] = (ctx, task)
+        heartbeat = asyncio.create_task(self._heartbeat(ctx, task))
+        try:
+            result = await task
+            self.store.finish(job_id, "succeeded", ctx.counters, result=result)
+        except (asyncio.CancelledError, JobCancelled) as e:
+            if ctx.cancel_requested.is_set():
+                self.store.finish(job_id, "cancelled", ctx.counters)
+            else:
+                # Shutting down: hand the job to the next start
+                self.store.requeue(job_id)
+            # A cancelled job only ends its own task; the worker keeps going unless it is being stopped too
+            if isinstance(e, asyncio.CancelledError) and (
+                    not ctx.cancel_requested.is_set() or asyncio.current_task().cancelling()):
+                raise
+        except Exception as e:
+            print(f"Job {job_id} ({job['kind']}) failed: {e}")
+            self.store.finish(job_id, "failed", ctx.counters, error=str(e))
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job_id, None)
+
+    async def _heartbeat(self, ctx: JobContext, task: asyncio.Task):
+        while not task.done():
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            if self.store.heartbeat(ctx.job_id) or ctx.cancel_requested.is_set():
+                ctx.request_cancel()
+                task.cancel()
+                return
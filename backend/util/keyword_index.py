@@ -0,0 +1,83 @@
+import re
+import json
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def match_query(text: str) -> Optional[str]:
+    """FTS5 query matching any of text's terms, each quoted so codes like M8-40 can't break the syntax."""
+    terms = dict.fromkeys(t.lower() for t in _TOKEN.findall(text))
+    return " OR ".join(f'"{t}"' for t in terms) or None
+
+
+class KeywordIndex:
+    """
+    Inverted BM25 index of a collection's chunks, kept next to the vector store
+    so exact product codes, names and numbers can be matched lexically.
+    Backed by SQLite FTS5, whose bm25() does the ranking.
+    """
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                text TEXT NOT NULL,
+                metadata TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                text, content='chunks', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts(rowid, text) VALUES (new.rowid, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END;
+        """)
+        self._conn.commit()
+
+    def add(self, ids: List[str], texts: List[str], metadatas: Optional[List[dict]] = None):
+        metadatas = metadatas or [{} for _ in texts]
+        with self._lock, self._conn:
+            # Replacing fires the delete trigger for the old row first
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, text, metadata) VALUES (?, ?, ?)",
+                [(i, t, json.dumps(m)) for i, t, m in zip(ids, texts, metadatas)],
+            )
+
+    def delete(self, ids: List[str]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(i,) for i in ids])
+
+    def search(self, query: str, k: int = 20) -> List[Tuple["Document", float]]:
+        """Top k chunks by BM25, best first. Scores are positive, higher is better."""
+        from langchain_core.documents import Document
+
+        match = match_query(query)
+        if match is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.text, c.metadata, -bm25(chunks_fts) FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid "
+                "WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts) LIMIT ?",
+                (match, k),
+            ).fetchall()
+        return [(Document(page_content=text, metadata=json.loads(metadata or "{}")), score)
+                for text, metadata, score in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
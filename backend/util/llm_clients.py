@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+
+from util.metrics import count_llm_tokens, record
+
+# One keep-alive pool to api.openai.com shared by every chat model and embedder
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """LangChain callback that times LLM calls and counts their tokens. Streaming needs stream_usage=True."""
+    # Run in the caller's task, so the call lands in that request's Server-Timing
+    run_inline = True
+
+    def __init__(self):
+        self._starts: Dict[Any, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        output = response.llm_output or {}
+        model = output.get("model_name", "")
+        usage = output.get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        if not usage:
+            # Streamed and newer chat responses carry usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    metadata = getattr(message, "usage_metadata", None) or {}
+                    prompt += metadata.get("input_tokens", 0)
+                    completion += metadata.get("output_tokens", 0)
+                    model = model or (getattr(message, "response_metadata", None) or {}).get("model_name", "")
+        if start is not None:
+            record("llm", time.perf_counter() - start, model=model)
+        count_llm_tokens(model, prompt, completion)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+
+llm_metrics = LLMMetricsHandler()
+
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+_models: Dict[Any, Any] = {}
+_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                        keepalive_expiry=60)
+
+
+def get_openai_http_client() -> httpx.AsyncClient:
+    """The shared async connection pool for OpenAI calls, created on first use."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(limits=_limits(), timeout=OPENAI_TIMEOUT)
+    return _async_client
+
+
+def get_openai_sync_http_client() -> httpx.Client:
+    """The sync counterpart, used by LangChain's blocking calls (e.g. embedding in a worker thread)."""
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            _sync_client = httpx.Client(limits=_limits(), timeout=OPENAI_TIMEOUT)
+        return _sync_client
+
+
+def chat_model(model_name: str, **kwargs):
+    """
+    A ChatOpenAI for model_name and kwargs, built once and reused. All of them
+    share the pooled HTTP clients and report to llm_metrics.
+    """
+    key = ("chat", model_name, tuple(sorted(kwargs.items())))
+    with _lock:
+        model = _models.get(key)
+    if model is None:
+        from langchain_openai import ChatOpenAI
+        model = ChatOpenAI(model_name=model_name, callbacks=[llm_metrics],
+                           http_client=get_openai_sync_http_client(), http_async_client=get_openai_http_client(),
+                           **kwargs)
+        with _lock:
+            model = _models.setdefault(key, model)
+    return model
+
+
+def embeddings(model: str):
+    """The OpenAIEmbeddings for model, built once on the pooled HTTP clients."""
+    key = ("embeddings", model)
+    with _lock:
+        embedder = _models.get(key)
+    if embedder is None:
+        from langchain_openai import OpenAIEmbeddings
+        embedder = OpenAIEmbeddings(model=model, http_client=get_openai_sync_http_client(),
+                                    http_async_client=get_openai_http_client())
+        with _lock:
+            embedder = _models.setdefault(key, embedder)
+    return embedder
+
+
+async def warm_openai_connection():
+    """Opens a pooled connection (DNS, TCP and TLS) to the OpenAI API so the first request doesn't pay for it."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return
+    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+    response = await get_openai_http_client().get(f"{base_url}/models",
+                                                  headers={"Authorization": f"Bearer {api_key}"})
+    response.raise_for_status()
+
+
+async def close_openai_clients():
+    global _async_client, _sync_client
+    with _lock:
+        _models.clear()
+        sync_client, _sync_client = _sync_client, None
+    if sync_client is not None:
+        sync_client.close()
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
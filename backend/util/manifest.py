@@ -0,0 +1,104 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(url: str, text: str) -> str:
+    """Stable vector store ID for a chunk, unique per source page."""
+    return content_hash(f"{url}\n{text}")
+
+
+class CrawlManifest:
+    """
+    Records what was indexed for every crawled URL: HTTP validators
+    (ETag/Last-Modified), outgoing links, a hash of the page text and the IDs
+    of the chunks currently in the vector store. Re-crawls use it to send
+    conditional requests and to embed only the chunks that changed.
+    """
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                page_hash TEXT,
+                links TEXT,
+                crawled_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                url TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (url, chunk_id)
+            );
+        """)
+        self._conn.commit()
+
+    def _page(self, url: str) -> Optional[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT etag, last_modified, page_hash, links FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """Conditional request headers for url, empty if it was never crawled."""
+        row = self._page(url)
+        headers = {}
+        if row and row[0]:
+            headers["If-None-Match"] = row[0]
+        if row and row[1]:
+            headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def page_hash(self, url: str) -> Optional[str]:
+        row = self._page(url)
+        return row[2] if row else None
+
+    def links(self, url: str) -> List[str]:
+        row = self._page(url)
+        return json.loads(row[3]) if row and row[3] else []
+
+    def chunk_ids(self, url: str) -> Set[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id FROM chunks WHERE url = ?", (url,)).fetchall()
+        return {r[0] for r in rows}
+
+    def update_page(self, url: str, etag: Optional[str], last_modified: Optional[str],
+                    page_hash: Optional[str], links: Iterable[str], chunk_ids: Iterable[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, page_hash, json.dumps(list(links)), time.time()),
+            )
+            self._conn.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            self._conn.executemany("INSERT INTO chunks VALUES (?, ?)", [(url, c) for c in chunk_ids])
+
+    def touch_page(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        """Refreshes validators and crawl time of an unchanged page."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE pages SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), "
+                "crawled_at = ? WHERE url = ?",
+                (etag, last_modified, time.time(), url),
+            )
+
+    def remove_page(self, url: str) -> Set[str]:
+        """Forgets url and returns the chunk IDs that must be deleted from the vector store."""
+        ids = self.chunk_ids(url)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            self._conn.execute("DELETE FROM chunks WHERE url = ?", (url,))
+        return ids
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
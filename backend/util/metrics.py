@@ -0,0 +1,182 @@
+import os
+import re
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Opt-in: a request with the X-Profile header is run under a sampling profiler
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_HEADER = "x-profile"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+# Histogram buckets in seconds, from a cache hit to a cold image generation
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_HELP = {
+    "stage_seconds": "Time spent in each pipeline stage.",
+    "http_request_seconds": "HTTP request latency by route.",
+    "voice_service_seconds": "Pipecat service metrics (TTFB and processing time) for STT and TTS.",
+    "llm_tokens_total": "LLM tokens used, by model and kind (prompt or completion).",
+    "embeddings_total": "Texts embedded, by model and result (computed or cached).",
+    "embedding_tokens_total": "Tokens sent to embedding APIs, by model.",
+    "tts_characters_total": "Characters sent to text-to-speech.",
+    "image_cache_total": "Image cache lookups, by result (hit or miss).",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Stages of the request being handled, reported in its Server-Timing header
+_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("trace", default=None)
+
+
+class Metrics:
+    """
+    In-process counters and latency histograms, rendered in the Prometheus
+    text format. Labels must have bounded values (stage, model, route
+    template), never raw URLs or prompts.
+    """
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}  # bucket counts, then sum and count
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += _header(name, "counter")
+                lines += [f"{name}{_labels(key)} {value:g}" for key, value in sorted(series.items())]
+            for name, series in sorted(self._histograms.items()):
+                lines += _header(name, "histogram")
+                for key, values in sorted(series.items()):
+                    for bound, count in zip(self.buckets, values):
+                        lines.append(f"{name}_bucket{_labels(key + (('le', f'{bound:g}'),))} {count:g}")
+                    lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {values[-1]:g}")
+                    lines.append(f"{name}_sum{_labels(key)} {values[-2]:.6f}")
+                    lines.append(f"{name}_count{_labels(key)} {values[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _header(name: str, kind: str) -> List[str]:
+    return ([f"# HELP {name} {_HELP[name]}"] if name in _HELP else []) + [f"# TYPE {name} {kind}"]
+
+
+def _labels(key: Labels) -> str:
+    if not key:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """Times a block as stage_seconds{stage=...} and adds it to the current request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, **labels)
+
+
+def record(stage: str, seconds: float, **labels):
+    metrics.observe("stage_seconds", seconds, stage=stage, **labels)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+def server_timing(trace: List[Tuple[str, float]]) -> str:
+    # Repeated stages (e.g. one embed per page) are summed
+    totals: Dict[str, float] = {}
+    for stage, seconds in trace:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+def _start_profiler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        print("Profiling requested but pyinstrument is not installed")
+        return None
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+    profiler.start()
+    return profiler
+
+
+def _save_profile(profiler, path: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    file = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}.html")
+    with open(file, "w") as f:
+        f.write(profiler.output_html())
+    return file
+
+
+async def instrument(request, call_next):
+    """
+    HTTP middleware: records http_request_seconds by route template, returns
+    the request's stages in a Server-Timing header and, with
+    PROFILING_ENABLED=1, profiles requests sent with X-Profile and saves the
+    report under PROFILE_DIR (its path is returned in X-Profile-Path).
+    Stages that run after a streaming response starts aren't in the header.
+    """
+    trace: List[Tuple[str, float]] = []
+    token = _trace.set(trace)
+    profiler = _start_profiler() if PROFILING_ENABLED and PROFILE_HEADER in request.headers else None
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        _trace.reset(token)
+        if profiler is not None:
+            profiler.stop()
+        route = request.scope.get("route")
+        metrics.observe("http_request_seconds", time.perf_counter() - start, method=request.method,
+                        route=getattr(route, "path", "unmatched"), status=status)
+    if trace:
+        response.headers["Server-Timing"] = server_timing(trace)
+    if profiler is not None:
+        response.headers["X-Profile-Path"] = _save_profile(profiler, request.url.path)
+    return response
+
+
+def metrics_response():
+    from fastapi.responses import PlainTextResponse
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def count_llm_tokens(model: str, prompt: int, completion: int):
+    if prompt:
+        metrics.inc("llm_tokens_total", prompt, model=model, kind="prompt")
+    if completion:
+        metrics.inc("llm_tokens_total", completion, model=model, kind="completion")
+
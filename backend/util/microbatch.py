@@ -0,0 +1,60 @@
+import os
+import asyncio
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "256"))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects items submitted by concurrent requests for up to max_wait_ms (or
+    until max_batch_size is reached) and hands them to process_batch in one
+    call, run in a worker thread. Each submitter gets its own result back.
+    """
+    def __init__(self, process_batch: Callable[[List[T]], List[R]],
+                 max_batch_size: int = MICROBATCH_MAX_SIZE, max_wait_ms: float = MICROBATCH_MAX_WAIT_MS):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, item: T) -> R:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending: List[Tuple[T, asyncio.Future]] = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Requests that gave up while waiting don't need a result
+            pending = [(item, future) for item, future in pending if not future.done()]
+            if not pending:
+                continue
+            try:
+                results = await asyncio.to_thread(self.process_batch, [item for item, _ in pending])
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(pending, results):
+                if not future.done():
+                    future.set_result(result)
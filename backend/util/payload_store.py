@@ -0,0 +1,418 @@
+import os
+import re
+import mmap
+import time
+import uuid
+import fcntl
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+PAYLOAD_STORE_DIR = os.getenv("PAYLOAD_STORE_DIR", "data/payloads")
+PAYLOAD_MAX_SEGMENTS = int(os.getenv("PAYLOAD_MAX_SEGMENTS", "32"))  # merge segments beyond this
+# Fold segments into the base once they hold this fraction of its rows; rewriting the base costs the whole catalogue
+PAYLOAD_COMPACT_RATIO = float(os.getenv("PAYLOAD_COMPACT_RATIO", "0.2"))
+
+PAYLOAD_COLUMNS = ("external_code", "description", "internal_code")
+_TABLE = re.compile(r"^(base|seg)-(\d{8})$")
+# Bumped by every write; holds the last table number
+_GENERATION = "GENERATION"
+_SYNC_ATTEMPTS = 5
+_STALE_TMP_SECONDS = 3600
+
+
+def point_keys(ids: Sequence[str]) -> np.ndarray:
+    """Point IDs (UUID strings) as sortable fixed-width 16-byte keys."""
+    return np.array([uuid.UUID(str(i)).bytes for i in ids], dtype="S16")
+
+
+class _Strings:
+    """A sorted string dictionary: UTF-8 blob plus offsets, both memory-mapped."""
+    def __init__(self, directory: str, column: str):
+        self.offsets = np.load(os.path.join(directory, f"{column}.offsets.npy"), mmap_mode="r")
+        with open(os.path.join(directory, f"{column}.strings"), "rb") as f:
+            # mmap can't map an empty file
+            self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code: int) -> str:
+        return self.blob[int(self.offsets[code]):int(self.offsets[code + 1])].decode("utf-8")
+
+    def find(self, value: str) -> Optional[int]:
+        """Dictionary code of value by binary search, None if absent."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self[lo] == value else None
+
+    def close(self):
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+
+
+class PayloadTable:
+    """
+    One immutable, memory-mapped table of payload rows sorted by point key.
+    Every column is dictionary-encoded: a uint32 code per row into a sorted
+    string dictionary, so repeated internal codes are stored once. Indexed
+    columns also get a posting list (rows grouped by code) for exact matches.
+    """
+    def __init__(self, directory: str, columns: Sequence[str] = PAYLOAD_COLUMNS, indexed: Sequence[str] = ()):
+        self.directory = directory
+        self.keys = np.load(os.path.join(directory, "keys.npy"), mmap_mode="r")
+        self.codes = {c: np.load(os.path.join(directory, f"{c}.codes.npy"), mmap_mode="r") for c in columns}
+        self.strings = {c: _Strings(directory, c) for c in columns}
+        self.postings = {c: (np.load(os.path.join(directory, f"{c}.starts.npy"), mmap_mode="r"),
+                             np.load(os.path.join(directory, f"{c}.rows.npy"), mmap_mode="r"))
+                         for c in indexed}
+
+    @staticmethod
+    def write(tmp: str, keys: np.ndarray, columns: Dict[str, Sequence[str]], indexed: Sequence[str] = ()):
+        """Writes rows (unique keys, any order) as a table into a new directory, to be renamed into place."""
+        os.makedirs(tmp)
+        order = np.argsort(keys, kind="stable")
+        np.save(os.path.join(tmp, "keys.npy"), keys[order])
+        for column, values in columns.items():
+            codes, uniques = pd.factorize(pd.Series(values, dtype=object).iloc[order], sort=True)
+            codes = codes.astype(np.uint32)
+            encoded = [u.encode("utf-8") for u in uniques]
+            np.save(os.path.join(tmp, f"{column}.codes.npy"), codes)
+            np.save(os.path.join(tmp, f"{column}.offsets.npy"),
+                    np.concatenate([[0], np.cumsum([len(e) for e in encoded], dtype=np.uint64)]).astype(np.uint64))
+            with open(os.path.join(tmp, f"{column}.strings"), "wb") as f:
+                f.write(b"".join(encoded))
+            if column in indexed:
+                rows = np.argsort(codes, kind="stable").astype(np.uint32)
+                starts = np.searchsorted(codes[rows], np.arange(len(uniques) + 1)).astype(np.uint64)
+                np.save(os.path.join(tmp, f"{column}.rows.npy"), rows)
+                np.save(os.path.join(tmp, f"{column}.starts.npy"), starts)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def is_base(self) -> bool:
+        return os.path.basename(self.directory).startswith("base-")
+
+    def locate(self, keys: np.ndarray) -> np.ndarray:
+        """Row of every key, -1 where it isn't in this table."""
+        if not len(self.keys):
+            return np.full(len(keys), -1)
+        rows = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[rows] == keys, rows, -1)
+
+    def row(self, row: int) -> Dict[str, str]:
+        return {c: self.strings[c][int(codes[row])] for c, codes in self.codes.items()}
+
+    def matching(self, column: str, value: str) -> np.ndarray:
+        """Rows whose column equals value, through the column's posting list."""
+        code = self.strings[column].find(value)
+        if code is None:
+            return np.empty(0, dtype=np.uint32)
+        starts, rows = self.postings[column]
+        return rows[int(starts[code]):int(starts[code + 1])]
+
+    def columns(self) -> Dict[str, List[str]]:
+        """Every row decoded, column by column (for compaction)."""
+        out = {}
+        for column, codes in self.codes.items():
+            strings = self.strings[column]
+            values = np.array([strings[i] for i in range(len(strings))], dtype=object)
+            out[column] = values[np.asarray(codes)].tolist() if len(values) else []
+        return out
+
+    def close(self):
+        for strings in self.strings.values():
+            strings.close()
+
+
+class PayloadStore:
+    """
+    Side store for product-code payloads keyed by Qdrant point ID, so points
+    carry no description and searches return IDs only. Each ingested chunk
+    is written as a small immutable segment. maybe_compact() folds them into
+    a new base once they are a sizeable fraction of it, and otherwise only
+    merges segments among themselves when there are too many, so small
+    incremental runs don't rewrite the catalogue. Readers see the base and
+    segments through memory maps, newest first, and are never blocked by a
+    write.
+
+    Several processes (API workers, a command-line ingest) can share one
+    directory. Writers serialise on a file lock and number tables from the
+    counter in GENERATION; readers re-list the tables whenever that file
+    changes, so they see other processes' segments and compactions.
+    """
+    def __init__(self, directory: str, columns: Sequence[str] = PAYLOAD_COLUMNS,
+                 indexed: Sequence[str] = ("external_code",), max_segments: int = PAYLOAD_MAX_SEGMENTS,
+                 compact_ratio: float = PAYLOAD_COMPACT_RATIO):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.columns = tuple(columns)
+        self.indexed = tuple(indexed)
+        self.max_segments = max_segments
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._tables: List[PayloadTable] = []  # newest first
+        self._opened: Dict[str, PayloadTable] = {}
+        self._stamp = None
+        with self._compacting(wait=False) as held:
+            if held:
+                self._cleanup()
+        self._sync(force=True)
+        self.maybe_compact()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _listing(self) -> List[Tuple[int, str, str]]:
+        found = []
+        for name in os.listdir(self.directory):
+            match = _TABLE.match(name)
+            if match is not None:
+                found.append((int(match.group(2)), match.group(1), self._path(name)))
+        return sorted(found, reverse=True)
+
+    def _cleanup(self):
+        """Removes what interrupted writes and compactions left behind. Called holding the compaction lock."""
+        cutoff = time.time() - _STALE_TMP_SECONDS
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            # Another process may still be writing a recent one
+            if name.endswith(".tmp") and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        found = self._listing()
+        base = max((seq for seq, kind, _ in found if kind == "base"), default=0)
+        for seq, kind, path in found:
+            if seq < base or (seq == base and kind == "seg"):
+                # Already merged into the base by a compaction that didn't get to clean up
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _sync(self, force: bool = False):
+        """Re-lists the tables if any writer, in this process or another, changed the directory since the last look."""
+        # The counter itself, not the file's inode or mtime: both can repeat across quick rewrites
+        stamp = self._generation()
+        if not force and stamp == self._stamp:
+            return
+        with self._lock:
+            if not force and stamp == self._stamp:
+                return
+            for attempt in range(_SYNC_ATTEMPTS):
+                found = self._listing()
+                base = max((seq for seq, kind, _ in found if kind == "base"), default=0)
+                paths = [path for seq, kind, path in found if seq > base or (seq == base and kind == "base")]
+                try:
+                    opened = {path: self._opened.get(path) or PayloadTable(path, self.columns, self.indexed)
+                              for path in paths}
+                    break
+                except FileNotFoundError:
+                    # Removed by a compaction after the listing; its merged table is published by now
+                    if attempt == _SYNC_ATTEMPTS - 1:
+                        raise
+            # Dropped tables aren't closed: a concurrent read may still use them, the maps go with the objects
+            self._opened = opened
+            self._tables = [opened[path] for path in paths]
+            self._stamp = stamp
+
+    @contextmanager
+    def _writing(self):
+        """Serialises writers across threads and processes."""
+        with self._write_lock, open(self._path("write.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    @contextmanager
+    def _compacting(self, wait: bool = True):
+        """Holds the compaction lock, yielding False instead of waiting if wait is False and it's taken."""
+        if not self._compact_lock.acquire(blocking=wait):
+            yield False
+            return
+        try:
+            with open(self._path("compact.lock"), "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False  # another process is compacting
+                    return
+                yield True
+        finally:
+            self._compact_lock.release()
+
+    def _generation(self) -> int:
+        try:
+            with open(self._path(_GENERATION)) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _advance(self) -> int:
+        """
+        Bumps the counter in GENERATION and returns it. Called while
+        _writing(); the new value numbers a table, and the changed file tells
+        every reader to re-list.
+        """
+        generation = max(max((seq for seq, _, _ in self._listing()), default=0), self._generation()) + 1
+        tmp = self._path(f"{_GENERATION}.new")
+        with open(tmp, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp, self._path(_GENERATION))
+        return generation
+
+    def _write(self, keys: np.ndarray, columns: Dict[str, Sequence[str]]) -> str:
+        tmp = self._path(f"{uuid.uuid4().hex}.tmp")
+        PayloadTable.write(tmp, keys, columns, self.indexed)
+        return tmp
+
+    def __len__(self) -> int:
+        """Rows across tables; a point stored twice before compaction counts twice."""
+        self._sync()
+        return sum(len(t) for t in self._tables)
+
+    @property
+    def segments(self) -> int:
+        self._sync()
+        return len(self._tables)
+
+    def append(self, ids: Sequence[str], payloads: Sequence[Dict[str, Any]]):
+        """Durably stores payloads for ids as a new segment."""
+        if not ids:
+            return
+        keys = point_keys(ids)
+        keys, first = np.unique(keys, return_index=True)
+        columns = {c: [str(payloads[i].get(c, "")) for i in first] for c in self.columns}
+        tmp = self._write(keys, columns)
+        with self._writing():
+            # Numbered and published together, so a compaction either merges a segment or numbers its table below it
+            os.replace(tmp, self._path(f"seg-{self._advance():08d}"))
+        self._sync()
+
+    def get(self, ids: Sequence[str]) -> List[Optional[Dict[str, str]]]:
+        """Payloads for ids, in order; None for points the store doesn't hold."""
+        self._sync()
+        keys = point_keys(ids)
+        found: List[Optional[Dict[str, str]]] = [None] * len(keys)
+        missing = np.arange(len(keys))
+        for table in list(self._tables):
+            if not len(missing):
+                break
+            rows = table.locate(keys[missing])
+            for i, row in zip(missing[rows >= 0], rows[rows >= 0]):
+                found[i] = table.row(row)
+            missing = missing[rows < 0]
+        return found
+
+    def contains(self, ids: Sequence[str]) -> np.ndarray:
+        """Whether the store holds each of ids, without decoding any payload."""
+        self._sync()
+        keys = point_keys(ids)
+        found = np.zeros(len(keys), dtype=bool)
+        for table in list(self._tables):
+            found |= table.locate(keys) >= 0
+        return found
+
+    def _matching(self, column: str, value: str):
+        """(table, rows) whose indexed column equals value, leaving out points a newer table overrides."""
+        if column not in self.indexed:
+            raise ValueError(f"{column} is not indexed")
+        self._sync()
+        tables = list(self._tables)
+        for i, table in enumerate(tables):
+            rows = table.matching(column, value)
+            if not len(rows):
+                continue
+            # A newer copy of the same point shadows this one, whatever its value
+            keys = table.keys[rows]
+            for newer in tables[:i]:
+                live = newer.locate(keys) < 0
+                rows, keys = rows[live], keys[live]
+            if len(rows):
+                yield table, rows
+
+    def lookup(self, column: str, value: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Rows whose indexed column equals value exactly, all of them unless limit is given."""
+        found = []
+        for table, rows in self._matching(column, value):
+            if limit is not None:
+                rows = rows[:limit - len(found)]
+            found.extend(table.row(row) for row in rows)
+            if limit is not None and len(found) >= limit:
+                break
+        return found
+
+    def distinct(self, column: str, value: str, target: str) -> Set[str]:
+        """Distinct target values over every row whose indexed column equals value, decoding each value once."""
+        values = set()
+        for table, rows in self._matching(column, value):
+            strings = table.strings[target]
+            values.update(strings[int(code)] for code in np.unique(table.codes[target][rows]))
+        return values
+
+    def maybe_compact(self):
+        """
+        Folds the segments into the base once they hold more than
+        compact_ratio of its rows; below that, only merges them into one
+        segment if there are more than max_segments.
+        """
+        self._sync()
+        tables = list(self._tables)
+        segments = [t for t in tables if not t.is_base]
+        base_rows = sum(len(t) for t in tables if t.is_base)
+        if sum(len(t) for t in segments) > self.compact_ratio * base_rows:
+            self.compact(wait=False)
+        elif len(segments) > self.max_segments:
+            self.compact(full=False, wait=False)
+
+    def compact(self, full: bool = True, wait: bool = True):
+        """
+        Merges tables into one, the newest copy of each point winning: every
+        table into a new base, or with full=False only the segments into one
+        segment. With wait=False, returns at once if another thread or
+        process is already compacting.
+        """
+        with self._compacting(wait) as held:
+            if not held:
+                return
+            with self._writing():
+                self._sync(force=True)
+                tables = [t for t in self._tables if full or not t.is_base]
+                # A lone segment is still promoted to the base, so the ratio has a base to compare against
+                if not tables or (len(tables) == 1 and (tables[0].is_base or not full)):
+                    return
+                # The merge takes the number after the tables it merges, segments appended meanwhile come after it
+                name = f"{'base' if full else 'seg'}-{self._advance():08d}"
+            keys = np.concatenate([np.asarray(t.keys) for t in tables])
+            columns = {c: [] for c in self.columns}
+            for table in tables:
+                for c, values in table.columns().items():
+                    columns[c].extend(values)
+            # Tables are newest first, so the first occurrence of a key is its latest payload
+            keys, first = np.unique(keys, return_index=True)
+            columns = {c: [values[i] for i in first] for c, values in columns.items()}
+            tmp = self._write(keys, columns)
+            # Listed by number, segments appended while compacting stay in front of the merged table
+            with self._writing():
+                os.replace(tmp, self._path(name))
+                self._advance()
+            # Open maps keep merged files alive, so they can be unlinked right away
+            for table in tables:
+                shutil.rmtree(table.directory, ignore_errors=True)
+            with self._writing():
+                self._advance()
+        self._sync()
+
+    def close(self):
+        with self._lock:
+            tables, self._tables, self._opened = list(self._opened.values()), [], {}
+        for table in tables:
+            table.close()
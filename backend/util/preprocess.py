@@ -1,4 +1,8 @@
 import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class DataPreprocessor:
     def __init__(self):
@@ -12,6 +16,11 @@ class DataPreprocessor:
         text = re.sub(r'[^0-9A-Za-z\s]', '', text) # Remove symbols except spaces
         text = re.sub(r'\s+', ' ', text).strip()   # Collapse whitespace
         return text.lower()
+    def clean_series(self, texts: "pd.Series") -> "pd.Series":
+        """Column-wise clean_text for a whole CSV chunk."""
+        texts = texts.astype(str).str.translate(self.umlaut_map)
+        texts = texts.str.replace(r'[^0-9A-Za-z\s]', '', regex=True)
+        return texts.str.replace(r'\s+', ' ', regex=True).str.strip().str.lower()
     def preprocess_row(self, external: str, description: str, internal: str):
         """Combine and clean fields, return text and payload metadata."""
         combined = f"{external} {description}"
@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from util.manifest import CrawlManifest
+from util.answer_cache import AnswerCache
+from util.keyword_index import KeywordIndex
+from util.vectorstore import open_index, index_exists, index_size
+
+# How many collections may stay open and roughly how much RAM they may hold
+REGISTRY_MAX_COLLECTIONS = int(os.getenv("REGISTRY_MAX_COLLECTIONS", "32"))
+REGISTRY_MEMORY_BUDGET_MB = int(os.getenv("REGISTRY_MEMORY_BUDGET_MB", "1024"))
+# Rough resident cost of one chunk: a 1536-d float32 embedding plus its text
+CHUNK_BYTES = int(os.getenv("REGISTRY_CHUNK_BYTES", str(1536 * 4 + 1024)))
+
+
+@dataclass
+class Collection:
+    name: str
+    vectorstore: Any
+    manifest: CrawlManifest
+    keywords: KeywordIndex
+    qa_chain: Any = None
+    answer_cache: AnswerCache = field(default_factory=AnswerCache)
+    chunks: int = 0
+    refs: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+    @property
+    def approx_bytes(self) -> int:
+        return self.chunks * CHUNK_BYTES
+
+    def refresh_size(self):
+        self.chunks = index_size(self.vectorstore)
+
+    def close(self):
+        self.manifest.close()
+        self.keywords.close()
+        # Chroma has nothing to release, the FAISS store holds a SQLite connection
+        if hasattr(self.vectorstore, "close"):
+            self.vectorstore.close()
+
+
+class CollectionRegistry:
+    """
+    Named document collections, each with its own vector store, keyword
+    index, crawl manifest and QA chain. Open collections are kept in LRU order
+    and idle ones are closed once the count or memory budget is exceeded;
+    their data stays on disk and is reopened on next use.
+    """
+    def __init__(self, build_chain: Callable[[Any, KeywordIndex], Any], max_collections: int = REGISTRY_MAX_COLLECTIONS,
+                 memory_budget_mb: int = REGISTRY_MEMORY_BUDGET_MB):
+        self.build_chain = build_chain
+        self.max_collections = max_collections
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._open: "OrderedDict[str, Collection]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, name: str, create: bool = True) -> Optional[Collection]:
+        """Returns the open collection, opening it from disk if needed. Callers must release it."""
+        with self._lock:
+            collection = self._open.get(name)
+            if collection is not None:
+                self._open.move_to_end(name)
+                collection.refs += 1
+                collection.last_used = time.monotonic()
+                return collection
+        if not create and not index_exists(name):
+            return None
+        # Open outside the lock, another caller may race us to it
+        vectorstore, manifest, keywords = open_index(name)
+        opened = Collection(name=name, vectorstore=vectorstore, manifest=manifest, keywords=keywords)
+        opened.refresh_size()
+        opened.qa_chain = self.build_chain(vectorstore, keywords)
+        with self._lock:
+            collection = self._open.get(name)
+            if collection is None:
+                collection = self._open[name] = opened
+            else:
+                opened.close()
+            self._open.move_to_end(name)
+            collection.refs += 1
+            collection.last_used = time.monotonic()
+            self._evict()
+        return collection
+
+    def release(self, collection: Optional[Collection]):
+        if collection is None:
+            return
+        with self._lock:
+            collection.refs -= 1
+            collection.last_used = time.monotonic()
+            self._evict()
+
+    @asynccontextmanager
+    async def use(self, name: str, create: bool = True):
+        """Leases a collection for the duration of a request. Yields None if it doesn't exist and create is False."""
+        collection = await asyncio.to_thread(self.acquire, name, create)
+        try:
+            yield collection
+        finally:
+            self.release(collection)
+
+    def _evict(self):
+        # Called with the lock held; collections in use are never closed
+        def over_budget():
+            used = sum(c.approx_bytes for c in self._open.values())
+            return len(self._open) > self.max_collections or used > self.memory_budget
+
+        for name in list(self._open):
+            if not over_budget():
+                break
+            collection = self._open[name]
+            if collection.refs > 0:
+                continue
+            del self._open[name]
+            collection.close()
+            print(f"Evicted idle collection {name}")
+
+    def close(self):
+        with self._lock:
+            for collection in self._open.values():
+                collection.close()
+            self._open.clear()
@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from util.metrics import span
+from util.tokens import count_tokens
+
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "50"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))  # idle seconds before a session is dropped
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+# Recent messages kept verbatim; older ones are folded into a rolling summary
+MEMORY_WINDOW_TOKENS = int(os.getenv("MEMORY_WINDOW_TOKENS", "1000"))
+MEMORY_SUMMARY_WORDS = int(os.getenv("MEMORY_SUMMARY_WORDS", "150"))
+MEMORY_LLM_MODEL = os.getenv("MEMORY_LLM_MODEL", "gpt-4o-mini")
+
+CONDENSE_PROMPT = """Given the conversation so far and a follow-up question, rewrite the follow-up as a standalone question that can be understood without the conversation. Keep product codes, names and numbers exactly as written. If the question is already standalone, return it unchanged. Answer with the question only.
+
+Summary of the earlier conversation:
+{summary}
+
+Recent messages:
+{recent}
+
+Follow-up question: {question}
+Standalone question:"""
+
+SUMMARY_PROMPT = """Update the running summary of a conversation with the new messages. Keep the facts, names, codes, numbers and user preferences needed to answer follow-up questions. Use at most {words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
+
+
+@dataclass
+class Message:
+    seq: int
+    role: str
+    content: str
+    tokens: int
+
+
+@dataclass
+class Session:
+    messages: Deque[Message]
+    summary: str = ""
+    last_used: float = field(default_factory=time.monotonic)
+    summarizing: bool = False
+    # (question, last message seq) -> standalone question, so retrieval and the answer share one LLM call
+    condensed: Tuple[Any, str] = (None, "")
+
+
+def _transcript(messages: List[Message]) -> str:
+    return "\n".join(f"{m.role}: {m.content}" for m in messages)
+
+
+class SessionStore:
+    """
+    Per-session conversation memory. Each session is a ring buffer of
+    messages, bounded in turns. Sessions are bounded in number and dropped
+    after SESSION_TTL idle seconds. Prompts see a token-budgeted window of
+    recent messages plus a rolling summary of older ones, which an LLM
+    maintains in the background. Follow-up questions are condensed into
+    standalone ones before retrieval. Without a session ID there is no
+    memory: questions are used as asked and turns aren't recorded.
+    """
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, max_turns: int = SESSION_MAX_TURNS,
+                 ttl: float = SESSION_TTL, window_tokens: int = MEMORY_WINDOW_TOKENS, llm=None):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.window_tokens = window_tokens
+        self._llm = llm
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from util.llm_clients import chat_model
+            self._llm = chat_model(MEMORY_LLM_MODEL, temperature=0)
+        return self._llm
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return [{"role": m.role, "content": m.content} for m in session.messages] if session else []
+
+    def append(self, session_id: str, role: str, content: str):
+        tokens = count_tokens(content)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                # One turn is a user and an assistant message
+                session = self._sessions[session_id] = Session(deque(maxlen=2 * self.max_turns))
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            self._seq += 1
+            session.messages.append(Message(self._seq, role, content, tokens))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def context(self, session_id: str) -> Tuple[str, List[Message], List[Message]]:
+        """The session's summary, the messages older than the token window and the messages within it."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return "", [], []
+            messages = list(session.messages)
+            summary = session.summary
+        used, start = 0, len(messages)
+        while start > 0 and used + messages[start - 1].tokens <= self.window_tokens:
+            start -= 1
+            used += messages[start].tokens
+        return summary, messages[:start], messages[start:]
+
+    def remember(self, session_id: Optional[str], question: str, answer: str):
+        """Records a finished turn and, if the window overflowed, summarises the overflow in the background."""
+        if not session_id:
+            return
+        self.append(session_id, "user", question)
+        self.append(session_id, "assistant", answer)
+        _, older, _ = self.context(session_id)
+        if older:
+            task = asyncio.get_running_loop().create_task(self.summarize(session_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def summarize(self, session_id: str):
+        """Folds messages that fell out of the token window into the session's rolling summary."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.summarizing:
+                return
+            session.summarizing = True
+        try:
+            summary, older, _ = self.context(session_id)
+            if not older:
+                return
+            prompt = SUMMARY_PROMPT.format(words=MEMORY_SUMMARY_WORDS, summary=summary or "(none)",
+                                           messages=_transcript(older))
+            with span("summarize"):
+                updated = (await self.llm.ainvoke(prompt)).content.strip()
+            with self._lock:
+                session.summary = updated
+                # Appends during the call go to the right end, so drop exactly what was summarised
+                while session.messages and session.messages[0].seq <= older[-1].seq:
+                    session.messages.popleft()
+        except Exception as e:
+            print(f"Summarising session {session_id} failed: {e}")
+        finally:
+            session.summarizing = False
+
+    async def condense(self, session_id: Optional[str], question: str) -> str:
+        """Rewrites a follow-up question as a standalone one using the session's memory. Unchanged without history."""
+        if not session_id:
+            return question
+        summary, _, recent = self.context(session_id)
+        if not summary and not recent:
+            return question
+        key = (question, recent[-1].seq if recent else None)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and session.condensed[0] == key:
+                return session.condensed[1]
+        prompt = CONDENSE_PROMPT.format(summary=summary or "(none)", recent=_transcript(recent) or "(none)",
+                                        question=question)
+        try:
+            with span("condense"):
+                standalone = (await self.llm.ainvoke(prompt)).content.strip() or question
+        except Exception as e:
+            print(f"Condensing a question for session {session_id} failed: {e}")
+            return question
+        if session is not None:
+            session.condensed = (key, standalone)
+        return standalone
+
+    def sweep(self) -> int:
+        """Drops sessions idle for longer than the TTL. Returns how many were dropped."""
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if session.last_used < cutoff]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+    async def run_sweeper(self, interval: float = SESSION_SWEEP_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
@@ -0,0 +1,22 @@
+from typing import List
+
+_encoding = None
+
+
+def get_encoding():
+    """The tokenizer used for chunk sizes and prompt budgets (GPT-4's cl100k_base), loaded once."""
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def split_tokens(text: str, max_tokens: int) -> List[str]:
+    """Cuts text into consecutive pieces of at most max_tokens tokens."""
+    tokens = get_encoding().encode(text, disallowed_special=())
+    return [get_encoding().decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
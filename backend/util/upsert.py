@@ -1,38 +1,28 @@
 import glob
 import pandas as pd
-from qdrant_client.models import PointStruct
+
+from util.ingest_pipeline import IngestPipeline, content_ids
 
 preprocessor = DataPreprocessor()
 embedder = Embedder()
 qdrant_client = qdrant  # from above setup
-current_id = 0
-
-# Ingest all CSVs in the data folder
-for file_path in glob.glob("/path/to/data/*.csv"):
-    for chunk in pd.read_csv(file_path, sep=';', chunksize=100000):
-        # Drop rows with any NaNs in relevant columns
-        chunk = chunk.dropna(subset=["external code", "description", "internal code"])
-        texts = []
-        payloads = []
-        for _, row in chunk.iterrows():
-            clean_text, payload = preprocessor.preprocess_row(
-                row["external code"], row["description"], row["internal code"]
-            )
-            texts.append(clean_text)
-            payloads.append(payload)
-
-        # Generate embeddings in one batch
-        embeddings = embedder.encode(texts)  # returns NumPy array shape (N,384)
 
-        # Prepare Qdrant PointStructs for upsert
-        points = []
-        for i, vector in enumerate(embeddings):
-            points.append(PointStruct(
-                id=current_id + i,
-                vector=vector.tolist(),
-                payload=payloads[i]
-            ))
-        # Upsert batch into Qdrant
-        qdrant_client.upsert(collection_name=collection_name, points=points)
+def prepare_chunk(chunk: pd.DataFrame):
+    # Drop rows with any NaNs in relevant columns
+    chunk = chunk.dropna(subset=["external code", "description", "internal code"])
+    # Same text as preprocess_row, cleaned column-wise instead of row by row
+    texts = preprocessor.clean_series(chunk["external code"].astype(str) + " " + chunk["description"].astype(str))
+    payloads = [
+        {"external_code": e, "internal_code": i}
+        for e, i in zip(chunk["external code"].tolist(), chunk["internal code"].tolist())
+    ]
+    ids = content_ids(chunk["external code"], chunk["description"], chunk["internal code"])
+    return ids, texts.tolist(), payloads
 
-        current_id += len(points)
\ No newline at end of file
+# Ingest all CSVs in the data folder; reads, cleaning, embedding and upserts overlap,
+# a rerun after a failure skips the chunks that were already upserted, and rows whose
+# content-derived ID is already in the collection are not embedded again
+pipeline = IngestPipeline(qdrant_client, collection_name, embedder, prepare_chunk,
+                          checkpoint_path="/path/to/data/.ingest_checkpoint.json")
+stats = pipeline.run(sorted(glob.glob("/path/to/data/*.csv")))
+print(f"Upserted {stats['points_upserted']} points in {stats['seconds']:.1f}s ({stats['rows_per_sec']:.0f} rows/s)")
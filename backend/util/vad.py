@@ -0,0 +1,52 @@
+import os
+import math
+from array import array
+from typing import Optional
+
+VAD_RMS_THRESHOLD = float(os.getenv("VAD_RMS_THRESHOLD", "500"))
+VAD_START_MS = int(os.getenv("VAD_START_MS", "60"))
+VAD_STOP_MS = int(os.getenv("VAD_STOP_MS", "600"))
+
+
+def rms(pcm: bytes) -> float:
+    """Root mean square of 16-bit little-endian mono PCM."""
+    samples = array("h")
+    samples.frombytes(pcm[: len(pcm) - len(pcm) % 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+class EnergyVAD:
+    """
+    Energy-based voice activity detector for streamed 16-bit PCM. Speech must
+    stay above the threshold for start_ms to open a turn and below it for
+    stop_ms to close it, so short clicks and pauses between words are ignored.
+    """
+    def __init__(self, sample_rate: int, threshold: float = VAD_RMS_THRESHOLD,
+                 start_ms: int = VAD_START_MS, stop_ms: int = VAD_STOP_MS):
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.start_ms = start_ms
+        self.stop_ms = stop_ms
+        self.speaking = False
+        self._run_ms = 0.0  # how long the signal has been on the other side of the threshold
+
+    def reset(self):
+        self.speaking, self._run_ms = False, 0.0
+
+    def process(self, pcm: bytes) -> Optional[str]:
+        """Feeds one audio frame, returns "start" or "stop" when the speaking state flips."""
+        duration_ms = 1000 * len(pcm) / (2 * self.sample_rate)
+        loud = rms(pcm) >= self.threshold
+        if loud != self.speaking:
+            self._run_ms += duration_ms
+        else:
+            self._run_ms = 0.0
+        if not self.speaking and self._run_ms >= self.start_ms:
+            self.speaking, self._run_ms = True, 0.0
+            return "start"
+        if self.speaking and self._run_ms >= self.stop_ms:
+            self.speaking, self._run_ms = False, 0.0
+            return "stop"
+        return None
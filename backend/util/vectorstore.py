@@ -0,0 +1,71 @@
+import os
+import re
+from typing import Any, Tuple
+
+from util.manifest import CrawlManifest
+from util.keyword_index import KeywordIndex
+
+# Where the vector collections and their crawl manifests live across restarts
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "data/vectorstore")
+DEFAULT_COLLECTION = os.getenv("VECTOR_STORE_COLLECTION", "documents")
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # chroma or faiss
+
+# Chroma's own naming rules for collections
+_COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{1,61}[A-Za-z0-9]$")
+
+
+def valid_collection_name(name: str) -> bool:
+    return bool(_COLLECTION_NAME.match(name)) and ".." not in name
+
+
+def manifest_path(collection_name: str, persist_directory: str = VECTOR_STORE_DIR) -> str:
+    return os.path.join(persist_directory, f"manifest-{collection_name}.sqlite")
+
+
+def keyword_index_path(collection_name: str, persist_directory: str = VECTOR_STORE_DIR) -> str:
+    return os.path.join(persist_directory, f"keywords-{collection_name}.sqlite")
+
+
+def index_exists(collection_name: str, persist_directory: str = VECTOR_STORE_DIR) -> bool:
+    """A collection exists once it has been crawled, which always writes its manifest."""
+    return os.path.exists(manifest_path(collection_name, persist_directory))
+
+
+def open_index(collection_name: str = DEFAULT_COLLECTION, persist_directory: str = VECTOR_STORE_DIR,
+               backend: str = VECTOR_BACKEND) -> Tuple[Any, CrawlManifest, KeywordIndex]:
+    """
+    Opens (or creates) a persistent collection in the selected backend, its
+    crawl manifest and its BM25 keyword index. All of them write through to
+    disk, so /crawl updates survive restarts without an explicit save.
+    """
+    # LangChain, the vector backends and the OpenAI client load here rather than at import
+    from util.embedding_cache import CachedEmbeddings
+    from util.llm_clients import embeddings as openai_embeddings
+
+    os.makedirs(persist_directory, exist_ok=True)
+    embeddings = CachedEmbeddings(openai_embeddings(OPENAI_EMBEDDING_MODEL), OPENAI_EMBEDDING_MODEL)
+    if backend == "faiss":
+        from util.faiss_store import FaissStore
+        vectorstore = FaissStore(os.path.join(persist_directory, "faiss", collection_name), embeddings)
+    elif backend == "chroma":
+        from langchain_chroma import Chroma
+        vectorstore = Chroma(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            persist_directory=persist_directory,
+        )
+    else:
+        raise ValueError(f"Unknown vector backend: {backend}")
+    keywords = KeywordIndex(keyword_index_path(collection_name, persist_directory))
+    if keywords.count() == 0 and index_size(vectorstore) > 0:
+        # Collections crawled before the keyword index existed
+        stored = vectorstore.get(include=["documents", "metadatas"])
+        keywords.add(stored["ids"], stored["documents"], stored["metadatas"])
+    return vectorstore, CrawlManifest(manifest_path(collection_name, persist_directory)), keywords
+
+
+def index_size(vectorstore) -> int:
+    if hasattr(vectorstore, "_collection"):  # Chroma
+        return vectorstore._collection.count()
+    return vectorstore.count()
@@ -0,0 +1,163 @@
+import re
+import time
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+from pipecat.frames.frames import (
+    Frame, InputAudioRawFrame, MetricsFrame, StartInterruptionFrame,
+    TranscriptionFrame, TTSAudioRawFrame, TTSSpeakFrame,
+    UserStartedSpeakingFrame, UserStoppedSpeakingFrame,
+)
+from pipecat.metrics.metrics import ProcessingMetricsData, TTFBMetricsData, TTSUsageMetricsData
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from util.metrics import metrics, record, span
+from util.vad import EnergyVAD
+
+# A sentence ends at . ! ? or a newline followed by whitespace
+_SENTENCE_END = re.compile(r"(?<=[.!?\n])\s+")
+MIN_SENTENCE_CHARS = 20
+
+
+def split_sentences(buffer: str):
+    """Splits complete sentences off the front of buffer, returns (sentences, remainder)."""
+    parts = _SENTENCE_END.split(buffer)
+    sentences, current = [], ""
+    for part in parts[:-1]:
+        current = f"{current} {part}".strip()
+        # Merge very short fragments so TTS isn't called per abbreviation
+        if len(current) >= MIN_SENTENCE_CHARS:
+            sentences.append(current)
+            current = ""
+    remainder = f"{current} {parts[-1]}".strip() if current else parts[-1]
+    return sentences, remainder
+
+
+class VADProcessor(FrameProcessor):
+    """Marks turn boundaries in the incoming audio stream with User{Started,Stopped}SpeakingFrame."""
+    def __init__(self, sample_rate: int, **kwargs):
+        super().__init__(**kwargs)
+        self.vad = EnergyVAD(sample_rate)
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, InputAudioRawFrame):
+            event = self.vad.process(frame.audio)
+            if event == "start":
+                await self.push_frame(UserStartedSpeakingFrame(), direction)
+            await self.push_frame(frame, direction)
+            if event == "stop":
+                await self.push_frame(UserStoppedSpeakingFrame(), direction)
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            # Explicit end of turn from the client, only meaningful mid-utterance
+            if self.vad.speaking:
+                self.vad.reset()
+                await self.push_frame(frame, direction)
+        else:
+            await self.push_frame(frame, direction)
+
+
+class VoiceRAGProcessor(FrameProcessor):
+    """
+    Turns final transcriptions into spoken RAG answers. The answer is streamed
+    to TTS sentence by sentence so playback begins before generation finishes.
+    A new utterance from the user cancels the reply in progress.
+    """
+    def __init__(self,
+                 retrieve: Callable[[str], Awaitable[Optional[List[Any]]]],
+                 generate: Callable[[str, List[Any]], AsyncIterator[str]],
+                 send_json: Callable[[dict], Awaitable[None]],
+                 on_turn: Callable[[str, str], None],
+                 no_context_reply: str,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.retrieve = retrieve
+        self.generate = generate
+        self.send_json = send_json
+        self.on_turn = on_turn
+        self.no_context_reply = no_context_reply
+        self._reply: Optional[asyncio.Task] = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, TranscriptionFrame):
+            await self.send_json({"type": "transcription", "text": frame.text})
+            self._reply = asyncio.create_task(self._answer(frame.text))
+        elif isinstance(frame, UserStartedSpeakingFrame):
+            await self.push_frame(frame, direction)
+            if self._reply is not None and not self._reply.done():
+                self._reply.cancel()
+                await self.push_frame(StartInterruptionFrame(), direction)
+        else:
+            await self.push_frame(frame, direction)
+
+    async def _answer(self, question: str):
+        try:
+            await self._answer_turn(question)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Voice turn failed: {e}")
+
+    async def _answer_turn(self, question: str):
+        start = time.perf_counter()
+        with span("voice_retrieve"):
+            docs = await self.retrieve(question)
+        if docs is None:
+            await self._speak(self.no_context_reply)
+            await self.send_json({"type": "response", "text": self.no_context_reply})
+            return
+        answer, buffer, spoken = [], "", False
+        async for token in self.generate(question, docs):
+            answer.append(token)
+            sentences, buffer = split_sentences(buffer + token)
+            for sentence in sentences:
+                if not spoken:
+                    # What the user waits for, from the final transcription to the first sentence sent to TTS
+                    record("voice_first_sentence", time.perf_counter() - start)
+                    spoken = True
+                await self._speak(sentence)
+        if buffer.strip():
+            await self._speak(buffer.strip())
+        record("voice_turn", time.perf_counter() - start)
+        answer_text = "".join(answer)
+        await self.send_json({"type": "response", "text": answer_text})
+        self.on_turn(question, answer_text)
+
+    async def _speak(self, sentence: str):
+        await self.send_json({"type": "response_delta", "text": sentence})
+        await self.push_frame(TTSSpeakFrame(text=sentence))
+
+    async def cleanup(self):
+        if self._reply is not None:
+            self._reply.cancel()
+        await super().cleanup()
+
+
+class WebSocketAudioSink(FrameProcessor):
+    """Forwards synthesized audio to the client as binary messages."""
+    def __init__(self, send_bytes: Callable[[bytes], Awaitable[None]], **kwargs):
+        super().__init__(**kwargs)
+        self.send_bytes = send_bytes
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, TTSAudioRawFrame):
+            await self.send_bytes(frame.audio)
+        await self.push_frame(frame, direction)
+
+
+class VoiceMetricsSink(FrameProcessor):
+    """Records the MetricsFrames pipecat services emit (STT/TTS time to first byte, processing time, TTS characters)."""
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, MetricsFrame):
+            for data in frame.data:
+                if isinstance(data, TTFBMetricsData):
+                    metrics.observe("voice_service_seconds", data.value, processor=data.processor, metric="ttfb")
+                elif isinstance(data, ProcessingMetricsData):
+                    metrics.observe("voice_service_seconds", data.value, processor=data.processor, metric="processing")
+                elif isinstance(data, TTSUsageMetricsData):
+                    metrics.inc("tts_characters_total", data.value, processor=data.processor)
+            return
+        await self.push_frame(frame, direction)
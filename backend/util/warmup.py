@@ -0,0 +1,61 @@
+import os
+import time
+import asyncio
+import inspect
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from util.executors import run_blocking
+
+# Preload models and connections in the background at startup; /readyz fails until it's done
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+
+class Warmup:
+    """
+    Startup steps (imports, model loads, connection set-up) run once in the
+    background, so the server accepts connections immediately while the
+    readiness probe holds traffic back until the expensive first-use costs
+    are paid. A failed step is reported but doesn't block readiness: the
+    work is retried lazily by the request that needs it.
+    """
+    def __init__(self, enabled: bool = WARMUP):
+        self.enabled = enabled
+        self._steps: List[Tuple[str, Callable[[], Any]]] = []
+        self.status: Dict[str, Dict[str, Any]] = {}
+        self.ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, fn: Callable[[], Any]):
+        """Registers a step: a coroutine function, or a blocking function run on the worker pool."""
+        # Re-entering a lifespan (tests, the benchmarks) re-registers the same steps
+        self._steps = [step for step in self._steps if step[0] != name]
+        self._steps.append((name, fn))
+
+    async def run(self):
+        for name, fn in self._steps:
+            if not self.enabled:
+                break
+            start = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(fn):
+                    await fn()
+                else:
+                    await run_blocking(fn)
+                self.status[name] = {"ok": True, "seconds": round(time.perf_counter() - start, 3)}
+            except Exception as e:
+                print(f"Warm-up step {name} failed: {e}")
+                self.status[name] = {"ok": False, "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+        self.ready.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+warmup = Warmup()
@@ -1,10 +1,20 @@
-from sentence_transformers import SentenceTransformer
+from typing import List
+
+import numpy as np
+
+from util.embedding_backend import EMBEDDING_BACKEND, encode_bucketed, load_model
+from util.embedding_cache import EmbeddingCache, get_embedding_cache
 
 class Embedder:
-    def __init__(self):
+    def __init__(self, cache: EmbeddingCache = None, backend: str = EMBEDDING_BACKEND):
         # Load a multilingual MiniLM model (free, Apache-2.0 license)
-        self.model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+        self.model_name = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+        self.model = load_model(self.model_name, backend)  # "torch" or int8 "onnx", same vectors API
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.cache = cache or get_embedding_cache()
+        self.cache_namespace = f"{self.model_name}@{backend}"  # quantized vectors differ slightly
     
     def encode(self, texts: List[str]) -> List[List[float]]:
-        """Encode a list of preprocessed texts into vectors."""
-        return self.model.encode(texts, show_progress_bar=False, batch_size=64)
+        """Encode a list of preprocessed texts into vectors, reusing cached ones."""
+        vectors = self.cache.embed(self.cache_namespace, texts, lambda todo: encode_bucketed(self.model, todo))
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
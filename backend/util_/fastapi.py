@@ -1,17 +1,42 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List
-import openai
-import math
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import os
+import asyncio
+from openai import AsyncOpenAI
 
-app = FastAPI()
+from util.code_search import CodeSearcher
+from util.code_resolver import CodeResolver
+from util.payload_store import PAYLOAD_STORE_DIR, PayloadStore
+from util import executors
+from util.executors import run_blocking
+from util.jobs import JobContext, JobQueue, JobStore
+from routers.job_route import create_router
+from util import metrics
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    executors.install()
+    await jobs.start()
+    yield
+    await jobs.stop()
+    payloads.close()
+    executors.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(metrics.instrument)
 
 # Initialize components
 preprocessor = DataPreprocessor()
 embedder = Embedder()
 qdrant_client = QdrantClient(url="http://localhost:6333")
 collection_name = "my_collection"
-ingestor = QdrantIngestor(qdrant_client, collection_name, embedder, preprocessor)
+# Codes and descriptions by point ID, so points stay small and searches return IDs only
+payloads = PayloadStore(os.path.join(PAYLOAD_STORE_DIR, collection_name))
+ingestor = QdrantIngestor(qdrant_client, collection_name, embedder, preprocessor, payload_store=payloads)
+searcher = CodeSearcher(qdrant_client, collection_name, embedder, limit=5, payloads=payloads)
+resolver = CodeResolver(AsyncOpenAI())
 
 # Pydantic models
 class IngestRequest(BaseModel):
@@ -20,60 +45,71 @@ class IngestRequest(BaseModel):
 class QueryRequest(BaseModel):
     external_code: str
     description: str
+    internal_codes: Optional[List[str]] = None  # only consider neighbours with one of these internal codes
+
+class BatchQueryRequest(BaseModel):
+    items: List[QueryRequest]
 
-@app.post("/ingest")
-def ingest_data(req: IngestRequest):
+@app.post("/ingest", status_code=202)
+async def ingest_data(req: IngestRequest):
+    """Queues an ingest job; poll /jobs/{job_id} or stream /jobs/{job_id}/events for progress."""
+    if not os.path.isdir(req.folder_path):
+        raise HTTPException(status_code=400, detail=f"No such folder: {req.folder_path}")
+    job_id = jobs.submit("ingest", req.model_dump())
+    return {"status": "queued", "job_id": job_id}
+
+async def ingest_job(ctx: JobContext) -> dict:
+    run = asyncio.ensure_future(run_blocking(ingestor.ingest_csv_folder, ctx.params["folder_path"], ctx.cancel_event))
     try:
-        ingestor.ingest_csv_folder(req.folder_path)
-        return {"status": "ingestion completed"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        while not run.done():
+            await asyncio.wait({run}, timeout=1)
+            ctx.progress(**ingestor.pipeline.progress())
+    except asyncio.CancelledError:
+        # Cancelled or shutting down: stop reading, but let in-flight chunks finish so the
+        # checkpoint matches what was upserted. The queue decides between cancelled and requeued.
+        ctx.cancel_event.set()
+        await asyncio.gather(run, return_exceptions=True)
+        raise
+    return run.result()
 
-@app.post("/query")
-def query_code(req: QueryRequest):
+# The ingestor's pipeline runs one folder at a time
+jobs = JobQueue(JobStore())
+jobs.register("ingest", ingest_job, workers=1)
+app.include_router(create_router(jobs))
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return metrics.metrics_response()
+
+def query_text(req: QueryRequest) -> str:
     # Clean input
     ext = preprocessor.clean_text(req.external_code)
     desc = preprocessor.clean_text(req.description)
-    query_text = ext + " " + desc
-
-    # Embed and search Qdrant
-    query_vec = embedder.encode([query_text])[0]
-    results = qdrant_client.search(
-        collection_name=collection_name,
-        query_vector=query_vec.tolist(),
-        limit=5
-    )
-    if not results:
-        return {"internal_code": None, "confidence": 0.0}
-
-    # Build context from top results
-    context = ""
-    for res in results:
-        payload = res.payload
-        context += f"External: {payload.get('external_code','')}, Description: {payload.get('description','')}\n"
-    context = context.strip()
+    return ext + " " + desc
 
-    # Prepare LLM prompt (classification of internal code)
-    prompt = (
-        f"Context of similar entries:\n{context}\n\n"
-        f"Given the external code '{req.external_code}' and description '{req.description}', "
-        "predict the *internal code*. Answer with the code only."
-    )
+def exact_match(req: QueryRequest) -> Optional[dict]:
+    """A known external code answers directly from the payload index, without embedding or search."""
+    code = searcher.exact(preprocessor.clean_text(req.external_code))
+    if code is None or (req.internal_codes and code not in req.internal_codes):
+        return None
+    return {"internal_code": code, "confidence": 1.0, "source": "exact"}
 
-    # Call OpenAI (using chat completion with logprobs for confidence)
-    response = openai.ChatCompletion.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.0,
-        max_tokens=10,
-        logprobs=5  # retrieve logprobs for confidence
-    )
-    choice = response.choices[0]
-    code_prediction = choice.message['content'].strip()
-
-    # Compute confidence from token logprobs (as exp(logprob))
-    # Assume the code is a single token or first token
-    logprob = choice.logprobs.token_logprobs[0] if choice.logprobs.token_logprobs else None
-    confidence = math.exp(logprob) if logprob is not None else None
+@app.post("/query")
+async def query_code(req: QueryRequest):
+    exact = exact_match(req)
+    if exact is not None:
+        return exact
+    # Embed and search Qdrant; concurrent requests share one forward pass and one batch search
+    results = await searcher.search(query_text(req), req.internal_codes)
+    # Neighbour vote first, the LLM only sees ambiguous lookups
+    return await resolver.resolve(req.external_code, req.description, results)
 
-    return {"internal_code": code_prediction, "confidence": confidence}
+@app.post("/query/batch")
+async def query_code_batch(req: BatchQueryRequest):
+    """Bulk lookup: resolves every item like /query, sharing embedding and search batches."""
+    answers = [exact_match(item) for item in req.items]
+    rest = [item for item, answer in zip(req.items, answers) if answer is None]
+    results = await asyncio.to_thread(searcher.search_texts, [query_text(item) for item in rest],
+                                      [tuple(item.internal_codes or ()) or None for item in rest])
+    resolved = iter(await resolver.resolve_many([(item.external_code, item.description) for item in rest], results))
+    return {"results": [answer if answer is not None else next(resolved) for answer in answers]}
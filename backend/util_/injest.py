@@ -1,45 +1,63 @@
+import os
+import glob
+import threading
+from typing import TYPE_CHECKING, Optional
+
 import pandas as pd
-from qdrant_client.http.models import PointStruct
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PayloadSchemaType
+
+from util.ingest_pipeline import IngestPipeline, content_ids
+from util.payload_store import PayloadStore
+from util_.preprocess import DataPreprocessor
+
+if TYPE_CHECKING:
+    # Any object with encode(texts) works, e.g. the benchmark's model-free stub
+    from util_.embed import Embedder
+
+INGEST_CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT_PATH", "data/ingest_checkpoint.json")
+# Kept on the Qdrant points (keyword-indexed) for filtered search; descriptions only live in the payload store
+POINT_FIELDS = ("external_code", "internal_code")
 
 class QdrantIngestor:
-    def __init__(self, qdrant_client: QdrantClient, collection_name: str, embedder: Embedder, preprocessor: DataPreprocessor):
+    def __init__(self, qdrant_client: QdrantClient, collection_name: str, embedder: "Embedder", preprocessor: DataPreprocessor,
+                 upsert_workers: int = None, checkpoint_path: str = INGEST_CHECKPOINT_PATH,
+                 payload_store: Optional[PayloadStore] = None):
         self.client = qdrant_client
         self.collection = collection_name
         self.embedder = embedder
         self.pre = preprocessor
+        kwargs = {"upsert_workers": upsert_workers} if upsert_workers else {}
+        self.pipeline = IngestPipeline(qdrant_client, collection_name, embedder, self.prepare_chunk,
+                                       checkpoint_path=checkpoint_path, payload_store=payload_store,
+                                       point_fields=POINT_FIELDS, **kwargs)
+
+    def create_payload_indexes(self):
+        """Keyword indexes on the code fields, so filtered searches don't scan payloads. Idempotent."""
+        for field in POINT_FIELDS:
+            self.client.create_payload_index(self.collection, field_name=field, field_schema=PayloadSchemaType.KEYWORD)
+
+    def ingest_csv_folder(self, folder_path: str, cancel: threading.Event = None):
+        csv_files = sorted(glob.glob(os.path.join(folder_path, "*.csv")))
+        self.create_payload_indexes()
+        return self.pipeline.run(csv_files, cancel)
+
+    def ingest_csv_file(self, file_path: str, cancel: threading.Event = None):
+        self.create_payload_indexes()
+        return self.pipeline.run([file_path], cancel)
 
-    def ingest_csv_folder(self, folder_path: str):
-        import os, glob
-        csv_files = glob.glob(os.path.join(folder_path, "*.csv"))
-        for csv_file in csv_files:
-            self.ingest_csv_file(csv_file)
-
-    def ingest_csv_file(self, file_path: str):
-        # Read CSV in chunks to handle large size
-        for chunk in pd.read_csv(file_path, sep=";", chunksize=100000):
-            records = []
-            for _, row in chunk.iterrows():
-                if pd.isna(row['external code']) or pd.isna(row['description']) or pd.isna(row['internal code']):
-                    continue  # drop incomplete rows
-                ext = self.pre.clean_text(str(row['external code']))
-                desc = self.pre.clean_text(str(row['description']))
-                if not ext or not desc:
-                    continue
-                text = ext + " " + desc
-                payload = {
-                    "external_code": ext,
-                    "description": desc,
-                    "internal_code": row['internal code']
-                }
-                records.append((text, payload))
-            if not records:
-                continue
-            # Batch embed and upsert
-            texts, payloads = zip(*records)
-            vectors = self.embedder.encode(list(texts))
-            points = []
-            for i, vec in enumerate(vectors):
-                point_id = None  # Let Qdrant assign an ID, or use a custom ID
-                points.append(PointStruct(id=point_id, vector=vec.tolist(), payload=payloads[i]))
-            # Upsert points into Qdrant
-            self.client.upsert(collection_name=self.collection, points=points, wait=True)
+    def prepare_chunk(self, chunk: pd.DataFrame):
+        """Cleans a whole CSV chunk column-wise, returns (point ids, texts, payloads) for the usable rows."""
+        chunk = chunk.dropna(subset=['external code', 'description', 'internal code'])  # drop incomplete rows
+        ext = self.pre.clean_series(chunk['external code'])
+        desc = self.pre.clean_series(chunk['description'])
+        keep = (ext != "") & (desc != "")
+        chunk, ext, desc = chunk[keep], ext[keep], desc[keep]
+        internal = chunk['internal code']
+        ids = content_ids(chunk['external code'], chunk['description'], internal)
+        texts = (ext + " " + desc).tolist()
+        payloads = [
+            {"external_code": e, "description": d, "internal_code": i}
+            for e, d, i in zip(ext.tolist(), desc.tolist(), internal.tolist())
+        ]
+        return ids, texts, payloads
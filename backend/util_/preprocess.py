@@ -1,10 +1,12 @@
 import re
 import unicodedata
 
+import pandas as pd
+
 class DataPreprocessor:
     def __init__(self):
         # Map German-specific chars to ASCII
-        self.trans = str.maketrans("äöüÄÖÜß", "aeoeueAeOeUess")
+        self.trans = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "Ä": "Ae", "Ö": "Oe", "Ü": "Ue", "ß": "ss"})
 
     def clean_text(self, text: str) -> str:
         if pd.isna(text):
@@ -13,4 +15,11 @@ class DataPreprocessor:
         text = unicodedata.normalize("NFKD", text)             # normalize accents
         text = re.sub(r"[^A-Za-z0-9 ]+", " ", text)           # remove punctuation
         text = re.sub(r"\s+", " ", text).strip().lower()      # collapse whitespace
-        return text
\ No newline at end of file
+        return text
+
+    def clean_series(self, texts: pd.Series) -> pd.Series:
+        """Column-wise clean_text for a whole CSV chunk."""
+        texts = texts.fillna("").astype(str)
+        texts = texts.str.translate(self.trans).str.normalize("NFKD")
+        texts = texts.str.replace(r"[^A-Za-z0-9 ]+", " ", regex=True)
+        return texts.str.replace(r"\s+", " ", regex=True).str.strip().str.lower()
@@ -3,6 +3,55 @@ import { FaSearch, FaCode, FaPaintBrush, FaFileAlt, FaLink, FaPhone, FaArrowDown
 import './App.css'
 import Axios from 'axios'
 
+// Voice chat streams 16-bit mono PCM both ways: microphone audio at CAPTURE_SAMPLE_RATE,
+// synthesized replies at the TTS service's 24 kHz
+const CAPTURE_SAMPLE_RATE = 16000
+const TTS_SAMPLE_RATE = 24000
+
+// Converts the microphone's float samples to 16-bit PCM, posted about every 20 ms
+const PCM_CAPTURE_WORKLET = `
+class PCMCapture extends AudioWorkletProcessor {
+  constructor() {
+    super()
+    this.chunks = []
+    this.length = 0
+  }
+
+  process(inputs) {
+    const input = inputs[0][0]
+    if (input) {
+      const pcm = new Int16Array(input.length)
+      for (let i = 0; i < input.length; i++) {
+        const s = Math.max(-1, Math.min(1, input[i]))
+        pcm[i] = s < 0 ? s * 0x8000 : s * 0x7fff
+      }
+      this.chunks.push(pcm)
+      this.length += pcm.length
+      if (this.length >= sampleRate / 50) {
+        const out = new Int16Array(this.length)
+        let offset = 0
+        for (const chunk of this.chunks) {
+          out.set(chunk, offset)
+          offset += chunk.length
+        }
+        this.port.postMessage(out.buffer, [out.buffer])
+        this.chunks = []
+        this.length = 0
+      }
+    }
+    return true
+  }
+}
+registerProcessor('pcm-capture', PCMCapture)
+`
+
+// Each page load is its own conversation; the server keeps its memory under this ID
+const newSessionId = () => {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID()
+  // randomUUID needs a secure context, getRandomValues doesn't
+  return Array.from(window.crypto.getRandomValues(new Uint8Array(16)), b => b.toString(16).padStart(2, '0')).join('')
+}
+
 function App() {
   const [question, setQuestion] = useState('')
   const [answer, setAnswer] = useState([
@@ -10,16 +59,19 @@ function App() {
   ]);
   const [url, setUrl] = useState('')
   const [activeMode, setActiveMode] = useState('chat')
+  const [sessionId] = useState(newSessionId)
   
   // Voice chat state
   const [isRecording, setIsRecording] = useState(false)
   const [isProcessing, setIsProcessing] = useState(false)
   const [transcript, setTranscript] = useState('')
   const [isPlaying, setIsPlaying] = useState(false)
-  const mediaRecorderRef = useRef(null)
   const websocketRef = useRef(null)
-  const audioChunksRef = useRef([])
+  const socketReadyRef = useRef(false)
+  const captureRef = useRef(null)
   const audioContextRef = useRef(null)
+  const playbackEndRef = useRef(0)
+  const playingSourcesRef = useRef(new Set())
   const [loading, setLoading] = useState(false);
 
 
@@ -62,8 +114,9 @@ function App() {
       }
       
       // Stop recording if active
-      if (mediaRecorderRef.current && isRecording) {
-        mediaRecorderRef.current.stop()
+      if (captureRef.current) {
+        captureRef.current.stream.getTracks().forEach(track => track.stop())
+        captureRef.current.context.close()
       }
       
       // Close audio context
@@ -161,81 +214,45 @@ function App() {
     setUrl('');
   };
 
-  // Initialize WebSocket connection
-  const initializeWebSocket = () => {
+  // Open the voice socket; audio starts flowing once the server reports it's ready
+  const initializeWebSocket = (sampleRate) => {
     // Close any existing connection
     if (websocketRef.current) {
       websocketRef.current.close()
     }
 
-    // Create new WebSocket connection
-    const wsUrl = `ws://${API_BASE_URL.replace('http://', '')}:8000/voice-chat`
-    websocketRef.current = new WebSocket(wsUrl)
+    const wsUrl = `ws://${API_BASE_URL.replace('http://', '')}:8000/voice-chat?sample_rate=${sampleRate}&session_id=${sessionId}`
+    const socket = new WebSocket(wsUrl)
+    socket.binaryType = 'arraybuffer'
+    websocketRef.current = socket
 
-    // Set up event handlers
-    websocketRef.current.onopen = () => {
+    socket.onopen = () => {
       console.log('WebSocket connection established')
     }
 
-    websocketRef.current.onmessage = async (event) => {
+    socket.onmessage = (event) => {
+      if (websocketRef.current !== socket) return
       try {
-        // Handle text messages (JSON)
-        if (typeof event.data === 'string') {
-          const data = JSON.parse(event.data)
-          
-          if (data.status === 'ready') {
-            // Server is ready to receive audio
-            if (audioChunksRef.current.length > 0) {
-              const audioBlob = new Blob(audioChunksRef.current, { type: 'audio/webm' })
-              websocketRef.current.send(await audioBlob.arrayBuffer())
-              setIsProcessing(true)
-            }
-          } 
-          else if (data.type === 'transcription') {
-            // Update transcript and add user message
-            setTranscript(data.text)
-            const newMessages = [
-              ...answer,
-              { role: 'user', content: data.text }
-            ]
-            setAnswer(newMessages)
-            setIsProcessing(true)
-          } 
-          else if (data.type === 'response') {
-            // Add assistant response message
-            const newMessages = [
-              ...answer,
-              { role: 'user', content: transcript },
-              { role: 'assistant', content: data.text }
-            ]
-            setAnswer(newMessages)
-          }
-        } 
-        // Handle binary messages (audio)
-        else if (event.data instanceof Blob) {
-          setIsPlaying(true)
-          
-          // Play audio response
-          if (!audioContextRef.current) {
-            audioContextRef.current = new (window.AudioContext || window.webkitAudioContext)()
-          }
-          
-          const arrayBuffer = await event.data.arrayBuffer()
-          const audioBuffer = await audioContextRef.current.decodeAudioData(arrayBuffer)
-          
-          const source = audioContextRef.current.createBufferSource()
-          source.buffer = audioBuffer
-          source.connect(audioContextRef.current.destination)
-          
-          source.onended = () => {
-            setIsPlaying(false)
-            setIsProcessing(false)
-            
-            // Tell server we're done playing audio
-            websocketRef.current.send(JSON.stringify({ status: 'complete' }))
-          }
-          
-          source.start(0)
+        // Binary messages are TTS audio
+        if (event.data instanceof ArrayBuffer) {
+          playPcm(event.data)
+          return
+        }
+        const data = JSON.parse(event.data)
+        if (data.status === 'ready') {
+          // Server is ready: start streaming microphone audio
+          socketReadyRef.current = true
+        }
+        else if (data.type === 'transcription') {
+          // A new turn: drop what's left of the previous reply
+          stopPlayback()
+          setTranscript(data.text)
+          setAnswer(prev => [...prev, { role: 'user', content: data.text }])
+          setIsProcessing(true)
+        }
+        else if (data.type === 'response') {
+          setAnswer(prev => [...prev, { role: 'assistant', content: data.text }])
+          setIsProcessing(false)
         }
       } catch (error) {
         console.error('Error processing message:', error)
@@ -243,67 +260,106 @@ function App() {
       }
     }
 
-    websocketRef.current.onerror = (error) => {
+    socket.onerror = (error) => {
       console.error('WebSocket error:', error)
-      setIsRecording(false)
-      setIsProcessing(false)
     }
 
-    websocketRef.current.onclose = () => {
+    socket.onclose = () => {
       console.log('WebSocket connection closed')
-      setIsRecording(false)
+      // A socket replaced by a newer call mustn't stop that call's microphone
+      if (websocketRef.current !== socket) return
+      socketReadyRef.current = false
+      stopCapture()
       setIsProcessing(false)
     }
   }
 
-  // Start recording audio
+  // Queue a chunk of 16-bit mono PCM from the server right after the previous one
+  const playPcm = (buffer) => {
+    if (!audioContextRef.current) {
+      audioContextRef.current = new (window.AudioContext || window.webkitAudioContext)()
+    }
+    const context = audioContextRef.current
+    const pcm = new Int16Array(buffer)
+    if (pcm.length === 0) return
+    const audioBuffer = context.createBuffer(1, pcm.length, TTS_SAMPLE_RATE)
+    const channel = audioBuffer.getChannelData(0)
+    for (let i = 0; i < pcm.length; i++) {
+      channel[i] = pcm[i] / 0x8000
+    }
+    const source = context.createBufferSource()
+    source.buffer = audioBuffer
+    source.connect(context.destination)
+    const startAt = Math.max(context.currentTime, playbackEndRef.current)
+    source.start(startAt)
+    playbackEndRef.current = startAt + audioBuffer.duration
+    playingSourcesRef.current.add(source)
+    setIsPlaying(true)
+    source.onended = () => {
+      playingSourcesRef.current.delete(source)
+      if (playingSourcesRef.current.size === 0) {
+        setIsPlaying(false)
+      }
+    }
+  }
+
+  const stopPlayback = () => {
+    playingSourcesRef.current.forEach(source => source.stop())
+    playingSourcesRef.current.clear()
+    playbackEndRef.current = 0
+    setIsPlaying(false)
+  }
+
+  const stopCapture = () => {
+    const capture = captureRef.current
+    captureRef.current = null
+    if (capture) {
+      capture.node.port.onmessage = null
+      capture.node.disconnect()
+      capture.stream.getTracks().forEach(track => track.stop())
+      capture.context.close()
+    }
+    setIsRecording(false)
+  }
+
+  // Start a voice call: stream microphone PCM until stopped, the server detects turns
   const startRecording = async () => {
     try {
-      // Initialize WebSocket
-      initializeWebSocket()
-      
-      // Reset state
-      audioChunksRef.current = []
       setTranscript('')
-      setIsRecording(true)
-      
-      // Request microphone access
-      const stream = await navigator.mediaDevices.getUserMedia({ audio: true })
-      
-      // Create and configure MediaRecorder
-      mediaRecorderRef.current = new MediaRecorder(stream)
-      
-      mediaRecorderRef.current.ondataavailable = (event) => {
-        if (event.data.size > 0) {
-          audioChunksRef.current.push(event.data)
+      socketReadyRef.current = false
+      const stream = await navigator.mediaDevices.getUserMedia({
+        audio: { channelCount: 1, echoCancellation: true, noiseSuppression: true }
+      })
+      // The server expects 16 kHz; browsers that ignore the request report their own rate
+      const context = new (window.AudioContext || window.webkitAudioContext)({ sampleRate: CAPTURE_SAMPLE_RATE })
+      const moduleUrl = URL.createObjectURL(new Blob([PCM_CAPTURE_WORKLET], { type: 'application/javascript' }))
+      await context.audioWorklet.addModule(moduleUrl)
+      URL.revokeObjectURL(moduleUrl)
+      const node = new AudioWorkletNode(context, 'pcm-capture')
+      node.port.onmessage = (event) => {
+        const socket = websocketRef.current
+        if (socketReadyRef.current && socket && socket.readyState === WebSocket.OPEN) {
+          socket.send(event.data)
         }
       }
-      
-      mediaRecorderRef.current.onstop = () => {
-        // Stop all tracks in the stream
-        stream.getTracks().forEach(track => track.stop())
-        
-        // If WebSocket is ready, send the audio data
-        if (websocketRef.current && websocketRef.current.readyState === WebSocket.OPEN) {
-          const newMessage = { role: 'system', content: 'Processing audio...' }
-          setAnswer(prev => [...prev, newMessage])
-        }
-      }
-      
-      // Start recording
-      mediaRecorderRef.current.start(100) // Collect data in 100ms chunks
+      context.createMediaStreamSource(stream).connect(node)
+      captureRef.current = { context, stream, node }
+
+      initializeWebSocket(context.sampleRate)
+      setIsRecording(true)
     } catch (error) {
       console.error('Error starting recording:', error)
-      setIsRecording(false)
+      stopCapture()
     }
   }
 
-  // Stop recording audio
+  // Stop the call: end the turn in progress, the reply still arrives on the open socket
   const stopRecording = () => {
-    if (mediaRecorderRef.current && isRecording) {
-      mediaRecorderRef.current.stop()
-      setIsRecording(false)
+    const socket = websocketRef.current
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify({ status: 'end_of_turn' }))
     }
+    stopCapture()
   }
 
   const handleCall = () => {
@@ -320,7 +376,7 @@ function App() {
 
     try {
       
-        const response = await fetch(`${API_BASE_URL}:8000/ask?question=${encodeURIComponent(question)}`, {
+        const response = await fetch(`${API_BASE_URL}:8000/ask?question=${encodeURIComponent(question)}&session_id=${sessionId}`, {
         method: 'GET',
         headers: {
           'Content-Type': 'application/json',
@@ -410,7 +466,7 @@ function App() {
               onClick={handleCall}
               className={`call-button ${isRecording ? 'recording' : ''} ${isProcessing ? 'processing' : ''}`}
               title={isRecording ? "Stop recording" : "Start voice recording"}
-              disabled={isProcessing || isPlaying}
+              disabled={!isRecording && (isProcessing || isPlaying)}
             >
               {isRecording ? <FaStop /> : <FaMicrophone />}
             </button>